@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pygame
+
+from format import Decoder, Encoder, Quality
+from header import read_header
+from mapped_file import MappedFile
+from pygame_utils import get_surface_rgb
+
+DEBUG = False
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tga"}
+DUM_EXTENSION = ".dum"
+# Next to every output, the fingerprint of what it was made from is kept, to tell whether it's up to date
+FINGERPRINT_EXTENSION = ".src"
+DEFAULT_FRAME_RATE = 25
+# How many jobs may be waiting for a worker at a time, per worker
+JOBS_PER_WORKER = 2
+
+# Such as frame_%05d.png
+SEQUENCE_PATTERN = re.compile(r"%0?(\d*)d")
+# Such as frame_00001.png, for grouping numbered images into sequences
+NUMBERED_IMAGE = re.compile(r"^(.*?)(\d+)(\.\w+)$")
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+@dataclass
+class Job:
+    # "image", "sequence" or "dum"
+    kind: str
+    inputs: List[str]
+    output: str
+
+
+@dataclass
+class JobResult:
+    job: Job
+    frames: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def find_jobs(sources: List[str], output_dir: str, group_sequences: bool = False) -> List[Job]:
+    """Turns directories, globs, files and sequence patterns such as frame_%05d.png into jobs. With
+    group_sequences, numbered images that only differ in their number also become sequences."""
+    jobs = []
+    images = []
+    for source in sources:
+        if SEQUENCE_PATTERN.search(os.path.basename(source)):
+            inputs = _sequence_files(source)
+            if not inputs:
+                raise ValueError(f"No images match {source}")
+            jobs.append(Job("sequence", inputs, _output_path(output_dir, _sequence_name(source))))
+            continue
+        for path in _expand(source):
+            extension = os.path.splitext(path)[1].lower()
+            if extension == DUM_EXTENSION:
+                jobs.append(Job("dum", [path], _output_path(output_dir, path)))
+            elif extension in IMAGE_EXTENSIONS:
+                images.append(path)
+            else:
+                debug(f"Ignoring {path}")
+
+    if group_sequences:
+        groups: Dict[Tuple[str, str, str], List[Tuple[int, str]]] = {}
+        for path in images:
+            match = NUMBERED_IMAGE.match(path)
+            if match:
+                groups.setdefault((match[1], match[3], str(len(match[2]))), []).append((int(match[2]), path))
+        for (prefix, extension, _), members in groups.items():
+            if len(members) > 1:
+                inputs = [path for _, path in sorted(members)]
+                grouped = set(inputs)
+                images = [path for path in images if path not in grouped]
+                jobs.append(Job("sequence", inputs, _output_path(output_dir, prefix.rstrip("_-. ") + extension)))
+    jobs += [Job("image", [path], _output_path(output_dir, path)) for path in images]
+
+    outputs = [job.output for job in jobs]
+    for job in jobs:
+        if os.path.abspath(job.output) in map(os.path.abspath, job.inputs):
+            raise ValueError(f"{job.output} would overwrite its own input. Use another output directory.")
+        if outputs.count(job.output) > 1:
+            raise ValueError(f"More than one input would be written to {job.output}")
+    return jobs
+
+
+def _expand(source: str) -> Iterator[str]:
+    if os.path.isdir(source):
+        for directory, _, names in sorted(os.walk(source)):
+            for name in sorted(names):
+                yield os.path.join(directory, name)
+    elif glob.has_magic(source):
+        yield from sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+    else:
+        yield source
+
+
+def _sequence_files(pattern: str) -> List[str]:
+    # frame_%05d.png matches frame_00000.png, frame_00001.png, ... in numerical order
+    directory, name = os.path.split(pattern)
+    match = SEQUENCE_PATTERN.search(name)
+    width = match[1]
+    digits = rf"\d{{{width}}}" if width else r"\d+"
+    regex = re.compile(re.escape(name[:match.start()]) + f"({digits})" + re.escape(name[match.end():]) + "$")
+    numbered = []
+    for entry in os.listdir(directory or "."):
+        entry_match = regex.match(entry)
+        if entry_match:
+            numbered.append((int(entry_match[1]), os.path.join(directory, entry)))
+    return [path for _, path in sorted(numbered)]
+
+
+def _sequence_name(pattern: str) -> str:
+    name = os.path.basename(pattern)
+    match = SEQUENCE_PATTERN.search(name)
+    return (name[:match.start()].rstrip("_-. ") or "sequence") + name[match.end():]
+
+
+def _output_path(output_dir: str, input_path: str) -> str:
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(input_path))[0] + DUM_EXTENSION)
+
+
+def fingerprint(job: Job, settings: dict, use_hash: bool) -> str:
+    """Identifies the inputs and the settings of the job. By default, inputs are identified by their size and
+    modification time, and with use_hash by their contents."""
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for path in job.inputs:
+        digest.update(os.path.abspath(path).encode())
+        if use_hash:
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        else:
+            stat = os.stat(path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def is_up_to_date(job: Job, job_fingerprint: str) -> bool:
+    try:
+        with open(job.output + FINGERPRINT_EXTENSION) as file:
+            return file.read() == job_fingerprint and os.path.exists(job.output)
+    except OSError:
+        return False
+
+
+def run_job(job: Job, quality: Quality, frame_rate: int, job_fingerprint: str) -> JobResult:
+    """Converts the inputs of the job into one DUM file. Frames are converted one at a time, so that memory use
+    doesn't grow with the number of frames. The output is written to a temporary file first, so that an
+    interrupted job never leaves behind an output that looks complete."""
+    start = perf_counter()
+    result = JobResult(job, input_bytes=sum(os.path.getsize(path) for path in job.inputs))
+    temporary_path = job.output + ".tmp"
+    try:
+        with open(temporary_path, "wb") as outfile:
+            with Encoder(outfile, quality) as encoder:
+                if job.kind == "dum":
+                    _reencode(job.inputs[0], encoder)
+                else:
+                    _encode_images(job.inputs, encoder, frame_rate)
+            result.frames = encoder.frames_written
+        os.replace(temporary_path, job.output)
+        with open(job.output + FINGERPRINT_EXTENSION, "w") as file:
+            file.write(job_fingerprint)
+        result.output_bytes = os.path.getsize(job.output)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    result.seconds = perf_counter() - start
+    return result
+
+
+def _encode_images(paths: List[str], encoder: Encoder, frame_rate: int):
+    resolution = None
+    for path in paths:
+        surface = pygame.image.load(path)
+        if resolution is None:
+            resolution = surface.get_size()
+            encoder.write_header(frame_rate, resolution, (1, 1), len(paths))
+        elif surface.get_size() != resolution:
+            raise ValueError(f"{path} is {surface.get_size()}, but the sequence is {resolution}")
+        encoder.write_frame(get_surface_rgb(surface))
+
+
+def _reencode(path: str, encoder: Encoder):
+    with MappedFile(path) as file:
+        info = read_header(file)
+        encoder.write_header(info.frame_rate, (info.width, info.height), (info.hor_scaling, info.ver_scaling),
+                             info.num_frames)
+        for frame in Decoder(file, info).frames():
+            # Frames are decoded as BGR
+            encoder.write_frame(_bgr_to_rgb(frame))
+
+
+def _bgr_to_rgb(frame: bytes) -> np.ndarray:
+    return np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3)[:, ::-1]
+
+
+def run_jobs(jobs: List[Job], quality: Quality, frame_rate: int, workers: Optional[int], use_hash: bool,
+    force: bool) -> List[JobResult]:
+    settings = {"quality": quality.name, "frame_rate": frame_rate}
+    pending = []
+    skipped = 0
+    for job in jobs:
+        job_fingerprint = fingerprint(job, settings, use_hash)
+        if not force and is_up_to_date(job, job_fingerprint):
+            debug(f"{job.output} is up to date")
+            skipped += 1
+        else:
+            pending.append((job, job_fingerprint))
+    print(f"{len(jobs)} jobs, of which {skipped} are up to date", file=sys.stderr)
+
+    results = []
+    start = perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        # Jobs are submitted as workers become free, instead of all at once
+        max_queued = JOBS_PER_WORKER * workers
+        queue = iter(pending)
+        in_flight = set()
+
+        def submit():
+            for job, job_fingerprint in queue:
+                in_flight.add(executor.submit(run_job, job, quality, frame_rate, job_fingerprint))
+                if len(in_flight) >= max_queued:
+                    return
+
+        submit()
+        while in_flight:
+            future = next(as_completed(in_flight))
+            in_flight.remove(future)
+            result = future.result()
+            results.append(result)
+            _report_progress(result, len(results), len(pending), perf_counter() - start, results)
+            submit()
+    return results
+
+
+def _report_progress(result: JobResult, done: int, total: int, seconds: float, results: List[JobResult]):
+    if result.error:
+        status = f"FAILED: {result.error}"
+    else:
+        status = f"{result.frames} frames, {result.output_bytes / 1e6:.1f} MB in {result.seconds:.2f}s"
+    frames = sum(r.frames for r in results)
+    print(f"[{done}/{total}] {result.job.output}: {status} ({frames / seconds:.1f} frames/s overall)",
+          file=sys.stderr)
+
+
+def summarize(results: List[JobResult], seconds: float) -> str:
+    failed = [r for r in results if r.error]
+    frames = sum(r.frames for r in results)
+    input_bytes = sum(r.input_bytes for r in results if not r.error)
+    output_bytes = sum(r.output_bytes for r in results)
+    seconds = max(seconds, 1e-9)
+    return (f"Converted {len(results) - len(failed)} files ({len(failed)} failed): {frames} frames, "
+            f"{input_bytes / 1e6:.1f} MB in, {output_bytes / 1e6:.1f} MB out, in {seconds:.2f}s "
+            f"({frames / seconds:.1f} frames/s, {input_bytes / 1e6 / seconds:.1f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert images, image sequences and DUM files to DUM, in parallel")
+    parser.add_argument("sources", nargs="+",
+                        help="files, directories, globs, or image sequences such as frame_%%05d.png")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--quality", choices=[q.name for q in Quality], default=Quality.LOSSLESS.name)
+    parser.add_argument("--frame-rate", type=int, default=DEFAULT_FRAME_RATE, help="for image sequences")
+    parser.add_argument("--workers", type=int, help="how many processes convert files (default: one per CPU)")
+    parser.add_argument("--group-sequences", action="store_true",
+                        help="turn numbered images, such as frame_001.png and frame_002.png, into sequences")
+    parser.add_argument("--hash", action="store_true",
+                        help="tell whether outputs are up to date by the contents of the inputs, instead of by "
+                             "their size and modification time")
+    parser.add_argument("--force", action="store_true", help="also convert files whose outputs are up to date")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = perf_counter()
+    try:
+        jobs = find_jobs(args.sources, args.output_dir, args.group_sequences)
+    except ValueError as e:
+        parser.error(str(e))
+    results = run_jobs(jobs, Quality[args.quality], args.frame_rate, args.workers, args.hash, args.force)
+    print(summarize(results, perf_counter() - start))
+    if any(result.error for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
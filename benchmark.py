@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from io import BytesIO
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from codec.colormapped import index_colors, write_indexed_frame
+from codec.quantized import write_8bit_quantized_frame, write_16bit_quantized_frame
+from codec.raw import write_raw_frame
+from common import FrameType
+from format import Decoder, Encoder, Quality, write_frame
+from frame_index import build_frame_index
+from header import DumInfo, read_header
+from parse import scan_file
+
+RESOLUTIONS = [(320, 180), (1280, 720), (1920, 1080)]
+QUICK_RESOLUTIONS = [(64, 32)]
+CONTENT_TYPES = ["flat", "gradient", "noise", "screen"]
+
+# Every measurement is repeated until it has taken at least this long, and the fastest run is kept
+MIN_MEASURE_TIME = 0.2
+MIN_REPEATS = 3
+
+# Results whose throughput has dropped by more than this share are regressions
+DEFAULT_THRESHOLD = 0.2
+
+# Frames in the sequences used for Encoder/Decoder, seek and scan benchmarks
+NUM_SEQUENCE_FRAMES = 24
+
+Result = Dict[str, float]
+
+
+def create_frame(content: str, resolution: Tuple[int, int], frame_number: int = 0) -> np.ndarray:
+    """Returns an (H, W, 3) image of the given content type."""
+    w, h = resolution
+    rng = np.random.default_rng(frame_number)
+    if content == "flat":
+        return np.full((h, w, 3), (40, 90, 160), dtype=np.uint8)
+    if content == "gradient":
+        x = np.linspace(0, 255, w, dtype=np.uint16)[None, :]
+        y = np.linspace(0, 255, h, dtype=np.uint16)[:, None]
+        return np.stack([np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w)), (x + y + frame_number) // 2],
+                        axis=2).astype(np.uint8)
+    if content == "noise":
+        return rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    if content == "screen":
+        # A few flat colored windows, and a small square that moves from frame to frame
+        image = np.full((h, w, 3), (230, 230, 230), dtype=np.uint8)
+        image[: max(h // 12, 1)] = (50, 60, 80)
+        image[h // 6: h // 2, w // 10: w // 2] = (255, 255, 255)
+        image[h // 5: h // 2: 4, w // 8: w // 3] = (20, 20, 20)
+        size = max(min(w, h) // 8, 1)
+        x = (frame_number * 4) % max(w - size, 1)
+        image[h - size * 2: h - size, x: x + size] = (200, 40, 40)
+        return image
+    raise ValueError(f"Unknown content type: {content}")
+
+
+def measure(operation: Callable[[], object]) -> float:
+    """Returns the fastest time, in seconds, of running the operation."""
+    times = []
+    start = perf_counter()
+    while len(times) < MIN_REPEATS or perf_counter() - start < MIN_MEASURE_TIME:
+        before = perf_counter()
+        operation()
+        times.append(perf_counter() - before)
+    return min(times)
+
+
+def throughput(seconds: float, num_frames: int, resolution: Tuple[int, int], **extra) -> Result:
+    frame_bytes = resolution[0] * resolution[1] * 3
+    return {
+        "seconds": seconds,
+        "fps": num_frames / seconds,
+        "mb_per_s": num_frames * frame_bytes / seconds / 1e6,
+        **extra,
+    }
+
+
+def frame_writers(pixels: np.ndarray) -> Dict[FrameType, Callable[[BytesIO], None]]:
+    """The frame types that can store the pixels, and how to write them."""
+    writers = {
+        FrameType.RAW: lambda file: write_raw_frame(file, pixels),
+        FrameType.QUANTIZED_TO_16_BIT: lambda file: write_16bit_quantized_frame(file, pixels),
+        FrameType.QUANTIZED_TO_8_BIT: lambda file: write_8bit_quantized_frame(file, pixels),
+    }
+    indexed_colors = index_colors(pixels)
+    if indexed_colors is not None:
+        writers[FrameType.COLOR_MAPPED] = lambda file: write_indexed_frame(file, *indexed_colors)
+    return writers
+
+
+def decode_once(data: bytes, resolution: Tuple[int, int]) -> bytes:
+    file = BytesIO(data)
+    return Decoder(file, DumInfo(1, resolution[0], resolution[1], 1, 1, 1, 0, len(data))).read_frame()
+
+
+def encode_sequence(content: str, resolution: Tuple[int, int], quality: Quality) -> bytes:
+    file = BytesIO()
+    encoder = Encoder(file, quality)
+    encoder.write_header(25, resolution, (1, 1), NUM_SEQUENCE_FRAMES)
+    for i in range(NUM_SEQUENCE_FRAMES):
+        # Every other frame is repeated, so that REPEATED frames are part of the sequence
+        encoder.write_frame(create_frame(content, resolution, i // 2))
+    return file.getvalue()
+
+
+def decode_sequence(data: bytes):
+    file = BytesIO(data)
+    decoder = Decoder(file, read_header(file))
+    for _ in range(decoder.info.num_frames):
+        decoder.read_frame()
+
+
+def benchmark_frame_types(content: str, resolution: Tuple[int, int]) -> Dict[str, Result]:
+    results = {}
+    pixels = create_frame(content, resolution).reshape(-1, 3)
+    for frame_type, write in frame_writers(pixels).items():
+        file = BytesIO()
+        write(file)
+        data = file.getvalue()
+        name = f"{frame_type.name}/{content}/{resolution[0]}x{resolution[1]}"
+        results[f"encode/{name}"] = throughput(measure(lambda: write(BytesIO())), 1, resolution, bytes=len(data))
+        results[f"decode/{name}"] = throughput(measure(lambda: decode_once(data, resolution)), 1, resolution)
+    return results
+
+
+def benchmark_qualities(content: str, resolution: Tuple[int, int]) -> Dict[str, Result]:
+    results = {}
+    for quality in Quality:
+        data = encode_sequence(content, resolution, quality)
+        name = f"{quality.name}/{content}/{resolution[0]}x{resolution[1]}"
+        frame = create_frame(content, resolution)
+        results[f"write_frame/{name}"] = throughput(measure(lambda: write_frame(BytesIO(), frame, quality)), 1,
+                                                    resolution)
+        results[f"encode_sequence/{name}"] = throughput(measure(lambda: encode_sequence(content, resolution, quality)),
+                                                        NUM_SEQUENCE_FRAMES, resolution, bytes=len(data))
+        results[f"decode_sequence/{name}"] = throughput(measure(lambda: decode_sequence(data)),
+                                                        NUM_SEQUENCE_FRAMES, resolution)
+    return results
+
+
+def benchmark_seek_and_scan(resolution: Tuple[int, int]) -> Dict[str, Result]:
+    data = encode_sequence("screen", resolution, Quality.MEDIUM)
+    file = BytesIO(data)
+    info = read_header(file)
+    name = f"screen/{resolution[0]}x{resolution[1]}"
+
+    def scan():
+        build_frame_index(file, info)
+
+    decoder = Decoder(file, info)
+    targets = np.random.default_rng(0).integers(0, info.num_frames, 10)
+
+    def seek():
+        for target in targets:
+            decoder.get_frame(int(target))
+
+    # parse.py memory-maps the file it checks, so it's scanned from disk
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sequence.dum")
+        with open(path, "wb") as outfile:
+            outfile.write(data)
+        parse_seconds = measure(lambda: scan_file(path))
+
+    seek_seconds = measure(seek) / len(targets)
+    return {
+        f"scan/{name}": throughput(measure(scan), info.num_frames, resolution),
+        f"parse/{name}": throughput(parse_seconds, info.num_frames, resolution),
+        f"seek/{name}": {"seconds": seek_seconds, "fps": 1 / seek_seconds},
+    }
+
+
+def run_benchmarks(resolutions: List[Tuple[int, int]], content_types: List[str]) -> Dict[str, Result]:
+    results = {}
+    for resolution in resolutions:
+        for content in content_types:
+            print(f"Benchmarking {content} at {resolution[0]}x{resolution[1]}...", file=sys.stderr)
+            results.update(benchmark_frame_types(content, resolution))
+            results.update(benchmark_qualities(content, resolution))
+        results.update(benchmark_seek_and_scan(resolution))
+    return results
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result], threshold: float = DEFAULT_THRESHOLD) \
+        -> List[str]:
+    """Returns a description of every benchmark whose frame rate has dropped by more than threshold."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]["fps"]
+        after = result["fps"]
+        if after < before * (1 - threshold):
+            regressions.append(f"{name}: {before:.1f} -> {after:.1f} fps ({(after / before - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark encoding, decoding, seeking and scanning DUM files")
+    parser.add_argument("--output", help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="a JSON file with earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="the drop in frame rate, as a share, that counts as a regression")
+    parser.add_argument("--quick", action="store_true", help="only use tiny frames, to check that everything runs")
+    parser.add_argument("--content", nargs="+", choices=CONTENT_TYPES, default=CONTENT_TYPES)
+    args = parser.parse_args()
+
+    resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "results": run_benchmarks(resolutions, args.content),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(report["results"], baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
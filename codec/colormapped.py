@@ -1,40 +1,110 @@
-from typing import BinaryIO, List
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
 
 from common import FrameType
-from io_utils import bytes_to_int, read_rgb, Color, uint8_to_bytes, uint32_to_bytes, write_rgb
+from io_utils import bytes_to_int, Color, Pixels, uint8_to_bytes, uint32_to_bytes, rgb_array, PIXELS_PER_CHUNK
+from stats import Stats, NULL_STATS
 
 DEBUG = False
 
+MAX_COLORS = 255
+
+# Frames with many colors are recognized from this many pixels, without looking at the whole frame
+COLOR_SAMPLE_SIZE = 4096
+
 
 def debug(text: str):
     if DEBUG:
         print(text)
 
 
-def write_color_mapped_frame(color_map: List[Color], file: BinaryIO, pixels: List[Color]):
+def index_colors(pixels: Pixels) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Returns the color map and the color index of every pixel, or None if there are too many colors. The frame
+    is looked at in chunks, so that no array is larger than the color indices."""
+    rgb = rgb_array(pixels)
+    if len(_distinct(_color_keys(rgb[:COLOR_SAMPLE_SIZE]))) > MAX_COLORS:
+        return None
+    color_keys = np.empty(0, dtype=np.uint32)
+    for start in range(0, len(rgb), PIXELS_PER_CHUNK):
+        color_keys = _distinct(np.concatenate((color_keys, _color_keys(rgb[start:start + PIXELS_PER_CHUNK]))))
+        if len(color_keys) > MAX_COLORS:
+            return None
+    color_indices = np.empty(len(rgb), dtype=np.uint8)
+    for start in range(0, len(rgb), PIXELS_PER_CHUNK):
+        color_indices[start:start + PIXELS_PER_CHUNK] = np.searchsorted(
+            color_keys, _color_keys(rgb[start:start + PIXELS_PER_CHUNK]))
+    color_map = np.stack([color_keys >> 16, (color_keys >> 8) & 0xFF, color_keys & 0xFF], axis=1).astype(np.uint8)
+    return color_map, color_indices
+
+
+def _distinct(keys: np.ndarray) -> np.ndarray:
+    # Sorted, without duplicates. np.unique is hash-based and slower for this since NumPy 2.
+    keys = np.sort(keys)
+    # The first of each run of equal keys. Also works for frames without pixels.
+    is_first = np.ones(len(keys), dtype=bool)
+    is_first[1:] = keys[1:] != keys[:-1]
+    return keys[is_first]
+
+
+def write_color_mapped_frame(color_map: List[Color], file: BinaryIO, pixels: Pixels):
+    color_map = rgb_array(color_map)
+    keys = _color_keys(rgb_array(pixels))
+    # Inverse lookup from color to index, by binary search among the sorted color map
+    map_keys = _color_keys(color_map)
+    order = np.argsort(map_keys)
+    sorted_map_keys = map_keys[order]
+    positions = np.searchsorted(sorted_map_keys, keys).clip(max=len(order) - 1)
+    if not np.array_equal(sorted_map_keys[positions], keys):
+        raise ValueError("Frame contains colors that are not in the color map!")
+    write_indexed_frame(file, color_map, order[positions].astype(np.uint8))
+
+
+def write_indexed_frame(file: BinaryIO, color_map: np.ndarray, color_indices: np.ndarray,
+    stats: Stats = NULL_STATS):
     debug("Writing color-mapped frame")
-    # Frame type
-    file.write(uint8_to_bytes(FrameType.COLOR_MAPPED.value))
-    # Frame size
-    file.write(uint32_to_bytes(1 + len(color_map) * 3 + len(pixels)))
-    file.write(uint8_to_bytes(len(color_map)))
-    for key_color in color_map:
-        write_rgb(file, key_color)
-    for i, pixel in enumerate(pixels):
-        file.write(uint8_to_bytes(color_map.index(pixel)))
-
-
-def read_color_mapped_frame(file: BinaryIO, frame_size: int) -> List[int]:
+    num_colors = len(color_map)
+    with stats.time("io"):
+        file.write(b"".join([
+            uint8_to_bytes(FrameType.COLOR_MAPPED.value),
+            # Frame size
+            uint32_to_bytes(1 + num_colors * 3 + len(color_indices)),
+            uint8_to_bytes(num_colors),
+            color_map.astype(np.uint8).tobytes(),
+            # Without copying the indices first
+            memoryview(np.ascontiguousarray(color_indices, dtype=np.uint8)),
+        ]))
+
+
+def _color_keys(rgb: np.ndarray) -> np.ndarray:
+    # Packs each color into a single integer so that colors can be compared and sorted. Built channel by channel,
+    # so that only the keys are allocated.
+    keys = rgb[:, 0].astype(np.uint32)
+    keys <<= 8
+    keys |= rgb[:, 1]
+    keys <<= 8
+    keys |= rgb[:, 2]
+    return keys
+
+
+def read_color_mapped_frame(file: BinaryIO, frame_size: int) -> bytes:
     debug("Reading color-mapped frame...")
-    num_colors = bytes_to_int(file.read(1))
+    bgr_colormap, color_indices = _read_color_indices(file, frame_size)
+    return bgr_colormap.take(color_indices, axis=0).tobytes()
+
 
-    def read_bgr():
-        rgb = read_rgb(file)
-        return rgb[2], rgb[1], rgb[0]
+def read_color_mapped_frame_decimated(file: BinaryIO, frame_size: int, resolution: Tuple[int, int],
+    factor: int) -> bytes:
+    debug("Reading decimated color-mapped frame...")
+    bgr_colormap, color_indices = _read_color_indices(file, frame_size)
+    # Only the sampled pixels are looked up
+    sampled_indices = color_indices.reshape(resolution[1], resolution[0])[::factor, ::factor]
+    return bgr_colormap.take(sampled_indices, axis=0).tobytes()
 
-    bgr_colormap = [read_bgr() for _ in range(num_colors)]
-    buf = []
-    color_indices = list(file.read(frame_size - 1 - num_colors * 3))
-    for color_index in color_indices:
-        buf += bgr_colormap[color_index]
-    return buf
+
+def _read_color_indices(file: BinaryIO, frame_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    num_colors = bytes_to_int(file.read(1))
+    # The color map is stored as RGB, but frames are decoded to BGR
+    bgr_colormap = np.frombuffer(file.read(num_colors * 3), dtype=np.uint8).reshape(num_colors, 3)[:, ::-1]
+    color_indices = np.frombuffer(file.read(frame_size - 1 - num_colors * 3), dtype=np.uint8)
+    return bgr_colormap, color_indices
@@ -0,0 +1,99 @@
+from io import BytesIO
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from codec.sampling import decimate, decimated_resolution
+from common import FrameType
+from io_utils import bytes_to_int, uint8_to_bytes, uint16_to_bytes, uint32_to_bytes
+
+DEBUG = False
+
+# Changes are detected per tile of TILE_SIZE x TILE_SIZE pixels
+TILE_SIZE = 16
+
+# A delta frame is only used if the changed rectangles cover at most this share of the frame
+MAX_CHANGED_AREA = 0.5
+
+# x, y, width, height
+Rect = Tuple[int, int, int, int]
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+def find_changed_rects(previous_image: np.ndarray, image: np.ndarray) -> Optional[List[Rect]]:
+    """Returns rectangles covering all pixels that differ between the (H, W, 3) images, or None if there are
+    so many changes that a full frame should be written instead."""
+    height, width = image.shape[:2]
+    changed_pixels = (previous_image != image).any(axis=2)
+    tile_rows = -(-height // TILE_SIZE)
+    tile_cols = -(-width // TILE_SIZE)
+    padded = np.zeros((tile_rows * TILE_SIZE, tile_cols * TILE_SIZE), dtype=bool)
+    padded[:height, :width] = changed_pixels
+    changed_tiles = padded.reshape(tile_rows, TILE_SIZE, tile_cols, TILE_SIZE).any(axis=(1, 3))
+
+    # Consecutive changed tiles on a row become one span, and identical spans on consecutive rows are merged
+    rects = []
+    open_spans = {}
+    for tile_y in range(tile_rows):
+        row = np.concatenate(([False], changed_tiles[tile_y], [False]))
+        edges = np.flatnonzero(row[1:] != row[:-1])
+        spans = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+        for span in list(open_spans):
+            if span not in spans:
+                rects.append((span, open_spans.pop(span), tile_y))
+        for span in spans:
+            open_spans.setdefault(span, tile_y)
+    rects += [(span, start_y, tile_rows) for span, start_y in open_spans.items()]
+
+    clipped_rects = []
+    for (start_x, end_x), start_y, end_y in rects:
+        x, y = start_x * TILE_SIZE, start_y * TILE_SIZE
+        clipped_rects.append((x, y, min(end_x * TILE_SIZE, width) - x, min(end_y * TILE_SIZE, height) - y))
+    changed_area = sum(w * h for _, _, w, h in clipped_rects)
+    if changed_area > MAX_CHANGED_AREA * width * height:
+        return None
+    return clipped_rects
+
+
+def write_delta_frame(file: BinaryIO, image: np.ndarray, rects: List[Rect],
+    write_patch: Callable[[BinaryIO, np.ndarray], None]):
+    debug(f"Writing delta frame with {len(rects)} rects")
+    payload = BytesIO()
+    payload.write(uint16_to_bytes(len(rects)))
+    for x, y, w, h in rects:
+        for n in (x, y, w, h):
+            payload.write(uint16_to_bytes(n))
+        # Each patch is stored as a complete frame of its own
+        write_patch(payload, image[y:y + h, x:x + w].reshape(-1, 3))
+    file.write(b"".join([uint8_to_bytes(FrameType.DELTA.value), uint32_to_bytes(payload.tell()), payload.getbuffer()]))
+
+
+def read_delta_frame(file: BinaryIO, previous_frame: bytes, resolution: Tuple[int, int],
+    read_patch: Callable[[BinaryIO], bytes]) -> bytes:
+    debug("Reading delta frame...")
+    image = np.frombuffer(previous_frame, dtype=np.uint8).reshape(resolution[1], resolution[0], 3).copy()
+    num_rects = bytes_to_int(file.read(2))
+    for _ in range(num_rects):
+        x, y, w, h = (bytes_to_int(file.read(2)) for _ in range(4))
+        image[y:y + h, x:x + w] = np.frombuffer(read_patch(file), dtype=np.uint8).reshape(h, w, 3)
+    return image.tobytes()
+
+
+def read_delta_frame_decimated(file: BinaryIO, previous_frame: bytes, resolution: Tuple[int, int], factor: int,
+    read_patch: Callable[[BinaryIO], bytes]) -> bytes:
+    """Like read_delta_frame, for frames where only every factor-th pixel of every factor-th row is kept."""
+    debug("Reading decimated delta frame...")
+    width, height = decimated_resolution(resolution, factor)
+    image = np.frombuffer(previous_frame, dtype=np.uint8).reshape(height, width, 3).copy()
+    num_rects = bytes_to_int(file.read(2))
+    for _ in range(num_rects):
+        x, y, w, h = (bytes_to_int(file.read(2)) for _ in range(4))
+        # Patches are small, so they are decoded in full and then sampled
+        sampled = decimate(read_patch(file), (w, h), factor, x, y)
+        top, left = -(-y // factor), -(-x // factor)
+        image[top:top + sampled.shape[0], left:left + sampled.shape[1]] = sampled
+    return image.tobytes()
@@ -1,11 +1,13 @@
-import struct
-from typing import Callable, List, BinaryIO
+from typing import Callable, BinaryIO, Iterator, Optional, Tuple
 
-from color_quantization import rgb_to_uint7, rgb_to_uint15, uint7_to_bgr, \
-    uint15_to_bgr
+import numpy as np
+
+from color_quantization import rgb_to_uint7_array, rgb_to_uint15_array, UINT7_TO_BGR_TABLE, UINT15_TO_BGR_TABLE
+from codec.sampling import sample_positions
 from common import FrameType
-from io_utils import Color
-from io_utils import uint8_to_bytes, uint32_to_bytes, uint16_to_bytes
+from io_utils import Pixels, rgb_array, PIXELS_PER_CHUNK
+from io_utils import uint8_to_bytes, uint32_to_bytes
+from stats import Stats, NULL_STATS
 
 DEBUG = False
 
@@ -15,73 +17,159 @@ def debug(text: str):
         print(text)
 
 
-def write_8bit_quantized_frame(file: BinaryIO, pixels: List[Color]):
+def write_8bit_quantized_frame(file: BinaryIO, pixels: Pixels, stats: Stats = NULL_STATS):
     debug("Writing 8-bit quantized frame")
-    _write_quantized_frame(file, pixels, quantize_color=rgb_to_uint7, max_run_length=127, bitsize=8,
-                           to_bytes=uint8_to_bytes, frame_type=FrameType.QUANTIZED_TO_8_BIT)
+    _write_quantized_frame(file, pixels, quantize_colors=rgb_to_uint7_array, max_run_length=127, dtype=np.uint8,
+                           frame_type=FrameType.QUANTIZED_TO_8_BIT, stats=stats)
 
 
-def write_16bit_quantized_frame(file: BinaryIO, pixels: List[Color]):
+def write_16bit_quantized_frame(file: BinaryIO, pixels: Pixels, stats: Stats = NULL_STATS):
     debug("Writing 16-bit quantized frame")
-    _write_quantized_frame(file, pixels, quantize_color=rgb_to_uint15, max_run_length=32_767, bitsize=16,
-                           to_bytes=uint16_to_bytes, frame_type=FrameType.QUANTIZED_TO_16_BIT)
-
-
-def _write_quantized_frame(file: BinaryIO, pixels: List[Color], quantize_color: Callable[[Color], int],
-    max_run_length: int,
-    bitsize: int, to_bytes: Callable[[int], bytes], frame_type: FrameType):
-    file.write(uint8_to_bytes(frame_type.value))
-    # Frame size is written at the end
-    frame_size_offset = file.tell()
-    file.write(uint32_to_bytes(0))
-    frame_content_offset = file.tell()
-    quantized_pixels = [quantize_color(p) for p in pixels]
-    run_length_pixel = None
-    accumulated_run_length = 0
-    for p in quantized_pixels:
-        if p != run_length_pixel or accumulated_run_length == max_run_length:
-            if accumulated_run_length:
-                debug(f"Writing accumulated run-length: {accumulated_run_length}, color {run_length_pixel}")
-                file.write(to_bytes((1 << (bitsize - 1)) + accumulated_run_length))
-            file.write(to_bytes(p))
-            run_length_pixel = p
-            accumulated_run_length = 0
-        else:
-            # Same pixel as last one => start counting
-            accumulated_run_length += 1
-    if accumulated_run_length:
-        debug(f"Writing last accumulated run-length: {accumulated_run_length}, color {run_length_pixel}")
-        file.write(to_bytes((1 << (bitsize - 1)) + accumulated_run_length))
-    frame_size = file.tell() - frame_content_offset
-    file.seek(frame_size_offset)
-    file.write(uint32_to_bytes(frame_size))
-    file.seek(0, 2)
-
-
-def read_16bit_quantized_frame(file: BinaryIO, frame_size: int):
+    _write_quantized_frame(file, pixels, quantize_colors=rgb_to_uint15_array, max_run_length=32_767, dtype=">u2",
+                           frame_type=FrameType.QUANTIZED_TO_16_BIT, stats=stats)
+
+
+def _write_quantized_frame(file: BinaryIO, pixels: Pixels, quantize_colors: Callable[[np.ndarray], np.ndarray],
+    max_run_length: int, dtype, frame_type: FrameType, stats: Stats):
+    rgb = rgb_array(pixels)
+    with stats.time("quantize"):
+        quantized_pixels = np.empty(len(rgb), dtype=quantize_colors(rgb[:0]).dtype)
+        for start in range(0, len(rgb), PIXELS_PER_CHUNK):
+            quantized_pixels[start:start + PIXELS_PER_CHUNK] = quantize_colors(rgb[start:start + PIXELS_PER_CHUNK])
+    with stats.time("rle"):
+        flag = 1 << (np.dtype(dtype).itemsize * 8 - 1)
+        # The frame header is filled in once the size of the payload is known
+        buf = bytearray(5)
+        for codes in _run_length_encode(quantized_pixels, max_run_length, flag, dtype):
+            buf += memoryview(codes.view(np.uint8))
+        buf[:5] = uint8_to_bytes(frame_type.value) + uint32_to_bytes(len(buf) - 5)
+    debug(f"Encoded {len(quantized_pixels)} pixels as {len(buf) - 5} bytes")
+    with stats.time("io"):
+        file.write(buf)
+
+
+def _run_length_encode(quantized_pixels: np.ndarray, max_run_length: int, flag: int, dtype) -> Iterator[np.ndarray]:
+    """Yields the codes for the pixels, where repeated colors are replaced by run-lengths. The pixels are encoded in
+    chunks, which end where a run does, so that the codes are the same as if they were encoded at once."""
+    start = 0
+    while start < len(quantized_pixels):
+        end = _end_of_run(quantized_pixels, min(start + PIXELS_PER_CHUNK, len(quantized_pixels)))
+        yield _run_length_encode_chunk(quantized_pixels[start:end], max_run_length, flag, dtype)
+        start = end
+
+
+def _end_of_run(quantized_pixels: np.ndarray, position: int) -> int:
+    # The first position at or after the given one that doesn't continue the run of the pixel before it
+    if position == len(quantized_pixels):
+        return position
+    color = quantized_pixels[position - 1]
+    while position < len(quantized_pixels):
+        is_other = quantized_pixels[position:position + PIXELS_PER_CHUNK] != color
+        if is_other.any():
+            return position + int(is_other.argmax())
+        position += len(is_other)
+    return position
+
+
+def _run_length_encode_chunk(quantized_pixels: np.ndarray, max_run_length: int, flag: int, dtype) -> np.ndarray:
+    run_starts = np.flatnonzero(quantized_pixels[1:] != quantized_pixels[:-1]).astype(np.int32)
+    run_starts += 1
+    run_starts = np.concatenate((np.zeros(1, dtype=np.int32), run_starts))
+    run_lengths = np.diff(run_starts, append=np.int32(len(quantized_pixels)))
+    # Long runs are split into chunks, each made up of the color and a run-length of at most max_run_length
+    chunk_size = max_run_length + 1
+    num_chunks = (run_lengths + max_run_length) // chunk_size
+    chunk_colors = np.repeat(quantized_pixels[run_starts], num_chunks)
+    chunk_lengths = np.full(len(chunk_colors), chunk_size, dtype=np.int32)
+    chunk_lengths[np.cumsum(num_chunks) - 1] = run_lengths - (num_chunks - 1) * chunk_size
+    codes = np.empty(len(chunk_colors) * 2, dtype=dtype)
+    codes[0::2] = chunk_colors
+    codes[1::2] = flag + chunk_lengths - 1
+    # Chunks of a single pixel don't need a run-length
+    is_needed = np.ones(len(codes), dtype=bool)
+    is_needed[1::2] = chunk_lengths > 1
+    return codes[is_needed]
+
+
+def read_16bit_quantized_frame(file: BinaryIO, frame_size: int) -> bytes:
     debug("Reading 16-bit quantized frame...")
-    format = f">{frame_size // 2}H"
-    read_pixels = list(struct.unpack(format, file.read(frame_size)))
-    return _read_quantized_frame(decode_pixel=uint15_to_bgr, flag_bitmask=0b10000000_00000000,
-                                 run_length_bitmask=0b01111111_11111111, read_pixels=read_pixels)
+    return _read_16bit_quantized_frame(file, frame_size, positions=None)
 
 
-def read_8bit_quantized_frame(file: BinaryIO, frame_size: int):
+def read_8bit_quantized_frame(file: BinaryIO, frame_size: int) -> bytes:
     debug("Reading 8-bit quantized frame...")
-    read_pixels = list(file.read(frame_size))
-    return _read_quantized_frame(decode_pixel=uint7_to_bgr, flag_bitmask=0b10000000,
-                                 run_length_bitmask=0b01111111, read_pixels=read_pixels)
-
-
-def _read_quantized_frame(decode_pixel: Callable[[int], Color], flag_bitmask: int, run_length_bitmask: int,
-    read_pixels: List[int]) -> List[int]:
-    buf = []
-    color = None
-    for i, q in enumerate(read_pixels):
-        if not q & flag_bitmask:
-            color = decode_pixel(q)
-            buf += color
-        else:
-            run_length = q & run_length_bitmask
-            buf += color * run_length
-    return buf
+    return _read_8bit_quantized_frame(file, frame_size, positions=None)
+
+
+def read_16bit_quantized_frame_decimated(file: BinaryIO, frame_size: int, resolution: Tuple[int, int],
+    factor: int) -> bytes:
+    debug("Reading decimated 16-bit quantized frame...")
+    return _read_16bit_quantized_frame(file, frame_size, sample_positions(resolution, factor))
+
+
+def read_8bit_quantized_frame_decimated(file: BinaryIO, frame_size: int, resolution: Tuple[int, int],
+    factor: int) -> bytes:
+    debug("Reading decimated 8-bit quantized frame...")
+    return _read_8bit_quantized_frame(file, frame_size, sample_positions(resolution, factor))
+
+
+def _read_16bit_quantized_frame(file: BinaryIO, frame_size: int, positions: Optional[np.ndarray]) -> bytes:
+    read_pixels = np.frombuffer(file.read(frame_size), dtype=">u2").astype(np.uint16)
+    return _read_quantized_frame(bgr_table=UINT15_TO_BGR_TABLE, flag_bitmask=0b10000000_00000000,
+                                 run_length_bitmask=0b01111111_11111111, read_pixels=read_pixels,
+                                 positions=positions)
+
+
+def _read_8bit_quantized_frame(file: BinaryIO, frame_size: int, positions: Optional[np.ndarray]) -> bytes:
+    read_pixels = np.frombuffer(file.read(frame_size), dtype=np.uint8)
+    return _read_quantized_frame(bgr_table=UINT7_TO_BGR_TABLE, flag_bitmask=0b10000000,
+                                 run_length_bitmask=0b01111111, read_pixels=read_pixels,
+                                 positions=positions)
+
+
+def _read_quantized_frame(bgr_table: np.ndarray, flag_bitmask: int, run_length_bitmask: int,
+    read_pixels: np.ndarray, positions: Optional[np.ndarray]) -> bytes:
+    # With positions, only the pixels at those positions are decoded
+    if positions is None:
+        colors = _expand_run_lengths(flag_bitmask, run_length_bitmask, read_pixels)
+    else:
+        colors = _sample_run_lengths(flag_bitmask, run_length_bitmask, read_pixels, positions)
+    return bgr_table.take(colors, axis=0).tobytes()
+
+
+def _expand_run_lengths(flag_bitmask: int, run_length_bitmask: int, read_pixels: np.ndarray) -> np.ndarray:
+    """Returns the quantized color of every pixel in the frame."""
+    colors, counts = _resolve_run_lengths(flag_bitmask, run_length_bitmask, read_pixels)
+    return np.repeat(colors, counts) if counts is not None else colors
+
+
+def _sample_run_lengths(flag_bitmask: int, run_length_bitmask: int, read_pixels: np.ndarray,
+    positions: np.ndarray) -> np.ndarray:
+    """Returns the quantized colors of the pixels at the positions, without expanding the runs of the others."""
+    colors, counts = _resolve_run_lengths(flag_bitmask, run_length_bitmask, read_pixels)
+    if counts is None:
+        return colors[positions]
+    # The code that covers a pixel is the first one whose run ends after the pixel
+    run_ends = np.cumsum(counts)
+    return colors[np.searchsorted(run_ends, positions, side="right")]
+
+
+def _resolve_run_lengths(flag_bitmask: int, run_length_bitmask: int, read_pixels: np.ndarray) \
+        -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Returns the color of each code, and how many pixels the code covers. counts is None if every code covers
+    one pixel."""
+    run_positions = np.flatnonzero(read_pixels & flag_bitmask)
+    if len(run_positions) == 0:
+        return read_pixels, None
+    if run_positions[0] == 0:
+        raise ValueError("Quantized frame starts with a run-length instead of a color!")
+    # A color covers one pixel, a run-length code repeats the preceding color
+    counts = np.ones(len(read_pixels), dtype=np.intp)
+    counts[run_positions] = read_pixels[run_positions] & run_length_bitmask
+    colors = read_pixels.copy()
+    unresolved = run_positions
+    while len(unresolved):
+        colors[unresolved] = colors[unresolved - 1]
+        # Only consecutive run-length codes need more than one pass
+        unresolved = unresolved[(colors[unresolved] & flag_bitmask) != 0]
+    return colors, counts
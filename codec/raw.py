@@ -1,7 +1,12 @@
-from typing import BinaryIO, List, Tuple
+from typing import BinaryIO, Tuple
+
+import numpy as np
+
+from codec.sampling import decimate
 
 from common import FrameType
-from io_utils import Color, uint8_to_bytes, uint32_to_bytes, write_rgb, write_bgr
+from io_utils import Pixels, uint8_to_bytes, uint32_to_bytes, rgb_array
+from stats import Stats, NULL_STATS
 
 DEBUG = False
 
@@ -11,19 +16,25 @@ def debug(text: str):
         print(text)
 
 
-def write_raw_frame(file: BinaryIO, pixels: List[Color]):
+def write_raw_frame(file: BinaryIO, pixels: Pixels, stats: Stats = NULL_STATS):
     debug("Writing raw frame")
-    # Frame type
-    file.write(uint8_to_bytes(FrameType.RAW.value))
-    # Frame size
-    file.write(uint32_to_bytes(len(pixels) * 3))
-    for pixel in pixels:
-        write_bgr(file, pixel)
+    rgb = rgb_array(pixels)
+    # Frame type, frame size and pixels, which are reordered to BGR straight into the buffer that is written
+    buf = bytearray(5 + rgb.size)
+    buf[:5] = uint8_to_bytes(FrameType.RAW.value) + uint32_to_bytes(rgb.size)
+    np.frombuffer(buf, dtype=np.uint8, offset=5).reshape(-1, 3)[:] = rgb[:, ::-1]
+    with stats.time("io"):
+        file.write(buf)
 
 
-def read_raw_frame(file: BinaryIO, frame_size: int) -> List[int]:
+def read_raw_frame(file: BinaryIO, frame_size: int) -> bytes:
     debug("Reading raw frame...")
     buf = file.read(frame_size)
     if len(buf) < frame_size:
         print(f"WARN: Read {len(buf)} bytes - not enough for a full frame!")
-    return list(buf)
+    return buf
+
+
+def read_raw_frame_decimated(file: BinaryIO, frame_size: int, resolution: Tuple[int, int], factor: int) -> bytes:
+    debug("Reading decimated raw frame...")
+    return decimate(read_raw_frame(file, frame_size), resolution, factor).tobytes()
@@ -0,0 +1,22 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def decimated_resolution(resolution: Tuple[int, int], factor: int) -> Tuple[int, int]:
+    """The resolution of a frame where only every factor-th pixel of every factor-th row is kept."""
+    return -(-resolution[0] // factor), -(-resolution[1] // factor)
+
+
+def sample_positions(resolution: Tuple[int, int], factor: int) -> np.ndarray:
+    """The positions, within the frame, of the pixels that are kept when decimating it, row by row."""
+    rows = np.arange(0, resolution[1], factor) * resolution[0]
+    cols = np.arange(0, resolution[0], factor)
+    return (rows[:, None] + cols[None, :]).ravel()
+
+
+def decimate(frame: bytes, resolution: Tuple[int, int], factor: int, x: int = 0, y: int = 0) -> np.ndarray:
+    """Returns the pixels of the BGR frame that are kept when decimating a larger frame that it's placed in at
+    (x, y), as an (H, W, 3) array."""
+    image = np.frombuffer(frame, dtype=np.uint8).reshape(resolution[1], resolution[0], 3)
+    return image[-y % factor::factor, -x % factor::factor]
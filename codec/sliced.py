@@ -0,0 +1,85 @@
+from concurrent.futures import Executor
+from io import BytesIO
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from common import FrameType
+from io_utils import bytes_to_int, uint8_to_bytes, uint16_to_bytes, uint32_to_bytes
+
+DEBUG = False
+
+# Bytes per entry in the slice table: num_rows (2) and offset (4)
+SLICE_ENTRY_SIZE = 6
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+def slice_rows(height: int, num_slices: int) -> List[Tuple[int, int]]:
+    """Splits the rows of a frame into at most num_slices bands of (nearly) equal height, as (y, num_rows)."""
+    num_slices = max(1, min(num_slices, height))
+    bounds = [height * i // num_slices for i in range(num_slices + 1)]
+    return [(start, end - start) for start, end in zip(bounds, bounds[1:])]
+
+
+def write_sliced_frame(file: BinaryIO, image: np.ndarray, num_slices: int,
+    encode_slice: Callable[[np.ndarray], bytes], executor: Optional[Executor] = None):
+    """Writes the (H, W, 3) image as horizontal slices that are each encoded as a frame of their own, by
+    encode_slice. With an executor, the slices are encoded concurrently. For a process pool, encode_slice must be
+    picklable."""
+    rows = slice_rows(image.shape[0], num_slices)
+    debug(f"Writing sliced frame with {len(rows)} slices")
+    slices = [image[y:y + n].reshape(-1, 3) for y, n in rows]
+    if executor is not None:
+        encoded = list(executor.map(encode_slice, slices))
+    else:
+        encoded = [encode_slice(pixels) for pixels in slices]
+
+    table = BytesIO()
+    table.write(uint16_to_bytes(len(rows)))
+    offset = 0
+    for (_, num_rows), data in zip(rows, encoded):
+        table.write(uint16_to_bytes(num_rows))
+        table.write(uint32_to_bytes(offset))
+        offset += len(data)
+    frame_size = table.tell() + offset
+    file.write(b"".join([uint8_to_bytes(FrameType.SLICED.value), uint32_to_bytes(frame_size), table.getbuffer()]
+                        + encoded))
+
+
+def read_sliced_frame(file: BinaryIO, frame_size: int, resolution: Tuple[int, int],
+    read_slice: Callable[[BinaryIO], bytes], executor: Optional[Executor] = None) -> bytes:
+    """Decodes the slices with read_slice, which reads a frame from a file. With an executor, which must be a
+    thread pool as the slices are decoded straight into a shared buffer, the slices are decoded concurrently."""
+    debug("Reading sliced frame...")
+    payload = memoryview(file.read(frame_size))
+    num_slices = bytes_to_int(payload[:2])
+    data_start = 2 + num_slices * SLICE_ENTRY_SIZE
+    entries = []
+    y = 0
+    for i in range(num_slices):
+        entry = payload[2 + i * SLICE_ENTRY_SIZE: 2 + (i + 1) * SLICE_ENTRY_SIZE]
+        num_rows = bytes_to_int(entry[:2])
+        entries.append((y, num_rows, data_start + bytes_to_int(entry[2:])))
+        y += num_rows
+    if y != resolution[1]:
+        raise ValueError(f"Slices cover {y} rows, but the frame has {resolution[1]}")
+
+    image = np.empty((resolution[1], resolution[0], 3), dtype=np.uint8)
+    ends = [start for _, _, start in entries[1:]] + [len(payload)]
+
+    def decode(i: int):
+        y, num_rows, start = entries[i]
+        pixels = read_slice(BytesIO(payload[start:ends[i]]))
+        image[y:y + num_rows] = np.frombuffer(pixels, dtype=np.uint8).reshape(num_rows, resolution[0], 3)
+
+    if executor is not None:
+        # Consumed, so that errors are raised here
+        list(executor.map(decode, range(num_slices)))
+    else:
+        for i in range(num_slices):
+            decode(i)
+    return image.tobytes()
@@ -1,4 +1,4 @@
-from typing import List, Dict
+import numpy as np
 
 from io_utils import Color
 
@@ -11,30 +11,20 @@ def uint15_to_rgb(n: int) -> Color:
     )
 
 
-uint15_color_cache: List[Color] = [None] * (2 ** 16)
-
-
 def uint15_to_bgr(n: int) -> Color:
-    if not uint15_color_cache[n]:
-        uint15_color_cache[n] = (
-            ((n & 0b0_00000_00000_11111) << 3) + 4,
-            ((n & 0b0_00000_11111_00000) >> 2) + 4,
-            ((n & 0b0_11111_00000_00000) >> 7) + 4,
-        )
-    return uint15_color_cache[n]
-
-
-color_uint15_cache: Dict[Color, int] = {}
+    return (
+        ((n & 0b0_00000_00000_11111) << 3) + 4,
+        ((n & 0b0_00000_11111_00000) >> 2) + 4,
+        ((n & 0b0_11111_00000_00000) >> 7) + 4,
+    )
 
 
 # returns 2-byte int
 def rgb_to_uint15(color: Color) -> int:
     # _ RRRRR GGGGG BBBBB
-    if not color in color_uint15_cache:
-        color_uint15_cache[color] = (color[0] >> 3 << 10) \
-                                    + (color[1] >> 3 << 5) \
-                                    + (color[2] >> 3)
-    return color_uint15_cache[color]
+    return (color[0] >> 3 << 10) \
+           + (color[1] >> 3 << 5) \
+           + (color[2] >> 3)
 
 
 def rgb_to_uint7(color: Color) -> int:
@@ -58,3 +48,56 @@ def uint7_to_bgr(n: int) -> Color:
         ((n & 0b00001100) << 4) + 16,
         ((n & 0b01110000) << 1) + 16,
     )
+
+
+# The bits that each 8-bit channel value contributes to its uint15, indexed by the channel value
+_UINT15_RED_TABLE = np.arange(256, dtype=np.uint16) >> 3 << 10
+_UINT15_GREEN_TABLE = np.arange(256, dtype=np.uint16) >> 3 << 5
+_UINT15_BLUE_TABLE = np.arange(256, dtype=np.uint16) >> 3
+
+
+def rgb_to_uint15_array(rgb: np.ndarray) -> np.ndarray:
+    # Same as rgb_to_uint15, for an (N, 3) uint8 array of RGB values
+    result = _UINT15_RED_TABLE.take(rgb[:, 0])
+    result |= _UINT15_GREEN_TABLE.take(rgb[:, 1])
+    result |= _UINT15_BLUE_TABLE.take(rgb[:, 2])
+    return result
+
+
+def rgb_to_uint7_array(rgb: np.ndarray) -> np.ndarray:
+    # Same as rgb_to_uint7, for an (N, 3) uint8 array of RGB values. Shifting uint8 values is faster than looking
+    # them up.
+    return (rgb[:, 0] >> 5 << 4) | (rgb[:, 1] >> 6 << 2) | (rgb[:, 2] >> 6)
+
+
+def uint15_to_bgr_array(values: np.ndarray) -> np.ndarray:
+    # Same as uint15_to_bgr, returning an (N, 3) array of BGR values
+    return UINT15_TO_BGR_TABLE.take(values, axis=0)
+
+
+def uint7_to_bgr_array(values: np.ndarray) -> np.ndarray:
+    # Same as uint7_to_bgr, returning an (N, 3) array of BGR values
+    return UINT7_TO_BGR_TABLE.take(values, axis=0)
+
+
+def _uint15_to_bgr_table() -> np.ndarray:
+    n = np.arange(2 ** 15, dtype=np.uint16)
+    return np.stack([
+        ((n & 0b0_00000_00000_11111) << 3) + 4,
+        ((n & 0b0_00000_11111_00000) >> 2) + 4,
+        ((n & 0b0_11111_00000_00000) >> 7) + 4,
+    ], axis=1).astype(np.uint8)
+
+
+def _uint7_to_bgr_table() -> np.ndarray:
+    n = np.arange(2 ** 7, dtype=np.uint8)
+    return np.stack([
+        ((n & 0b00000011) << 6) + 16,
+        ((n & 0b00001100) << 4) + 16,
+        ((n & 0b01110000) << 1) + 16,
+    ], axis=1).astype(np.uint8)
+
+
+# BGR values for every quantized color, indexed by the quantized value
+UINT15_TO_BGR_TABLE = _uint15_to_bgr_table()
+UINT7_TO_BGR_TABLE = _uint7_to_bgr_table()
@@ -7,3 +7,5 @@ class FrameType(Enum):
     QUANTIZED_TO_16_BIT = 3
     QUANTIZED_TO_8_BIT = 4
     REPEATED = 5
+    DELTA = 6
+    SLICED = 7
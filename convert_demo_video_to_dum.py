@@ -3,47 +3,16 @@ from io import BytesIO
 from time import time
 from typing import BinaryIO, Tuple
 
-import av
-
-from format import write_frame, Quality
-from header import write_header
+from format import Quality
 from play import play_file
-
-DEBUG = False
-
-
-def debug(text: str):
-    if DEBUG:
-        print(text)
+from transcode import transcode
 
 
 def convert(outfile: BinaryIO, resolution: Tuple[int, int], scaling: Tuple[int, int], num_frames: int,
     quality: Quality):
-    with open("night-sky.h264", "rb") as file:
-        codec = av.CodecContext.create("h264", "r")
-
-        write_header(outfile, 25, resolution, scaling, num_frames)
-        frame_i = 0
-        while frame_i < num_frames:
-
-            chunk = file.read(1 << 16)
-
-            packets = codec.parse(chunk)
-            debug("Parsed {} packets from {} bytes:".format(len(packets), len(chunk)))
-
-            for packet in packets:
-                debug(f"   {packet}")
-                frames = codec.decode(packet)
-                for frame in frames:
-                    debug(f"       {frame}")
-                    frame = frame.reformat(resolution[0], resolution[1])
-                    image_data = list(frame.to_image().getdata())
-                    before = time()
-                    offset_before = outfile.tell()
-                    write_frame(outfile, image_data, quality=quality)
-                    print(
-                        f"        It took {round(time() - before, 2)}s to write frame ({outfile.tell() - offset_before}B)")
-                    frame_i += 1
+    before = time()
+    transcode("night-sky.h264", outfile, resolution, scaling, quality, frame_rate=25, max_frames=num_frames)
+    print(f"It took {round(time() - before, 2)}s to write {num_frames} frames ({outfile.tell()}B)")
 
 
 def convert_to_file(filename: str):
@@ -55,6 +24,7 @@ def convert_and_play_in_memory():
     outfile = BytesIO()
     quality = Quality.LOW
     convert(outfile, resolution=(640, 360), scaling=(1, 1), num_frames=10, quality=quality)
+    outfile.seek(0)
     play_file(outfile, f"Night sky ({quality.name})")
 
 
@@ -5,12 +5,12 @@ import pygame
 
 from format import write_frame, Quality
 from header import write_header
-from pygame_utils import get_surface_pixels
+from pygame_utils import get_surface_rgb
 
 
 def convert_image(source_path: str, target_path: str, quality: Quality):
     surface = pygame.image.load(source_path)
-    pixels = list(get_surface_pixels(surface))
+    pixels = get_surface_rgb(surface)
     with open(target_path, "wb") as target_file:
         resolution = (surface.get_width(), surface.get_height())
         write_header(target_file, frame_rate=1, resolution=resolution, scaling=(1, 1), num_frames=1)
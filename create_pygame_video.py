@@ -8,7 +8,7 @@ from pygame.rect import Rect
 from format import write_frame
 from header import write_header
 from play import play_file
-from pygame_utils import get_surface_pixels
+from pygame_utils import get_surface_rgb
 
 file = BytesIO()
 num_frames = 300
@@ -20,11 +20,12 @@ print("Writing frames to IO buffer...")
 for i in range(num_frames):
     surface.fill((100, 100, 100))
     pygame.draw.rect(surface, (250, 250, 250), rect)
-    pixels = list(get_surface_pixels(surface))
+    pixels = get_surface_rgb(surface)
     write_frame(file, pixels)
     if i < num_frames // 2:
         rect.move_ip(1, 0)
     else:
         rect.move_ip(-1, 0)
 print("Done creating video.")
+file.seek(0)
 play_file(file, "testing")
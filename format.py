@@ -1,14 +1,27 @@
+from concurrent.futures import Executor
 from enum import Enum
-from typing import BinaryIO, Tuple, List
+from functools import partial
+from io import BytesIO
+from time import perf_counter
+from typing import BinaryIO, Iterator, Tuple, Optional
 
-from codec.colormapped import read_color_mapped_frame, write_color_mapped_frame
+import numpy as np
+
+from codec.colormapped import read_color_mapped_frame, index_colors, write_indexed_frame, \
+    read_color_mapped_frame_decimated
+from codec.delta import find_changed_rects, write_delta_frame, read_delta_frame, read_delta_frame_decimated
 from codec.quantized import read_16bit_quantized_frame, read_8bit_quantized_frame, write_8bit_quantized_frame, \
-    write_16bit_quantized_frame
-from codec.raw import write_raw_frame, read_raw_frame
+    write_16bit_quantized_frame, read_16bit_quantized_frame_decimated, read_8bit_quantized_frame_decimated
+from codec.raw import write_raw_frame, read_raw_frame, read_raw_frame_decimated
 from codec.repeated import write_repeated_frame
+from codec.sampling import decimate
+from codec.sliced import write_sliced_frame, read_sliced_frame
 from common import FrameType
-from header import DumInfo, write_header
-from io_utils import Color, bytes_to_int
+from frame_cache import FrameCache
+from frame_index import FrameIndex, build_frame_index
+from header import DumInfo, write_header, write_num_frames
+from io_utils import Pixels, bytes_to_int, rgb_array
+from stats import Stats, NULL_STATS, CountingWriter
 
 DEBUG = False
 
@@ -23,77 +36,272 @@ def log(text: str):
 
 
 class Decoder:
-    def __init__(self, file: BinaryIO, info: DumInfo):
+    """Reads the frames of a DUM file. Files that can't seek, like pipes and sockets, can be read from start to end,
+    but not seeked in.
+
+    With an executor, which must be a thread pool, the slices of SLICED frames are decoded concurrently."""
+
+    def __init__(self, file: BinaryIO, info: DumInfo, frame_index: Optional[FrameIndex] = None,
+        cache: Optional[FrameCache] = None, stats: Stats = NULL_STATS, executor: Optional[Executor] = None):
         self._file = file
+        self._executor = executor
+        self._stats = stats
         self._info = info
         self._frame_index = 0
         self._previous_frame = None
+        # Which frame _previous_frame holds. Frames that are skipped are never decoded.
+        self._previous_frame_index = None
+        self._index = frame_index
+        self._cache = cache
+        self._last_frame_header = None
+        # Where the frames end, once that has been found out. Only needed if the header doesn't say.
+        self._end_frame_index = None
+        # The latest frame read by read_decimated_frame, as (frame index, factor, frame)
+        self._previous_decimated: Optional[Tuple[int, int, bytes]] = None
 
-    def read_frame(self) -> List[int]:
+    def read_frame(self) -> bytes:
+        """Decodes the next frame. Raises EOFError if there are no more frames."""
         info = self.info
+        cached_frame = self._cache.get(self._frame_index) if self._cache is not None else None
+        if cached_frame is not None:
+            debug(f"Frame {self._frame_index} is cached")
+            _skip_frame(self._file)
+            self._set_previous_frame(self._frame_index, cached_frame)
+            self._frame_index += 1
+            return cached_frame
+        if self._needs_previous_frame():
+            return self.get_frame(self._frame_index)
         try:
-            frame = self._read_frame(self._file)
+            if self._stats.enabled:
+                frame = self._read_frame_with_stats(self._file)
+            else:
+                frame = self._read_frame(self._file)
+        except EOFError:
+            self._end_frame_index = self._frame_index
+            raise
         except Exception as e:
             raise Exception(f"Failed to read frame {self._frame_index}") from e
+        self._set_previous_frame(self._frame_index, frame)
+        if self._cache is not None:
+            self._cache.put(self._frame_index, frame)
         self._frame_index += 1
         debug(f"Frame {self._frame_index}/{info.num_frames}")
-        debug(f"{self._file.tell()}/{info.file_size} bytes")
         return frame
 
-    def _read_frame(self, file: BinaryIO) -> List[int]:
-        frame_type = bytes_to_int(file.read(1))
+    def frames(self) -> Iterator[bytes]:
+        """Decodes the remaining frames."""
+        while not self.at_end:
+            try:
+                yield self.read_frame()
+            except EOFError:
+                return
+
+    def _read_frame_with_stats(self, file: BinaryIO) -> bytes:
+        start = perf_counter()
+        with self._stats.time("decode"):
+            frame = self._read_frame(file)
+        frame_type, frame_size = self._last_frame_header
+        self._stats.record_frame("decode", FrameType(frame_type).name, 5 + frame_size, perf_counter() - start)
+        return frame
+
+    def _read_frame(self, file: BinaryIO) -> bytes:
+        header = file.read(1)
+        if not header:
+            raise EOFError(f"No frame {self._frame_index}: reached the end of the file")
+        frame_type = bytes_to_int(header)
         frame_size = bytes_to_int(file.read(4))  # frame size
-        if frame_type == FrameType.RAW.value:
-            buf = read_raw_frame(file, frame_size)
-        elif frame_type == FrameType.COLOR_MAPPED.value:
-            buf = read_color_mapped_frame(file, frame_size)
-        elif frame_type == FrameType.QUANTIZED_TO_16_BIT.value:
-            buf = read_16bit_quantized_frame(file, frame_size)
-        elif frame_type == FrameType.QUANTIZED_TO_8_BIT.value:
-            buf = read_8bit_quantized_frame(file, frame_size)
-        elif frame_type == FrameType.REPEATED.value:
+        self._last_frame_header = (frame_type, frame_size)
+        if frame_type == FrameType.REPEATED.value:
             if self._previous_frame is None:
                 raise Exception("Encountered REPEATED frame as first frame!")
             buf = self._previous_frame
+        elif frame_type == FrameType.DELTA.value:
+            if self._previous_frame is None:
+                raise Exception("Encountered DELTA frame as first frame!")
+            buf = read_delta_frame(file, self._previous_frame, (self.info.width, self.info.height), _read_patch)
+        elif frame_type == FrameType.SLICED.value:
+            buf = read_sliced_frame(file, frame_size, (self.info.width, self.info.height), _read_patch,
+                                    self._executor)
         else:
-            raise ValueError(f"Read unexpected frame type: {frame_type}, offset={file.tell() - 1}")
-        self._previous_frame = buf
+            buf = _read_intra_frame(file, frame_type, frame_size)
         return buf
 
+    def _set_previous_frame(self, frame_index: int, frame: bytes):
+        self._previous_frame = frame
+        self._previous_frame_index = frame_index
+
+    def _needs_previous_frame(self) -> bool:
+        # If the frame before this one was skipped, REPEATED and DELTA frames can't be decoded from _previous_frame
+        if self._frame_index == 0 or self._previous_frame_index == self._frame_index - 1:
+            return False
+        return self.frame_index.frame_type(self._frame_index) in (FrameType.REPEATED, FrameType.DELTA)
+
+    def get_frame(self, frame_index: int) -> bytes:
+        """Decodes the frame at the given index. Reading continues from the frame after it."""
+        if not 0 <= frame_index < self.num_frames:
+            raise IndexError(f"Frame index out of range: {frame_index}")
+        if self._cache is not None and frame_index in self._cache:
+            self.seek_to_frame(frame_index)
+            return self.read_frame()
+        key_frame = self.frame_index.key_frame(frame_index)
+        already_decoded = self._previous_frame_index is not None \
+                          and key_frame <= self._previous_frame_index <= frame_index \
+                          and self._previous_frame_index == self._frame_index - 1
+        if not already_decoded:
+            self.seek_to_frame(key_frame)
+        frame = self._previous_frame
+        while self._frame_index <= frame_index:
+            frame = self.read_frame()
+        return frame
+
+    def read_decimated_frame(self, factor: int) -> bytes:
+        """Decodes the next frame, keeping only every factor-th pixel of every factor-th row, as for a thumbnail.
+        The frame has the resolution given by decimated_resolution(). For most frame types, the pixels in between
+        are never decoded, which makes this much faster than read_frame."""
+        previous = self._previous_decimated
+        has_previous = previous is not None and previous[:2] == (self._frame_index - 1, factor)
+        if not has_previous and self._frame_index > 0 \
+                and self.frame_index.frame_type(self._frame_index) in (FrameType.REPEATED, FrameType.DELTA):
+            return self.get_decimated_frame(self._frame_index, factor)
+        try:
+            frame = self._read_decimated_frame(self._file, factor, previous[2] if has_previous else None)
+        except EOFError:
+            self._end_frame_index = self._frame_index
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to read frame {self._frame_index}") from e
+        self._previous_decimated = (self._frame_index, factor, frame)
+        self._frame_index += 1
+        return frame
+
+    def get_decimated_frame(self, frame_index: int, factor: int) -> bytes:
+        """Like get_frame, for read_decimated_frame."""
+        if not 0 <= frame_index < self.num_frames:
+            raise IndexError(f"Frame index out of range: {frame_index}")
+        key_frame = self.frame_index.key_frame(frame_index)
+        previous = self._previous_decimated
+        already_decoded = previous is not None and previous[1] == factor and key_frame <= previous[0] <= frame_index \
+                          and previous[0] == self._frame_index - 1
+        if not already_decoded:
+            self.seek_to_frame(key_frame)
+            self._previous_decimated = None
+        frame = None
+        while self._frame_index <= frame_index:
+            frame = self.read_decimated_frame(factor)
+        return frame if frame is not None else self._previous_decimated[2]
+
+    def _read_decimated_frame(self, file: BinaryIO, factor: int, previous_frame: Optional[bytes]) -> bytes:
+        header = file.read(1)
+        if not header:
+            raise EOFError(f"No frame {self._frame_index}: reached the end of the file")
+        frame_type = bytes_to_int(header)
+        frame_size = bytes_to_int(file.read(4))
+        resolution = (self.info.width, self.info.height)
+        if frame_type == FrameType.REPEATED.value:
+            if previous_frame is None:
+                raise Exception("Encountered REPEATED frame as first frame!")
+            return previous_frame
+        elif frame_type == FrameType.DELTA.value:
+            if previous_frame is None:
+                raise Exception("Encountered DELTA frame as first frame!")
+            return read_delta_frame_decimated(file, previous_frame, resolution, factor, _read_patch)
+        elif frame_type == FrameType.SLICED.value:
+            frame = read_sliced_frame(file, frame_size, resolution, _read_patch, self._executor)
+            return decimate(frame, resolution, factor).tobytes()
+        elif frame_type == FrameType.RAW.value:
+            return read_raw_frame_decimated(file, frame_size, resolution, factor)
+        elif frame_type == FrameType.COLOR_MAPPED.value:
+            return read_color_mapped_frame_decimated(file, frame_size, resolution, factor)
+        elif frame_type == FrameType.QUANTIZED_TO_16_BIT.value:
+            return read_16bit_quantized_frame_decimated(file, frame_size, resolution, factor)
+        elif frame_type == FrameType.QUANTIZED_TO_8_BIT.value:
+            return read_8bit_quantized_frame_decimated(file, frame_size, resolution, factor)
+        else:
+            raise ValueError(f"Read unexpected frame type: {frame_type}, offset={file.tell() - 5}")
+
     def skip_frame(self) -> Tuple[int, int]:
         frame_type, frame_size = _skip_frame(self._file)
         self._frame_index += 1
         return frame_type, frame_size
 
     def seek(self, progress: float) -> int:
-        target_frame = int(self.info.num_frames * progress)
-        if target_frame < self._frame_index:
-            log(f"Seeking {target_frame} frames from beginning. ({self._frame_index} --> {target_frame})")
-            self.seek_to_beginning()
-            for _ in range(target_frame):
-                self.skip_frame()
-        else:
-            diff = target_frame - self._frame_index
-            log(f"Seeking forward {diff} frames. ({self._frame_index} --> {target_frame})")
-            for _ in range(diff):
-                self.skip_frame()
+        target_frame = min(int(self.num_frames * progress), self.num_frames - 1)
+        log(f"Seeking to frame {target_frame}. ({self._frame_index} --> {target_frame})")
+        self.seek_to_frame(target_frame)
         return target_frame
 
+    def seek_to_frame(self, frame_index: int):
+        self._file.seek(self.frame_index.offset(frame_index))
+        self._frame_index = frame_index
+
     def seek_to_beginning(self):
         self._file.seek(self.info.first_frame_offset)
         self._frame_index = 0
 
+    @property
+    def seekable(self) -> bool:
+        return self._file.seekable()
+
+    @property
+    def num_frames(self) -> int:
+        """If the header doesn't say how many frames there are, the file is scanned to find out."""
+        if self.info.num_frames is not None:
+            return self.info.num_frames
+        return len(self.frame_index)
+
+    @property
+    def at_end(self) -> bool:
+        """Whether all frames have been read. If the header doesn't say how many frames there are, or the file is
+        cut short, this is only known once reading a frame has failed with EOFError."""
+        if self._frame_index == self._end_frame_index:
+            return True
+        return self.info.num_frames is not None and self._frame_index >= self.info.num_frames
+
+    @property
+    def position(self) -> int:
+        """The index of the frame that will be read next."""
+        return self._frame_index
+
+    @property
+    def frame_index(self) -> FrameIndex:
+        if self._index is None:
+            self._index = build_frame_index(self._file, self.info)
+        return self._index
+
     @property
     def info(self) -> DumInfo:
         return self._info
 
 
+def _read_intra_frame(file: BinaryIO, frame_type: int, frame_size: int) -> bytes:
+    # Frames that can be decoded without looking at the previous frame
+    if frame_type == FrameType.RAW.value:
+        return read_raw_frame(file, frame_size)
+    elif frame_type == FrameType.COLOR_MAPPED.value:
+        return read_color_mapped_frame(file, frame_size)
+    elif frame_type == FrameType.QUANTIZED_TO_16_BIT.value:
+        return read_16bit_quantized_frame(file, frame_size)
+    elif frame_type == FrameType.QUANTIZED_TO_8_BIT.value:
+        return read_8bit_quantized_frame(file, frame_size)
+    else:
+        raise ValueError(f"Read unexpected frame type: {frame_type}, offset={file.tell() - 5}")
+
+
+def _read_patch(file: BinaryIO) -> bytes:
+    frame_type = bytes_to_int(file.read(1))
+    frame_size = bytes_to_int(file.read(4))
+    return _read_intra_frame(file, frame_type, frame_size)
+
+
 def _skip_frame(file: BinaryIO) -> Tuple[int, int]:
     frame_type = bytes_to_int(file.read(1))
     if frame_type not in (t.value for t in FrameType):
         raise ValueError(f"Unexpected frame_type at offset {file.tell() - 1}: {frame_type}")
     frame_size = bytes_to_int(file.read(4))
-    file.seek(frame_size, 1)
+    if file.seekable():
+        file.seek(frame_size, 1)
+    else:
+        file.read(frame_size)
     return frame_type, frame_size
 
 
@@ -103,40 +311,246 @@ class Quality(Enum):
     LOSSLESS = 2
 
 
+# The frame types that each quality allows. Frame types of a higher quality are always allowed.
+ADMISSIBLE_FRAME_TYPES = {
+    Quality.LOSSLESS: [FrameType.COLOR_MAPPED, FrameType.RAW],
+    Quality.MEDIUM: [FrameType.COLOR_MAPPED, FrameType.RAW, FrameType.QUANTIZED_TO_16_BIT],
+    Quality.LOW: [FrameType.COLOR_MAPPED, FrameType.RAW, FrameType.QUANTIZED_TO_16_BIT, FrameType.QUANTIZED_TO_8_BIT],
+}
+
+# With a target bitrate, at most this many seconds worth of unused bytes can be saved up for later frames
+MAX_SAVED_SECONDS = 1.0
+
+
 class Encoder:
-    def __init__(self, file: BinaryIO, quality: Quality = Quality.LOSSLESS):
+    """Writes a DUM file.
+
+    With optimize_size, every frame is written with whichever frame type the quality allows that makes it the
+    smallest. With a target bitrate (in bits per second), the quality is chosen per frame: the best quality, up to
+    the given one, that keeps the file within the bitrate.
+
+    With slices > 1, frames that aren't REPEATED or DELTA are split into that many SLICED frames, which can be
+    decoded concurrently. With an executor, the slices are also encoded concurrently.
+
+    Every frame is written in one go, so that files that can't seek, like pipes and sockets, can be written to. If
+    num_frames isn't given to write_header, or turns out to be wrong, close() corrects it in the header when the
+    file can seek."""
+
+    def __init__(self, file: BinaryIO, quality: Quality = Quality.LOSSLESS, delta_frames: bool = True,
+        stats: Stats = NULL_STATS, optimize_size: bool = False, target_bitrate: Optional[int] = None,
+        slices: int = 1, executor: Optional[Executor] = None):
         self._file = file
+        self._slices = slices
+        self._executor = executor
         self._quality = quality
+        self._delta_frames = delta_frames
+        self._stats = stats
+        self._optimize_size = optimize_size
+        self._target_bitrate = target_bitrate
         self._has_written_header = False
+        self._header_offset = None
+        self._num_frames = None
+        self._frames_written = 0
+        self._resolution = None
         self._previous_frame = None
+        # For the target bitrate: how many bytes each frame may use, and how many bytes are left over so far
+        self._frame_budget = None
+        self._max_saved_bytes = None
+        self._saved_bytes = 0.0
 
-    def write_header(self, frame_rate: int, resolution: Tuple[int, int], scaling: Tuple[int, int], num_frames: int):
+    def write_header(self, frame_rate: int, resolution: Tuple[int, int], scaling: Tuple[int, int],
+        num_frames: Optional[int] = None):
         if self._has_written_header:
             raise Exception("Has already written header!")
+        if self._file.seekable():
+            self._header_offset = self._file.tell()
         write_header(self._file, frame_rate, resolution, scaling, num_frames)
+        self._num_frames = num_frames
+        self._resolution = resolution
+        if self._target_bitrate is not None:
+            self._frame_budget = self._target_bitrate / 8 / frame_rate
+            self._max_saved_bytes = self._target_bitrate / 8 * MAX_SAVED_SECONDS
         self._has_written_header = True
 
-    def write_frame(self, pixels: List[Color]):
+    def write_frame(self, pixels: Pixels):
         if not self._has_written_header:
             raise Exception("Must write header before writing frames!")
-        if self._previous_frame == pixels:
-            write_repeated_frame(self._file)
+        stats = self._stats
+        if not stats.enabled:
+            self._write_frame(self._file, pixels)
         else:
-            self._previous_frame = pixels
-            write_frame(self._file, pixels, self._quality)
+            start = perf_counter()
+            file = CountingWriter(self._file)
+            frame_type = self._write_frame(file, pixels)
+            stats.record_frame("encode", frame_type.name, file.count, perf_counter() - start)
+        # Only frames that were written count, as close() writes the count to the header
+        self._frames_written += 1
 
+    def close(self):
+        """Makes sure that the header has the right number of frames. The file itself is left open."""
+        if not self._has_written_header or self._frames_written == self._num_frames:
+            return
+        if self._header_offset is not None:
+            debug(f"Writing num_frames={self._frames_written} to the header")
+            write_num_frames(self._file, self._frames_written, self._header_offset)
+        elif self._num_frames is not None:
+            raise Exception(f"Wrote {self._frames_written} frames, but the header says {self._num_frames}!")
+
+    @property
+    def frames_written(self) -> int:
+        return self._frames_written
 
-def write_frame(file: BinaryIO, pixels: List[Color], quality: Quality = Quality.LOSSLESS):
-    colors = list(set(pixels))
+    def __enter__(self) -> "Encoder":
+        return self
 
-    if len(colors) < 256:
-        write_color_mapped_frame(colors, file, pixels)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # After an error, the file is incomplete anyway, and fixing up the header could hide the error
+        if exc_type is None:
+            self.close()
+
+    def _write_frame(self, file: BinaryIO, pixels: Pixels) -> FrameType:
+        pixels = frame_array(pixels, self._resolution)
+        if self._frame_budget is not None:
+            self._saved_bytes = min(self._saved_bytes + self._frame_budget, self._max_saved_bytes)
+        if self._previous_frame is not None and np.array_equal(self._previous_frame, pixels):
+            write_repeated_frame(file)
+            self._saved_bytes -= 5
+            return FrameType.REPEATED
+        changed_rects = None
+        if self._delta_frames and self._previous_frame is not None:
+            shape = (self._resolution[1], self._resolution[0], 3)
+            changed_rects = find_changed_rects(self._previous_frame.reshape(shape), pixels.reshape(shape))
+        if self._frame_budget is None:
+            frame_type = self._write_picture(file, pixels, changed_rects, self._quality, self._stats)
+        else:
+            frame_type = self._write_picture_within_budget(file, pixels, changed_rects)
+        self._previous_frame = pixels
+        return frame_type
+
+    def _write_picture(self, file: BinaryIO, pixels: np.ndarray, changed_rects, quality: Quality,
+        stats: Stats) -> FrameType:
+        if changed_rects is not None:
+            shape = (self._resolution[1], self._resolution[0], 3)
+            write_delta_frame(file, pixels.reshape(shape), changed_rects,
+                              lambda patch_file, patch: write_frame(patch_file, patch, quality, stats,
+                                                                    self._optimize_size))
+            return FrameType.DELTA
+        if self._slices > 1:
+            shape = (self._resolution[1], self._resolution[0], 3)
+            write_sliced_frame(file, pixels.reshape(shape), self._slices,
+                               partial(encode_frame, quality=quality, optimize_size=self._optimize_size),
+                               self._executor)
+            return FrameType.SLICED
+        return write_frame(file, pixels, quality, stats, self._optimize_size)
+
+    def _write_picture_within_budget(self, file: BinaryIO, pixels: np.ndarray, changed_rects) -> FrameType:
+        # Try the qualities from the best one down, and keep the first that fits. If none fits, keep the smallest.
+        qualities = [q for q in reversed(Quality) if q.value <= self._quality.value]
+        best = None
+        previous_data = None
+        for quality in qualities:
+            if quality == Quality.LOSSLESS and quality != qualities[-1] and self._is_raw_if_lossless(changed_rects) \
+                    and 5 + len(pixels) * 3 > self._saved_bytes:
+                # The frame is either RAW, which doesn't fit, or COLOR_MAPPED, which is the same at lower qualities
+                debug("Frame doesn't fit the budget as a RAW frame")
+                continue
+            buf = BytesIO()
+            frame_type = self._write_picture(buf, pixels, changed_rects, quality, NULL_STATS)
+            data = buf.getvalue()
+            if best is None or len(data) < len(best[1]):
+                best = (frame_type, data)
+            if len(data) <= self._saved_bytes:
+                debug(f"Frame of {len(data)} bytes fits the budget at quality {quality.name}")
+                break
+            # Without optimize_size, a frame that is the same at two qualities is color-mapped throughout, and so
+            # also the same at lower qualities
+            if not self._optimize_size and (frame_type == FrameType.COLOR_MAPPED or data == previous_data):
+                break
+            previous_data = data
+        frame_type, data = best
+        file.write(data)
+        self._saved_bytes -= len(data)
+        return frame_type
+
+    def _is_raw_if_lossless(self, changed_rects) -> bool:
+        # Whether a frame that isn't COLOR_MAPPED is written as a RAW frame of known size at LOSSLESS quality
+        return changed_rects is None and self._slices == 1 and not self._optimize_size
+
+
+def frame_array(pixels: Pixels, resolution: Tuple[int, int]) -> np.ndarray:
+    """Returns a copy of the pixels as an (N, 3) array, checking that they make up a frame of the resolution.
+    A copy is made so that callers may reuse their buffers for the next frame."""
+    rgb = rgb_array(pixels)
+    if len(rgb) != resolution[0] * resolution[1]:
+        raise ValueError(f"Expected {resolution[0]}x{resolution[1]} pixels but got {len(rgb)}")
+    return rgb.copy()
+
+
+def encode_frame(pixels: Pixels, quality: Quality = Quality.LOSSLESS, optimize_size: bool = False) -> bytes:
+    """Returns the frame as it would be written by write_frame."""
+    buf = BytesIO()
+    write_frame(buf, pixels, quality, optimize_size=optimize_size)
+    return buf.getvalue()
+
+
+def write_frame(file: BinaryIO, pixels: Pixels, quality: Quality = Quality.LOSSLESS,
+    stats: Stats = NULL_STATS, optimize_size: bool = False) -> FrameType:
+    """Writes the frame without looking at any other frames, and returns the frame type that was used.
+
+    By default, the frame is color-mapped if it has few enough colors, and otherwise stored as the quality dictates.
+    With optimize_size, the smallest of the frame types that the quality allows is used instead."""
+    pixels = rgb_array(pixels)
+    with stats.time("palette"):
+        indexed_colors = index_colors(pixels)
+
+    if optimize_size:
+        return _write_smallest_frame(file, pixels, indexed_colors, quality, stats)
+    if indexed_colors is not None:
+        color_map, color_indices = indexed_colors
+        write_indexed_frame(file, color_map, color_indices, stats)
+        return FrameType.COLOR_MAPPED
     else:
         if quality == Quality.LOW:
-            write_8bit_quantized_frame(file, pixels)
+            write_8bit_quantized_frame(file, pixels, stats)
+            return FrameType.QUANTIZED_TO_8_BIT
         elif quality == Quality.MEDIUM:
-            write_16bit_quantized_frame(file, pixels)
+            write_16bit_quantized_frame(file, pixels, stats)
+            return FrameType.QUANTIZED_TO_16_BIT
         elif quality == Quality.LOSSLESS:
-            write_raw_frame(file, pixels)
+            write_raw_frame(file, pixels, stats)
+            return FrameType.RAW
         else:
             raise ValueError(f"Unhandled quality: {quality}")
+
+
+def _write_smallest_frame(file: BinaryIO, pixels: np.ndarray, indexed_colors, quality: Quality,
+    stats: Stats) -> FrameType:
+    # The sizes of RAW and COLOR_MAPPED frames follow from the pixels, while quantized frames have to be encoded
+    # to find out how well their run-length encoding works. Ties go to the frame type listed first.
+    sizes = {}
+    encoded = {}
+    for frame_type in ADMISSIBLE_FRAME_TYPES[quality]:
+        if frame_type == FrameType.COLOR_MAPPED:
+            if indexed_colors is not None:
+                sizes[frame_type] = 1 + len(indexed_colors[0]) * 3 + len(pixels)
+        elif frame_type == FrameType.RAW:
+            sizes[frame_type] = len(pixels) * 3
+        else:
+            buf = BytesIO()
+            if frame_type == FrameType.QUANTIZED_TO_16_BIT:
+                write_16bit_quantized_frame(buf, pixels, stats)
+            else:
+                write_8bit_quantized_frame(buf, pixels, stats)
+            encoded[frame_type] = buf.getvalue()
+            sizes[frame_type] = len(encoded[frame_type]) - 5
+    frame_type = min(sizes, key=sizes.get)
+    debug(f"Smallest frame type: {frame_type.name} ({sizes})")
+
+    if frame_type in encoded:
+        with stats.time("io"):
+            file.write(encoded[frame_type])
+    elif frame_type == FrameType.COLOR_MAPPED:
+        write_indexed_frame(file, *indexed_colors, stats)
+    else:
+        write_raw_frame(file, pixels, stats)
+    return frame_type
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+DEBUG = False
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class FrameCache:
+    """Decoded frames by frame index, limited to max_bytes of frame data. The least recently used frames are evicted
+    first. Consecutive frames that decode to the same frame object (i.e. REPEATED frames) share one entry."""
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._size = 0
+        # Frames by their id, in order of use. Holding on to the frames keeps their ids unique.
+        self._frames: OrderedDict = OrderedDict()
+        self._frame_ids: Dict[int, int] = {}
+        self._frame_indices: Dict[int, Set[int]] = {}
+
+    def get(self, frame_index: int) -> Optional[bytes]:
+        frame_id = self._frame_ids.get(frame_index)
+        if frame_id is None:
+            return None
+        self._frames.move_to_end(frame_id)
+        return self._frames[frame_id]
+
+    def put(self, frame_index: int, frame: bytes):
+        frame_id = id(frame)
+        previous_frame_id = self._frame_ids.get(frame_index)
+        if previous_frame_id == frame_id:
+            self._frames.move_to_end(frame_id)
+            return
+        if previous_frame_id is not None:
+            self._remove_index(frame_index)
+        if len(frame) > self._max_bytes:
+            return
+        if frame_id in self._frames:
+            self._frames.move_to_end(frame_id)
+        else:
+            self._frames[frame_id] = frame
+            self._frame_indices[frame_id] = set()
+            self._size += len(frame)
+        self._frame_ids[frame_index] = frame_id
+        self._frame_indices[frame_id].add(frame_index)
+        while self._size > self._max_bytes:
+            self._evict()
+
+    def clear(self):
+        self._frames.clear()
+        self._frame_ids.clear()
+        self._frame_indices.clear()
+        self._size = 0
+
+    def __contains__(self, frame_index: int) -> bool:
+        return frame_index in self._frame_ids
+
+    def __len__(self) -> int:
+        return len(self._frame_ids)
+
+    @property
+    def size(self) -> int:
+        """The number of bytes held by the cache."""
+        return self._size
+
+    def _evict(self):
+        frame_id, frame = self._frames.popitem(last=False)
+        self._size -= len(frame)
+        for frame_index in self._frame_indices.pop(frame_id):
+            del self._frame_ids[frame_index]
+        debug(f"Evicted frame of {len(frame)} bytes from cache")
+
+    def _remove_index(self, frame_index: int):
+        frame_id = self._frame_ids.pop(frame_index)
+        frame_indices = self._frame_indices[frame_id]
+        frame_indices.discard(frame_index)
+        if not frame_indices:
+            del self._frame_indices[frame_id]
+            self._size -= len(self._frames.pop(frame_id))
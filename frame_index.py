@@ -0,0 +1,142 @@
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from common import FrameType
+from header import DumInfo
+from io_utils import bytes_to_int, uint32_to_bytes, ReadError
+
+DEBUG = False
+
+# One entry per frame: where its frame header starts, its type and the size of its data
+ENTRY_DTYPE = np.dtype([("offset", ">u8"), ("frame_type", "u1"), ("frame_size", ">u4")])
+
+INDEX_MAGIC_STRING = b'dumi'
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class FrameIndex:
+    def __init__(self, entries: np.ndarray):
+        self._entries = entries
+        positions = np.arange(len(entries))
+        is_key_frame = ~np.isin(entries["frame_type"], [FrameType.REPEATED.value, FrameType.DELTA.value])
+        # For every frame, the closest frame at or before it that can be decoded on its own
+        self._key_frames = np.maximum.accumulate(np.where(is_key_frame, positions, 0)) if len(entries) else positions
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def offset(self, frame_index: int) -> int:
+        return int(self._entries["offset"][frame_index])
+
+    def frame_type(self, frame_index: int) -> FrameType:
+        return FrameType(self._entries["frame_type"][frame_index])
+
+    def frame_size(self, frame_index: int) -> int:
+        return int(self._entries["frame_size"][frame_index])
+
+    def key_frame(self, frame_index: int) -> int:
+        key_frame = int(self._key_frames[frame_index])
+        if self.frame_type(key_frame) in (FrameType.REPEATED, FrameType.DELTA):
+            raise Exception(f"Encountered {self.frame_type(key_frame).name} frame as first frame!")
+        return key_frame
+
+    @property
+    def entries(self) -> np.ndarray:
+        return self._entries
+
+
+def build_frame_index(file: BinaryIO, info: DumInfo) -> FrameIndex:
+    """Scans the frame headers of the file. The file position is restored afterwards.
+
+    If the header doesn't say how many frames there are, frames are scanned until the end of the file."""
+    debug(f"Building frame index for {info.num_frames} frames...")
+    if info.num_frames is None:
+        return FrameIndex(_scan_to_end(file, info))
+    position = file.tell()
+    entries = np.zeros(info.num_frames, dtype=ENTRY_DTYPE)
+    offset = info.first_frame_offset
+    valid_frame_types = [t.value for t in FrameType]
+    try:
+        for i in range(info.num_frames):
+            file.seek(offset)
+            frame_type = bytes_to_int(file.read(1))
+            if frame_type not in valid_frame_types:
+                raise ValueError(f"Unexpected frame_type at offset {offset}: {frame_type}")
+            frame_size = bytes_to_int(file.read(4))
+            entries[i] = (offset, frame_type, frame_size)
+            offset += 5 + frame_size
+    finally:
+        file.seek(position)
+    return FrameIndex(entries)
+
+
+def _scan_to_end(file: BinaryIO, info: DumInfo) -> np.ndarray:
+    position = file.tell()
+    entries = []
+    offset = info.first_frame_offset
+    valid_frame_types = [t.value for t in FrameType]
+    try:
+        while offset < info.file_size:
+            file.seek(offset)
+            frame_type = bytes_to_int(file.read(1))
+            if frame_type not in valid_frame_types:
+                raise ValueError(f"Unexpected frame_type at offset {offset}: {frame_type}")
+            frame_size = bytes_to_int(file.read(4))
+            entries.append((offset, frame_type, frame_size))
+            offset += 5 + frame_size
+    finally:
+        file.seek(position)
+    return np.array(entries, dtype=ENTRY_DTYPE)
+
+
+def index_path(dum_path: str) -> str:
+    return dum_path + ".idx"
+
+
+def write_frame_index(path: str, index: FrameIndex, dum_path: str):
+    stat = os.stat(dum_path)
+    with open(path, "wb") as file:
+        file.write(INDEX_MAGIC_STRING)
+        # The index is only valid for the exact file it was built from
+        file.write(stat.st_size.to_bytes(8, byteorder="big"))
+        file.write(stat.st_mtime_ns.to_bytes(8, byteorder="big"))
+        file.write(uint32_to_bytes(len(index)))
+        file.write(index.entries.tobytes())
+
+
+def read_frame_index(path: str, dum_path: str) -> Optional[FrameIndex]:
+    """Returns the index stored at the path, or None if it's missing or out of date."""
+    try:
+        with open(path, "rb") as file:
+            if file.read(4) != INDEX_MAGIC_STRING:
+                return None
+            stat = os.stat(dum_path)
+            if bytes_to_int(file.read(8)) != stat.st_size or bytes_to_int(file.read(8)) != stat.st_mtime_ns:
+                debug(f"Frame index {path} is out of date")
+                return None
+            num_frames = bytes_to_int(file.read(4))
+            data = file.read(num_frames * ENTRY_DTYPE.itemsize)
+    except (OSError, ReadError):
+        return None
+    if len(data) != num_frames * ENTRY_DTYPE.itemsize:
+        return None
+    return FrameIndex(np.frombuffer(data, dtype=ENTRY_DTYPE))
+
+
+def load_frame_index(dum_path: str, file: BinaryIO, info: DumInfo) -> FrameIndex:
+    """Reads the sidecar index of the file, or builds it and tries to cache it next to the file."""
+    path = index_path(dum_path)
+    index = read_frame_index(path, dum_path)
+    if index is None or (info.num_frames is not None and len(index) != info.num_frames):
+        index = build_frame_index(file, info)
+        try:
+            write_frame_index(path, index, dum_path)
+        except OSError as e:
+            debug(f"Couldn't cache frame index at {path}: {e}")
+    return index
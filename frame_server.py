@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import asdict
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+
+from format import Decoder
+from frame_index import FrameIndex, build_frame_index
+from header import DumInfo, read_header
+from io_utils import uint8_to_bytes, uint32_to_bytes, bytes_to_int
+from mapped_file import MappedFile
+
+DEBUG = False
+
+# Requests are single lines of JSON:
+#   {"file": "clip.dum", "frame": 12}   the frame at an index
+#   {"file": "clip.dum", "time": 1.5}   the frame shown at a time, in seconds
+#   {"file": "clip.dum", "info": true}  the header of the file
+# Every response is a status (1), a size (4) and then a payload of that size.
+STATUS_FRAME = 0  # payload: frame_index (4) followed by the BGR pixels
+STATUS_INFO = 1  # payload: the header as JSON
+STATUS_ERROR = 2  # payload: an error message
+
+# How many decoders may be open at once for each file
+DEFAULT_DECODERS_PER_FILE = 4
+# How many requests of a client may be in progress at once. Beyond that, the client's requests aren't read until
+# earlier responses have been written.
+DEFAULT_MAX_PENDING_REQUESTS = 4
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class RequestError(Exception):
+    pass
+
+
+class DecoderPool:
+    """Decoders of one file, each with a file of its own, so that they can be used at the same time. Decoders are
+    opened as they are needed, up to max_decoders, and reused. The frame index is shared between them. Files are
+    opened on the executor, as mapping them and reading their headers is I/O."""
+
+    def __init__(self, path: str, max_decoders: int, executor: Executor):
+        self.path = path
+        self._executor = executor
+        self._files: List[MappedFile] = []
+        self._idle: List[Decoder] = []
+        self._available = asyncio.Semaphore(max_decoders)
+        self.info: Optional[DumInfo] = None
+        self.num_frames = 0
+        self._frame_index: Optional[FrameIndex] = None
+        # Done when open() has returned
+        self.opened: Optional[asyncio.Future] = None
+
+    def open(self):
+        decoder = self._open_decoder()
+        self.info = decoder.info
+        self.num_frames = len(self._frame_index)
+        self._idle.append(decoder)
+
+    async def acquire(self, frame_index: int) -> Decoder:
+        await self._available.acquire()
+        # A decoder that will read the frame next doesn't have to seek or decode any frames before it
+        for i, decoder in enumerate(self._idle):
+            if decoder.position == frame_index:
+                return self._idle.pop(i)
+        if self._idle:
+            return self._idle.pop()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._open_decoder)
+        except BaseException:
+            # Otherwise every failure would leave the pool with one decoder less
+            self._available.release()
+            raise
+
+    def release(self, decoder: Decoder):
+        self._idle.append(decoder)
+        self._available.release()
+
+    def close(self):
+        for file in self._files:
+            file.close()
+
+    def _open_decoder(self) -> Decoder:
+        debug(f"Opening decoder {len(self._files) + 1} of {self.path}")
+        file = MappedFile(self.path)
+        try:
+            info = read_header(file)
+            if self._frame_index is None:
+                self._frame_index = build_frame_index(file, info)
+        except Exception:
+            file.close()
+            raise
+        self._files.append(file)
+        return Decoder(file, info, self._frame_index)
+
+
+class FrameServer:
+    """Serves the frames of the DUM files in a directory over TCP or Unix sockets. Frames are decoded on an
+    executor, so that the event loop is never blocked by decoding."""
+
+    def __init__(self, root: str, executor: Optional[Executor] = None,
+        decoders_per_file: int = DEFAULT_DECODERS_PER_FILE, max_pending_requests: int = DEFAULT_MAX_PENDING_REQUESTS):
+        self._root = os.path.realpath(root)
+        self._executor = executor or ThreadPoolExecutor()
+        self._owns_executor = executor is None
+        self._decoders_per_file = decoders_per_file
+        self._max_pending_requests = max_pending_requests
+        self._pools: Dict[str, DecoderPool] = {}
+        self._servers: List[asyncio.AbstractServer] = []
+        self._client_tasks: Set[asyncio.Task] = set()
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> Tuple[str, int]:
+        """Returns the address that the server listens on."""
+        server = await asyncio.start_server(self._handle_client, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path: str):
+        self._servers.append(await asyncio.start_unix_server(self._handle_client, path))
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        for task in self._client_tasks:
+            task.cancel()
+        await asyncio.gather(*self._client_tasks)
+        for pool in self._pools.values():
+            pool.close()
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        try:
+            await self._serve_client(reader, writer)
+        except asyncio.CancelledError:
+            # The server is closing
+            writer.close()
+        finally:
+            self._client_tasks.discard(task)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Responses are written in the order of the requests. The queue holds the requests in progress, and as it's
+        # bounded, a client that doesn't read its responses soon stops having its requests read.
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self._max_pending_requests)
+        response_writer = asyncio.ensure_future(self._write_responses(pending, writer))
+        try:
+            while not response_writer.done():
+                line = await reader.readline()
+                if not line:
+                    break
+                await pending.put(asyncio.ensure_future(self._respond(line)))
+        except ConnectionError:
+            debug("Client disconnected")
+        except asyncio.CancelledError:
+            response_writer.cancel()
+            raise
+        await pending.put(None)
+        await response_writer
+        writer.close()
+
+    async def _write_responses(self, pending: asyncio.Queue, writer: asyncio.StreamWriter):
+        disconnected = False
+        while True:
+            response = await pending.get()
+            if response is None:
+                return
+            if disconnected:
+                # Nobody is waiting for the response any more
+                response.cancel()
+                continue
+            status, payload = await response
+            try:
+                writer.write(uint8_to_bytes(status) + uint32_to_bytes(sum(len(part) for part in payload)))
+                for part in payload:
+                    writer.write(part)
+                await writer.drain()
+            except ConnectionError:
+                debug("Client disconnected")
+                disconnected = True
+
+    async def _respond(self, line: bytes) -> Tuple[int, List[bytes]]:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("A request must be a JSON object")
+            pool = await self._pool(request.get("file"))
+            if request.get("info"):
+                return STATUS_INFO, [json.dumps(asdict(pool.info)).encode()]
+            frame_index = _requested_frame(request, pool.info, pool.num_frames)
+            decoder = await pool.acquire(frame_index)
+            decoding = asyncio.get_running_loop().run_in_executor(self._executor, decoder.get_frame, frame_index)
+            # If the request is cancelled, the decoder is still in use until the executor is done with it
+            decoding.add_done_callback(partial(_release_decoder, pool, decoder))
+            frame = await asyncio.shield(decoding)
+            return STATUS_FRAME, [uint32_to_bytes(frame_index), frame]
+        except Exception as e:
+            # Also files that can't be decoded only fail the request, not the server
+            debug(f"Failed request {line}: {e}")
+            return STATUS_ERROR, [str(e).encode()]
+
+    async def _pool(self, name) -> DecoderPool:
+        if not isinstance(name, str):
+            raise RequestError("The request must name a file")
+        path = os.path.realpath(os.path.join(self._root, name))
+        if os.path.commonpath([path, self._root]) != self._root:
+            raise RequestError(f"Not a file in the served directory: {name}")
+        pool = self._pools.get(path)
+        if pool is None:
+            if not os.path.isfile(path):
+                raise RequestError(f"No such file: {name}")
+            pool = self._pools[path] = DecoderPool(path, self._decoders_per_file, self._executor)
+            # Opening the file scans its frames. Requests for it that come in meanwhile wait for the same future.
+            pool.opened = asyncio.get_running_loop().run_in_executor(self._executor, pool.open)
+        try:
+            await pool.opened
+        except Exception:
+            self._pools.pop(path, None)
+            raise
+        return pool
+
+
+def _release_decoder(pool: DecoderPool, decoder: Decoder, decoding: asyncio.Future):
+    if not decoding.cancelled() and decoding.exception() is not None:
+        debug(f"Failed to decode: {decoding.exception()}")
+    pool.release(decoder)
+
+
+def _requested_frame(request: dict, info: DumInfo, num_frames: int) -> int:
+    if "frame" in request:
+        frame_index = request["frame"]
+    elif "time" in request:
+        frame_index = int(request["time"] * info.frame_rate)
+    else:
+        raise RequestError("The request must have a frame, a time or info")
+    if not isinstance(frame_index, int) or not 0 <= frame_index < num_frames:
+        raise RequestError(f"No such frame: {frame_index}")
+    return frame_index
+
+
+class FrameClient:
+    """A client of FrameServer. Requests may be sent before the responses to earlier ones have been read."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @staticmethod
+    async def connect_tcp(host: str, port: int) -> "FrameClient":
+        return FrameClient(*await asyncio.open_connection(host, port))
+
+    @staticmethod
+    async def connect_unix(path: str) -> "FrameClient":
+        return FrameClient(*await asyncio.open_unix_connection(path))
+
+    async def get_frame(self, file: str, frame_index: int) -> Tuple[int, bytes]:
+        """Returns the index and the BGR pixels of the frame."""
+        self.send({"file": file, "frame": frame_index})
+        return await self.read_frame()
+
+    async def get_frame_at(self, file: str, time: float) -> Tuple[int, bytes]:
+        self.send({"file": file, "time": time})
+        return await self.read_frame()
+
+    async def info(self, file: str) -> DumInfo:
+        self.send({"file": file, "info": True})
+        status, payload = await self.read_response()
+        if status != STATUS_INFO:
+            raise Exception(f"Expected info but got status {status}")
+        return DumInfo(**json.loads(payload))
+
+    def send(self, request: dict):
+        self._writer.write(json.dumps(request).encode() + b"\n")
+
+    async def read_frame(self) -> Tuple[int, bytes]:
+        status, payload = await self.read_response()
+        if status != STATUS_FRAME:
+            raise Exception(f"Expected a frame but got status {status}")
+        return bytes_to_int(payload[:4]), payload[4:]
+
+    async def read_response(self) -> Tuple[int, bytes]:
+        header = await self._reader.readexactly(5)
+        status = header[0]
+        payload = await self._reader.readexactly(bytes_to_int(header[1:]))
+        if status == STATUS_ERROR:
+            raise RequestError(payload.decode())
+        return status, payload
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+async def serve(root: str, host: str, port: int, unix_path: Optional[str]):
+    server = FrameServer(root)
+    if unix_path:
+        await server.start_unix(unix_path)
+        print(f"Serving {root} at {unix_path}")
+    else:
+        host, port = await server.start_tcp(host, port)
+        print(f"Serving {root} at {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the frames of the DUM files in a directory")
+    parser.add_argument("root", help="the directory with the DUM files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="listen on this Unix socket instead of TCP")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.root, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
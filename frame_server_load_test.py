@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from time import perf_counter
+from typing import List, Optional
+
+from frame_server import FrameServer, FrameClient
+
+# The share of requests that are for a random frame, instead of the frame after the previous one
+DEFAULT_RANDOM_ACCESS = 0.1
+
+
+async def run_client(client: FrameClient, file: str, num_frames: int, num_requests: int, random_access: float,
+    latencies: List[float]):
+    frame_index = random.randrange(num_frames)
+    for _ in range(num_requests):
+        if random.random() < random_access:
+            frame_index = random.randrange(num_frames)
+        start = perf_counter()
+        await client.get_frame(file, frame_index)
+        latencies.append(perf_counter() - start)
+        frame_index = (frame_index + 1) % num_frames
+
+
+def percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+async def load_test(files: List[str], num_clients: int, num_requests: int, random_access: float,
+    address: Optional[str]):
+    root = os.path.dirname(os.path.abspath(files[0]))
+    names = [os.path.relpath(os.path.abspath(file), root) for file in files]
+    server = None
+    with tempfile.TemporaryDirectory() as socket_dir:
+        if address is None:
+            # Serve the files from this process
+            address = os.path.join(socket_dir, "frame_server.sock")
+            server = FrameServer(root)
+            await server.start_unix(address)
+        try:
+            async def connect() -> FrameClient:
+                if ":" in address:
+                    host, port = address.rsplit(":", 1)
+                    return await FrameClient.connect_tcp(host, int(port))
+                return await FrameClient.connect_unix(address)
+
+            clients = [await connect() for _ in range(num_clients)]
+            num_frames = {name: (await clients[0].info(name)).num_frames for name in names}
+            latencies = []
+            start = perf_counter()
+            await asyncio.gather(*(run_client(client, names[i % len(names)], num_frames[names[i % len(names)]],
+                                              num_requests, random_access, latencies)
+                                   for i, client in enumerate(clients)))
+            seconds = perf_counter() - start
+            for client in clients:
+                await client.close()
+        finally:
+            if server is not None:
+                await server.close()
+
+    print(f"{len(latencies)} frames in {seconds:.2f}s: {len(latencies) / seconds:.1f} frames/s")
+    print(f"Latency: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms,"
+          f" max {max(latencies) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the frame rate and latency of a frame server")
+    parser.add_argument("files", nargs="+", help="DUM files in one directory, that the clients request frames of")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="how many frames each client requests")
+    parser.add_argument("--random-access", type=float, default=DEFAULT_RANDOM_ACCESS,
+                        help="the share of requests that are for a random frame instead of the next one")
+    parser.add_argument("--address", help="HOST:PORT or a Unix socket path of a running server, whose directory "
+                                          "has the files (default: serve the files from this process)")
+    args = parser.parse_args()
+    asyncio.run(load_test(args.files, args.clients, args.requests, args.random_access, args.address))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,17 @@
 from dataclasses import dataclass
-from typing import BinaryIO, Tuple
+from typing import BinaryIO, Tuple, Optional
 
 from io_utils import uint8_to_bytes, uint16_to_bytes, uint32_to_bytes, bytes_to_int
 
 
+# Where num_frames is stored, counted from the start of the header
+NUM_FRAMES_OFFSET = 11
+
+# Stored as num_frames when the number of frames wasn't known when the header was written. The frames then go on
+# until the end of the file.
+UNKNOWN_NUM_FRAMES = 0xFFFFFFFF
+
+
 @dataclass
 class DumInfo:
     frame_rate: int
@@ -11,13 +19,15 @@ class DumInfo:
     height: int
     hor_scaling: int
     ver_scaling: int
-    num_frames: int
+    # None if unknown
+    num_frames: Optional[int]
     first_frame_offset: int
-    file_size: int
+    # None if the file isn't seekable
+    file_size: Optional[int]
 
 
 def write_header(file: BinaryIO, frame_rate: int, resolution: Tuple[int, int], scaling: Tuple[int, int],
-    num_frames: int):
+    num_frames: Optional[int]):
     if resolution[0] % 4 != 0 or resolution[1] % 4 != 0:
         raise ValueError(f"Width and height must be multiples of 4! (Got: {resolution})")
 
@@ -37,16 +47,25 @@ def write_header(file: BinaryIO, frame_rate: int, resolution: Tuple[int, int], s
     # vertical scale
     file.write(uint8_to_bytes(scaling[1]))
 
+    file.write(uint32_to_bytes(num_frames if num_frames is not None else UNKNOWN_NUM_FRAMES))
+
+
+def write_num_frames(file: BinaryIO, num_frames: int, header_offset: int = 0):
+    """Overwrites num_frames in a header that has already been written. The file position is restored."""
+    position = file.tell()
+    file.seek(header_offset + NUM_FRAMES_OFFSET)
     file.write(uint32_to_bytes(num_frames))
+    file.seek(position)
 
 
 def read_header(file: BinaryIO) -> DumInfo:
-    offset = file.tell()
-    if offset != 0:
-        raise Exception(f"You must be at the file beginning to read header. Offset={offset}")
-    file.seek(0, 2)
-    file_size = file.tell()
-    file.seek(0, 0)
+    """Reads the header at the current position. Files that can't seek, like pipes, are only read from."""
+    offset = 0
+    file_size = None
+    if file.seekable():
+        offset = file.tell()
+        file_size = file.seek(0, 2)
+        file.seek(offset)
 
     header_size = 0
 
@@ -68,5 +87,7 @@ def read_header(file: BinaryIO) -> DumInfo:
     ver_scaling = read(1)
 
     num_frames = read(4)
+    if num_frames == UNKNOWN_NUM_FRAMES:
+        num_frames = None
 
-    return DumInfo(frame_rate, width, height, hor_scaling, ver_scaling, num_frames, header_size, file_size)
+    return DumInfo(frame_rate, width, height, hor_scaling, ver_scaling, num_frames, offset + header_size, file_size)
@@ -1,7 +1,17 @@
-from typing import Tuple, BinaryIO
+from itertools import chain
+from typing import Tuple, BinaryIO, List, Union
+
+import numpy as np
 
 Color = Tuple[int, int, int]
 
+# Pixels of a frame, row by row. Either RGB tuples, packed RGB bytes (or any other object supporting the buffer
+# protocol), or a uint8 array of shape (H, W, 3) or (N, 3).
+Pixels = Union[List[Color], bytes, bytearray, memoryview, np.ndarray]
+
+# Encoders go through frames in chunks of this many pixels, so that their temporary arrays stay small
+PIXELS_PER_CHUNK = 1 << 16
+
 
 def uint8_to_bytes(n: int) -> bytes:
     return n.to_bytes(1, byteorder="big")
@@ -39,3 +49,22 @@ def read_rgb(file: BinaryIO) -> Color:
     if len(buf) != 3:
         raise ReadError(f"Expected 3 bytes but only got {len(buf)}")
     return buf[0], buf[1], buf[2]
+
+
+def rgb_array(pixels: Pixels) -> np.ndarray:
+    """Returns the pixels as an (N, 3) array of RGB values. Buffers and arrays are not copied."""
+    if isinstance(pixels, np.ndarray):
+        if pixels.dtype != np.uint8:
+            raise TypeError(f"Expected an array of uint8 but got {pixels.dtype}")
+        array = pixels
+    elif isinstance(pixels, list):
+        # List of RGB tuples
+        array = np.fromiter(chain.from_iterable(pixels), dtype=np.uint8, count=len(pixels) * 3)
+    else:
+        try:
+            array = np.frombuffer(memoryview(pixels).cast("B"), dtype=np.uint8)
+        except TypeError:
+            array = np.fromiter(chain.from_iterable(pixels), dtype=np.uint8)
+    if array.size % 3 != 0:
+        raise ValueError(f"Expected packed RGB values, but got {array.size} bytes")
+    return array.reshape(-1, 3)
@@ -0,0 +1,67 @@
+import mmap
+import os
+
+DEBUG = False
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class MappedFile:
+    """A read-only file that is memory-mapped. It can be used in place of a binary file opened for reading, but
+    read() returns memoryview slices of the mapping instead of copying the data into new bytes objects.
+
+    The slices stay valid for as long as they are referenced, even after the file has been closed."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            # Empty files can't be mapped
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+        self._position = 0
+
+    def read(self, size: int = -1) -> memoryview:
+        start = min(self._position, len(self._view))
+        end = len(self._view) if size < 0 else min(start + size, len(self._view))
+        self._position = end
+        return self._view[start:end]
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        return self._position
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Frames that are still in use keep the mapping alive. It's closed once they're garbage collected.
+            debug("Can't close mapping yet, as frames still reference it")
+        self._mmap = None
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,114 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Deque, Optional, Tuple
+
+import numpy as np
+
+from codec.repeated import write_repeated_frame
+from format import Quality, encode_frame, frame_array
+from header import write_header, write_num_frames
+from io_utils import Pixels
+
+DEBUG = False
+
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class ParallelEncoder:
+    """Like Encoder, but frames are encoded on a pool of processes. Frames are still written in order.
+
+    Every frame is encoded on its own, so apart from REPEATED frames, no DELTA frames are written. As many
+    frames are kept in flight as fit within max_memory bytes of pixel data. close() must be called (or the
+    encoder used as a context manager) to write the remaining frames."""
+
+    def __init__(self, file: BinaryIO, quality: Quality = Quality.LOSSLESS, max_workers: Optional[int] = None,
+        max_memory: int = DEFAULT_MAX_MEMORY, optimize_size: bool = False):
+        self._file = file
+        self._quality = quality
+        self._optimize_size = optimize_size
+        self._executor = ProcessPoolExecutor(max_workers)
+        self._max_memory = max_memory
+        self._max_in_flight = 1
+        self._resolution = None
+        self._has_written_header = False
+        self._header_offset = None
+        self._num_frames = None
+        self._frames_written = 0
+        self._previous_frame = None
+        self._in_flight: Deque[Future] = deque()
+
+    def write_header(self, frame_rate: int, resolution: Tuple[int, int], scaling: Tuple[int, int],
+        num_frames: Optional[int] = None):
+        if self._has_written_header:
+            raise Exception("Has already written header!")
+        if self._file.seekable():
+            self._header_offset = self._file.tell()
+        write_header(self._file, frame_rate, resolution, scaling, num_frames)
+        self._num_frames = num_frames
+        frame_memory = resolution[0] * resolution[1] * 3
+        self._max_in_flight = max(1, self._max_memory // frame_memory)
+        self._resolution = resolution
+        debug(f"Keeping at most {self._max_in_flight} frames in flight")
+        self._has_written_header = True
+
+    def write_frame(self, pixels: Pixels):
+        if not self._has_written_header:
+            raise Exception("Must write header before writing frames!")
+        pixels = frame_array(pixels, self._resolution)
+        self._frames_written += 1
+        if self._previous_frame is not None and np.array_equal(self._previous_frame, pixels):
+            self._in_flight.append(_repeated_frame())
+        else:
+            self._previous_frame = pixels
+            self._in_flight.append(self._executor.submit(encode_frame, pixels, self._quality,
+                                                          self._optimize_size))
+        self._write_encoded_frames(max_in_flight=self._max_in_flight)
+
+    def close(self):
+        try:
+            self._write_encoded_frames(max_in_flight=0)
+        finally:
+            self._executor.shutdown()
+        if not self._has_written_header or self._frames_written == self._num_frames:
+            return
+        # The same as Encoder.close()
+        if self._header_offset is not None:
+            write_num_frames(self._file, self._frames_written, self._header_offset)
+        elif self._num_frames is not None:
+            raise Exception(f"Wrote {self._frames_written} frames, but the header says {self._num_frames}!")
+
+    @property
+    def frames_written(self) -> int:
+        return self._frames_written
+
+    def _write_encoded_frames(self, max_in_flight: int):
+        # Frames are written as soon as they, and all frames before them, are done. If too many frames are in
+        # flight, this waits for the oldest one.
+        while self._in_flight and (len(self._in_flight) > max_in_flight or self._in_flight[0].done()):
+            self._file.write(self._in_flight.popleft().result())
+
+    def __enter__(self) -> "ParallelEncoder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The same as Encoder: the header isn't fixed up after an error
+            for future in self._in_flight:
+                future.cancel()
+            self._executor.shutdown()
+
+
+def _repeated_frame() -> Future:
+    buf = BytesIO()
+    write_repeated_frame(buf)
+    future = Future()
+    future.set_result(buf.getvalue())
+    return future
@@ -1,28 +1,266 @@
 #!/usr/bin/env python3
+import argparse
+import struct
 import sys
+from dataclasses import dataclass
+from datetime import timedelta
+from time import perf_counter
+from typing import List, Optional, Tuple
 
+import numpy as np
+
+from codec.colormapped import MAX_COLORS
+from codec.sliced import SLICE_ENTRY_SIZE
 from common import FrameType
-from format import Decoder
-from header import read_header
+from frame_index import ENTRY_DTYPE
+from header import DumInfo, read_header
+from mapped_file import MappedFile
+
+DEBUG = False
+
+FRAME_HEADER = struct.Struct(">BI")
+# x, y, width and height of a rect, followed by the frame header of its patch
+DELTA_RECT = struct.Struct(">HHHHBI")
+SLICE_ENTRY = struct.Struct(">HI")
+VALID_FRAME_TYPES = {t.value for t in FrameType}
+# Most frames of long files are repeated, so they are checked first
+REPEATED = FrameType.REPEATED.value
+# Frame types that patches of DELTA frames and slices of SLICED frames may have
+INTRA_FRAME_TYPES = {FrameType.RAW.value, FrameType.COLOR_MAPPED.value, FrameType.QUANTIZED_TO_16_BIT.value,
+                     FrameType.QUANTIZED_TO_8_BIT.value}
+
+DEFAULT_LARGEST_FRAMES = 10
+# The bitrate is listed for at most this many intervals, unless an interval is given
+MAX_BITRATE_ROWS = 20
+BAR_WIDTH = 40
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
 
 
-def parse_file(path: str):
-    with open(path, "rb") as file:
+@dataclass
+class ScanResult:
+    info: DumInfo
+    file_size: int
+    # One entry per frame that was found, as in a frame index
+    entries: np.ndarray
+    problems: List[str]
+
+
+def scan_file(path: str) -> ScanResult:
+    """Walks the frame headers of a file, which is memory-mapped so that only the headers are read, and checks
+    that every frame is as large as its type implies and that the file ends right after the last frame."""
+    with MappedFile(path) as file:
         info = read_header(file)
-        decoder = Decoder(file, info)
-        print(f"{info}")
-        for _ in range(info.num_frames):
-            frame_type, frame_size = decoder.skip_frame()
+        file.seek(0)
+        view = file.read()
+        try:
+            return _scan(view, info)
+        finally:
+            view.release()
+
+
+def _scan(view: memoryview, info: DumInfo) -> ScanResult:
+    resolution = (info.width, info.height)
+    offsets, frame_types, frame_sizes = [], [], []
+    problems = []
+    offset = info.first_frame_offset
+    end_of_file = len(view)
+    while offset < end_of_file and (info.num_frames is None or len(offsets) < info.num_frames):
+        frame_index = len(offsets)
+        if offset + FRAME_HEADER.size > end_of_file:
+            problems.append(f"Frame {frame_index} at offset {offset}: the frame header is cut off")
+            break
+        frame_type, frame_size = FRAME_HEADER.unpack_from(view, offset)
+        if frame_type not in VALID_FRAME_TYPES:
+            # Where the next frame starts can't be known
+            problems.append(f"Frame {frame_index} at offset {offset}: unexpected frame type {frame_type}")
+            break
+        start = offset + FRAME_HEADER.size
+        if start + frame_size > end_of_file:
+            problems.append(f"Frame {frame_index} at offset {offset}: {frame_size} bytes, but the file ends "
+                            f"after {end_of_file - start}")
+            break
+        problem = _check_frame(view, start, frame_type, frame_size, resolution)
+        if problem:
+            problems.append(f"Frame {frame_index} at offset {offset}: {problem}")
+        offsets.append(offset)
+        frame_types.append(frame_type)
+        frame_sizes.append(frame_size)
+        offset = start + frame_size
+    else:
+        if info.num_frames is not None and len(offsets) < info.num_frames:
+            problems.append(f"The header says there are {info.num_frames} frames, but the file ends after "
+                            f"{len(offsets)}")
+        elif offset < end_of_file:
+            problems.append(f"{end_of_file - offset} bytes after the last frame, at offset {offset}")
+
+    entries = np.zeros(len(offsets), dtype=ENTRY_DTYPE)
+    entries["offset"] = offsets
+    entries["frame_type"] = frame_types
+    entries["frame_size"] = frame_sizes
+    return ScanResult(info, end_of_file, entries, problems)
+
+
+def _check_frame(view: memoryview, start: int, frame_type: int, frame_size: int, resolution: Tuple[int, int],
+    intra_only: bool = False) -> Optional[str]:
+    """Returns what is wrong with the frame whose data starts at start, if anything."""
+    if intra_only and frame_type not in INTRA_FRAME_TYPES:
+        return f"{FrameType(frame_type).name} frame can't be nested"
+    num_pixels = resolution[0] * resolution[1]
+    if frame_type == REPEATED:
+        expected_size = 0
+    elif frame_type == FrameType.RAW.value:
+        expected_size = num_pixels * 3
+    elif frame_type == FrameType.COLOR_MAPPED.value:
+        if frame_size == 0:
+            return "COLOR_MAPPED frame without a color map"
+        num_colors = view[start]
+        if num_colors > MAX_COLORS:
+            return f"COLOR_MAPPED frame with {num_colors} colors"
+        expected_size = 1 + num_colors * 3 + num_pixels
+    elif frame_type == FrameType.QUANTIZED_TO_16_BIT.value:
+        # Made of 2-byte codes
+        if frame_size == 0 or frame_size % 2:
+            return f"QUANTIZED_TO_16_BIT frame of {frame_size} bytes"
+        return None
+    elif frame_type == FrameType.QUANTIZED_TO_8_BIT.value:
+        return "QUANTIZED_TO_8_BIT frame of 0 bytes" if frame_size == 0 else None
+    elif frame_type == FrameType.DELTA.value:
+        return _check_delta_frame(view, start, frame_size, resolution)
+    else:
+        return _check_sliced_frame(view, start, frame_size, resolution)
+    if frame_size != expected_size:
+        return f"{FrameType(frame_type).name} frame of {frame_size} bytes, expected {expected_size}"
+    return None
+
+
+def _check_delta_frame(view: memoryview, start: int, frame_size: int, resolution: Tuple[int, int]) -> Optional[str]:
+    end = start + frame_size
+    if frame_size < 2:
+        return "DELTA frame without a number of rects"
+    num_rects = int.from_bytes(view[start:start + 2], byteorder="big")
+    position = start + 2
+    for i in range(num_rects):
+        if position + DELTA_RECT.size > end:
+            return f"DELTA frame with rect {i} cut off"
+        x, y, width, height, patch_type, patch_size = DELTA_RECT.unpack_from(view, position)
+        if x + width > resolution[0] or y + height > resolution[1]:
+            return f"DELTA frame with rect {i} ({x}, {y}, {width}, {height}) outside of the frame"
+        position += DELTA_RECT.size
+        if patch_type not in VALID_FRAME_TYPES or position + patch_size > end:
+            return f"DELTA frame with patch {i} cut off or of unexpected frame type {patch_type}"
+        problem = _check_frame(view, position, patch_type, patch_size, (width, height), intra_only=True)
+        if problem:
+            return f"DELTA frame with patch {i}: {problem}"
+        position += patch_size
+    if position != end:
+        return f"DELTA frame with {end - position} bytes after the last rect"
+    return None
+
+
+def _check_sliced_frame(view: memoryview, start: int, frame_size: int, resolution: Tuple[int, int]) -> Optional[str]:
+    end = start + frame_size
+    if frame_size < 2:
+        return "SLICED frame without a number of slices"
+    num_slices = int.from_bytes(view[start:start + 2], byteorder="big")
+    data_start = start + 2 + num_slices * SLICE_ENTRY_SIZE
+    if data_start > end:
+        return f"SLICED frame with its table of {num_slices} slices cut off"
+    slices = [SLICE_ENTRY.unpack_from(view, start + 2 + i * SLICE_ENTRY_SIZE) for i in range(num_slices)]
+    num_rows = sum(rows for rows, _ in slices)
+    if num_rows != resolution[1]:
+        return f"SLICED frame with slices of {num_rows} rows, expected {resolution[1]}"
+    slice_ends = [data_start + offset for _, offset in slices[1:]] + [end]
+    for i, ((rows, offset), slice_end) in enumerate(zip(slices, slice_ends)):
+        position = data_start + offset
+        if position + FRAME_HEADER.size > slice_end or slice_end > end:
+            return f"SLICED frame with slice {i} cut off"
+        slice_type, slice_size = FRAME_HEADER.unpack_from(view, position)
+        if slice_type not in VALID_FRAME_TYPES:
+            return f"SLICED frame with slice {i} of unexpected frame type {slice_type}"
+        if position + FRAME_HEADER.size + slice_size != slice_end:
+            return f"SLICED frame with slice {i} of {slice_size} bytes, expected {slice_end - position - FRAME_HEADER.size}"
+        problem = _check_frame(view, position + FRAME_HEADER.size, slice_type, slice_size, (resolution[0], rows),
+                               intra_only=True)
+        if problem:
+            return f"SLICED frame with slice {i}: {problem}"
+    return None
+
+
+def format_report(result: ScanResult, num_largest: int = DEFAULT_LARGEST_FRAMES,
+    interval: Optional[float] = None) -> str:
+    """Summarizes the frame types, the bitrate over time and the largest frames of the file."""
+    entries = result.entries
+    num_frames = len(entries)
+    frame_rate = result.info.frame_rate or 1
+    # Frame headers count towards the size of the frames
+    sizes = entries["frame_size"].astype(np.int64) + FRAME_HEADER.size
+    lines = [f"{result.info}", f"{num_frames} frames, {result.file_size / 1e6:.1f} MB, "
+                                f"{timedelta(seconds=round(num_frames / frame_rate))}"]
+    if num_frames == 0:
+        return "\n".join(lines)
+
+    lines.append("Frame types:")
+    for frame_type in FrameType:
+        is_type = entries["frame_type"] == frame_type.value
+        count = int(is_type.sum())
+        if count:
+            type_bytes = int(sizes[is_type].sum())
+            lines.append(f"  {frame_type.name:<20} {count:>9} {100 * count / num_frames:5.1f}% "
+                         f"{type_bytes / 1e6:9.1f} MB {type_bytes / count / 1e3:9.1f} kB/frame")
+    num_repeated = int((entries["frame_type"] == FrameType.REPEATED.value).sum())
+    lines.append(f"REPEATED ratio: {num_repeated / num_frames:.3f}")
+
+    duration = num_frames / frame_rate
+    if interval is None:
+        interval = max(1, -(-duration // MAX_BITRATE_ROWS))
+    frames_per_interval = max(1, round(interval * frame_rate))
+    interval_bytes = np.add.reduceat(sizes, np.arange(0, num_frames, frames_per_interval))
+    kbits = interval_bytes * 8 / 1e3 / (frames_per_interval / frame_rate)
+    lines.append(f"Bitrate per {frames_per_interval / frame_rate:g}s (kbit/s): min {kbits.min():.0f}, "
+                 f"mean {sizes.sum() * 8 / 1e3 / duration:.0f}, max {kbits.max():.0f}")
+    for i, kbit in enumerate(kbits):
+        bar = "#" * round(BAR_WIDTH * kbit / kbits.max()) if kbits.max() else ""
+        lines.append(f"  {str(timedelta(seconds=round(i * frames_per_interval / frame_rate))):>9} {kbit:10.0f} {bar}")
+
+    lines.append("Largest frames:")
+    for frame_index in np.argsort(-sizes, kind="stable")[:num_largest]:
+        lines.append(f"  frame {frame_index:>9} at {timedelta(seconds=round(frame_index / frame_rate))}: "
+                     f"{FrameType(entries['frame_type'][frame_index]).name} ({sizes[frame_index]}B)")
+    return "\n".join(lines)
+
+
+def parse_file(path: str, summary: bool, num_largest: int, interval: Optional[float]) -> bool:
+    """Prints the frames of the file, or a summary of them, followed by any problems that were found. Returns
+    whether the file is valid."""
+    start = perf_counter()
+    result = scan_file(path)
+    seconds = perf_counter() - start
+    if summary:
+        print(format_report(result, num_largest, interval))
+    else:
+        print(f"{result.info}")
+        for frame_type, frame_size in zip(result.entries["frame_type"], result.entries["frame_size"]):
             print(f"{FrameType(frame_type)} ({frame_size}B)")
-        print(f"Seeked through all {info.num_frames} frames.")
+    print(f"Scanned {len(result.entries)} frames in {seconds:.3f}s")
+    for problem in result.problems:
+        print(f"PROBLEM: {problem}")
+    return not result.problems
 
 
 def main():
-    args = sys.argv[1:]
-    if not args:
-        print(f"Usage: {sys.argv[0]} FILE")
-        return
-    parse_file(args[0])
+    parser = argparse.ArgumentParser(description="List the frames of a DUM file and check its integrity")
+    parser.add_argument("file")
+    parser.add_argument("--summary", action="store_true",
+                        help="instead of every frame, print the frame types, the bitrate and the largest frames")
+    parser.add_argument("--largest", type=int, default=DEFAULT_LARGEST_FRAMES, help="how many largest frames to list")
+    parser.add_argument("--interval", type=float, help="seconds per bitrate measurement")
+    args = parser.parse_args()
+    if not parse_file(args.file, args.summary, args.largest, args.interval):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
+import os
 import sys
-from typing import List, Tuple, BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, BinaryIO, Optional
 
 import pygame
 from pygame.rect import Rect
@@ -8,10 +10,21 @@ from pygame.surface import Surface
 from pygame.time import Clock
 
 from format import Decoder
+from frame_cache import FrameCache
+from frame_index import load_frame_index
 from header import read_header
+from mapped_file import MappedFile
+from prefetch import FramePrefetcher, PlaybackClock
+from pygame_utils import bgr_frame_to_surface, BGR_MASKS
 
 DEBUG = False
 LOOP = True
+# How many frames are decoded ahead of the one being shown
+PREFETCH_DEPTH = 8
+# How many bytes of decoded frames are kept, so that looping and seeking back doesn't decode them again
+FRAME_CACHE_SIZE = 256 * 1024 * 1024
+# How many threads decode the slices of SLICED frames
+SLICE_DECODE_THREADS = os.cpu_count()
 
 
 def debug(text: str):
@@ -36,17 +49,48 @@ class Seekbar:
         pygame.draw.rect(self.surface, cursor_color, cursor_rect)
 
 
-def play_file_at_path(path: str):
-    debug(f"Opening file {path}...")
-    with open(path, "rb") as file:
-        play_file(file, path)
+class FrameRenderer:
+    """Draws frames onto the screen. The same surfaces are reused for every frame, so that drawing doesn't allocate
+    any new frame-sized memory."""
+
+    def __init__(self, resolution: Tuple[int, int], scale: Tuple[int, int]):
+        self._resolution = resolution
+        self._frame_surface = Surface(resolution, depth=24, masks=BGR_MASKS)
+        self._scaled_size = (resolution[0] * scale[0], resolution[1] * scale[1])
+        self._scaled_surface = None
+        if scale != (1, 1):
+            # Scaling is nearest-neighbour, so with integer factors every pixel becomes an exact block of pixels
+            self._scaled_surface = Surface(self._scaled_size, depth=24, masks=BGR_MASKS)
 
+    def draw(self, screen: Surface, frame: bytes):
+        bgr_frame_to_surface(frame, self._resolution, self._frame_surface)
+        if self._scaled_surface is None:
+            screen.blit(self._frame_surface, (0, 0))
+        else:
+            pygame.transform.scale(self._frame_surface, self._scaled_size, self._scaled_surface)
+            screen.blit(self._scaled_surface, (0, 0))
 
-def play_file(file: BinaryIO, caption: str):
-    info = read_header(file)
-    decoder = Decoder(file, info)
 
-    debug(f"Parsed header. Video consists of {info.num_frames} frames")
+def play_file_at_path(path: str):
+    debug(f"Opening file {path}...")
+    with MappedFile(path) as file:
+        info = read_header(file)
+        frame_index = load_frame_index(path, file, info)
+        with ThreadPoolExecutor(SLICE_DECODE_THREADS) as executor:
+            play_file(file, path, Decoder(file, info, frame_index, FrameCache(FRAME_CACHE_SIZE), executor=executor))
+
+
+def play_file(file: BinaryIO, caption: str, decoder: Optional[Decoder] = None):
+    """Plays the file. Files that can't seek, like pipes, are played once from start to end."""
+    if decoder is None:
+        # Frames can only be read again from the cache if the file can seek
+        cache = FrameCache(FRAME_CACHE_SIZE) if file.seekable() else None
+        decoder = Decoder(file, read_header(file), cache=cache)
+    info = decoder.info
+    # Not known for files that can't seek, if the header doesn't say
+    num_frames = decoder.num_frames if decoder.seekable else info.num_frames
+
+    debug(f"Parsed header. Video consists of {num_frames} frames")
     pygame.init()
     screen_size = (max(info.width * info.hor_scaling, 256), max(info.height * info.ver_scaling, 256))
     screen = pygame.display.set_mode(screen_size)
@@ -61,42 +105,56 @@ def play_file(file: BinaryIO, caption: str):
     seekbar_rect = Rect(seekbar_pos, seekbar_size)
     seekbar = Seekbar(Surface(seekbar_size))
 
+    # Frames are decoded in the background, so that the render loop only has to draw them. The prefetcher also
+    # keeps the pace, dropping frames if decoding falls behind.
+    prefetcher = FramePrefetcher(decoder, depth=PREFETCH_DEPTH, loop=LOOP, clock=PlaybackClock(info.frame_rate))
+    renderer = FrameRenderer((info.width, info.height), (info.hor_scaling, info.ver_scaling))
     clock = Clock()
+    frame = None
     frame_i = 0
+    ticks = 0
     while True:
 
-        if LOOP and frame_i == info.num_frames:
-            decoder.seek_to_beginning()
-            frame_i = 0
-
-        clock.tick(info.frame_rate)
-        pygame.display.set_caption(f"{caption} ({(int(clock.get_fps()))})")
+        clock.tick()
+        ticks += 1
+        if ticks % max(info.frame_rate, 1) == 0:
+            # Once per second is plenty for showing the frame rate
+            pygame.display.set_caption(f"{caption} ({(int(clock.get_fps()))}) "
+                                       f"dropped: {prefetcher.dropped_frames}, late: {prefetcher.late_frames}")
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                exit_program()
+                exit_program(prefetcher)
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                exit_program()
-            if event.type == pygame.MOUSEBUTTONDOWN:
+                exit_program(prefetcher)
+            if event.type == pygame.MOUSEBUTTONDOWN and decoder.seekable:
                 if seekbar_rect.collidepoint(event.pos):
                     mouse_x = event.pos[0]
                     progress = (mouse_x - seekbar_rect.x) / seekbar_rect.w
                     debug(f"Seeking to progress: {progress}")
-                    frame_i = decoder.seek(progress)
+                    prefetcher.seek(progress)
+
+        next_frame = prefetcher.get()
+        if next_frame is not None:
+            frame_i, frame = next_frame
+        else:
+            # The end has been reached. Wait as long as a frame would have been shown.
+            pygame.time.wait(int(1000 / info.frame_rate))
+            if frame is None:
+                # The video has no frames
+                continue
 
         screen.fill((0, 0, 0))
 
-        frame = decoder.read_frame()
-
         debug(f"Time: {round(frame_i / info.frame_rate, 2)}s")
 
         # draw_frame(screen, pixel_rect, frame, (info.width, info.height))
-        fast_draw_bgr_frame(screen, frame, (info.width, info.height), (info.hor_scaling, info.ver_scaling))
-        seekbar.set_progress(frame_i / info.num_frames)
+        renderer.draw(screen, frame)
+        if num_frames:
+            seekbar.set_progress(frame_i / num_frames)
         seekbar.redraw()
         screen.blit(seekbar.surface, seekbar_pos)
         pygame.display.update()
-        frame_i += 1
 
 
 def draw_frame(screen: Surface, rect: Rect, frame: List[int], frame_resolution: Tuple[int, int]):
@@ -111,16 +169,8 @@ def draw_frame(screen: Surface, rect: Rect, frame: List[int], frame_resolution:
             pygame.draw.rect(screen, (r, g, b), rect)
 
 
-def fast_draw_bgr_frame(screen: Surface, frame: List[int], resolution: Tuple[int, int], scale: Tuple[int, int]):
-    frame_surface = Surface(resolution, depth=24)
-    view = frame_surface.get_view()
-    view.write(bytes(frame))
-    del view
-    frame_surface = pygame.transform.scale(frame_surface, (resolution[0] * scale[0], resolution[1] * scale[1]))
-    screen.blit(frame_surface, (0, 0))
-
-
-def exit_program():
+def exit_program(prefetcher: FramePrefetcher):
+    print(f"Dropped frames: {prefetcher.dropped_frames}, late frames: {prefetcher.late_frames}")
     debug("Exiting program.")
     pygame.quit()
     sys.exit(0)
@@ -129,9 +179,12 @@ def exit_program():
 def main():
     args = sys.argv[1:]
     if not args:
-        print(f"Usage: {sys.argv[0]} FILE")
+        print(f"Usage: {sys.argv[0]} FILE (or - to read from stdin)")
         return
-    play_file_at_path(args[0])
+    if args[0] == "-":
+        play_file(sys.stdin.buffer, "stdin")
+    else:
+        play_file_at_path(args[0])
 
 
 if __name__ == '__main__':
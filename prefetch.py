@@ -0,0 +1,212 @@
+import threading
+from queue import Queue, Empty, Full
+from time import perf_counter, sleep
+from typing import Callable, Optional, Tuple
+
+from format import Decoder
+
+DEBUG = False
+
+# How long the worker waits at a time before checking whether it has been stopped
+POLL_INTERVAL = 0.05
+
+# Frames that are shown more than this share of a frame interval after they were due are counted as late
+LATE_THRESHOLD = 0.25
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+class PlaybackClock:
+    """Tracks when frames should be shown. Frames are counted from where playback started, so that the first frame
+    is due when the clock is started and every following frame one frame interval later."""
+
+    def __init__(self, frame_rate: float, time: Callable[[], float] = perf_counter):
+        self.frame_interval = 1 / frame_rate
+        self._time = time
+        self._start_time: Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return self._start_time is not None
+
+    def start(self):
+        if self._start_time is None:
+            self._start_time = self._time()
+
+    def restart(self):
+        self._start_time = None
+
+    def due_position(self) -> int:
+        """How many frames since the start whose presentation time has come."""
+        if self._start_time is None:
+            return 0
+        return int((self._time() - self._start_time) / self.frame_interval) + 1
+
+    def time_until_due(self, position: int) -> float:
+        """Seconds until the frame at the position should be shown, negative if that has already passed."""
+        return self._start_time + position * self.frame_interval - self._time()
+
+
+class FramePrefetcher:
+    """Decodes frames on a background thread, staying up to `depth` frames ahead of the consumer.
+
+    With a clock, playback is kept in real time: get() waits until the next frame is due, and frames whose time has
+    passed are dropped. The decoder skips over such frames without decoding them when the frames after them don't
+    depend on them.
+
+    Once created, the decoder must only be used through the prefetcher."""
+
+    def __init__(self, decoder: Decoder, depth: int = 8, loop: bool = False, clock: Optional[PlaybackClock] = None):
+        self._decoder = decoder
+        # Found out up front, as it may mean scanning the file, which can't be done while the worker is decoding
+        self._num_frames = decoder.num_frames if decoder.seekable else decoder.info.num_frames
+        self._loop = loop
+        self._clock = clock
+        # Frames skipped by the worker and frames discarded by the consumer, counted apart as they're different threads
+        self._skipped_frames = 0
+        self._discarded_frames = 0
+        self.late_frames = 0
+        # Items are (generation, position, frame_index, frame), where position counts the frames since the latest
+        # seek. frame is None when the end of the file has been reached.
+        self._queue: Queue = Queue(maxsize=depth)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Incremented on every seek, so that frames decoded before the seek can be discarded
+        self._generation = 0
+        self._seek_target: Optional[int] = None
+        self._stopped = False
+        self._error: Optional[Exception] = None
+        # The generation in which the consumer has reached the end of the file
+        self._end_generation: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="FramePrefetcher", daemon=True)
+        self._thread.start()
+
+    def get(self) -> Optional[Tuple[int, bytes]]:
+        """Returns the next frame and its index, or None if the end of the file has been reached."""
+        while self._end_generation != self._generation:
+            generation, position, frame_index, frame = self._queue.get()
+            if self._error is not None:
+                raise Exception("Failed to decode frames in the background") from self._error
+            if generation != self._generation:
+                debug(f"Discarding frame {frame_index} decoded before seeking")
+                continue
+            if frame is None:
+                self._end_generation = generation
+                return None
+            if self._clock is not None:
+                clock = self._clock
+                clock.start()
+                if position < clock.due_position() - 1:
+                    debug(f"Dropping frame {frame_index} that was decoded too late")
+                    self._discarded_frames += 1
+                    continue
+                delay = clock.time_until_due(position)
+                if delay > 0:
+                    sleep(delay)
+                elif -delay > clock.frame_interval * LATE_THRESHOLD:
+                    self.late_frames += 1
+            return frame_index, frame
+        return None
+
+    @property
+    def dropped_frames(self) -> int:
+        """Frames that were not shown because they weren't decoded in time."""
+        return self._skipped_frames + self._discarded_frames
+
+    def seek(self, progress: float) -> int:
+        if self._num_frames is None:
+            raise Exception("Can't seek in a file that doesn't say how many frames it has and can't seek")
+        num_frames = self._num_frames
+        target_frame = min(int(num_frames * progress), num_frames - 1)
+        self.seek_to_frame(target_frame)
+        return target_frame
+
+    def seek_to_frame(self, frame_index: int):
+        with self._lock:
+            self._generation += 1
+            self._seek_target = frame_index
+            if self._clock is not None:
+                self._clock.restart()
+        # Make room in the queue, in case the worker is blocked on a full queue
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            self._decode_frames()
+        except Exception as e:
+            self._error = e
+            self._queue.put((self._generation, -1, -1, None))
+
+    def _decode_frames(self):
+        decoder = self._decoder
+        generation = None
+        position = 0
+        while not self._stopped:
+            with self._lock:
+                if generation != self._generation:
+                    position = 0
+                generation = self._generation
+                seek_target = self._seek_target
+                self._seek_target = None
+            if seek_target is not None:
+                decoder.seek_to_frame(seek_target)
+            elif decoder.at_end:
+                if self._loop and decoder.seekable:
+                    decoder.seek_to_beginning()
+                else:
+                    self._wakeup.clear()
+                    with self._lock:
+                        has_seeked = self._seek_target is not None
+                    if not has_seeked:
+                        self._put((generation, position, decoder.position, None))
+                        # Nothing more to decode until the consumer seeks
+                        self._wakeup.wait()
+                    continue
+            if self._can_skip(position):
+                debug(f"Skipping frame {decoder.position} to catch up")
+                decoder.skip_frame()
+                self._skipped_frames += 1
+                position += 1
+                continue
+            frame_index = decoder.position
+            try:
+                frame = decoder.read_frame()
+            except EOFError:
+                # The header didn't say how many frames there are, or the file was cut short. Now the decoder
+                # knows that it's at the end.
+                continue
+            self._put((generation, position, frame_index, frame))
+            position += 1
+
+    def _can_skip(self, position: int) -> bool:
+        clock = self._clock
+        if clock is None or not clock.started or position >= clock.due_position() - 1:
+            return False
+        if not self._decoder.seekable:
+            # Without a frame index, there's no telling which frames the next one depends on
+            return False
+        # Skipping a frame that the next frame is decoded from would only make the next frame slower to decode
+        decoder = self._decoder
+        next_frame = decoder.position + 1
+        return next_frame == self._num_frames or decoder.frame_index.key_frame(next_frame) == next_frame
+
+    def _put(self, item: Tuple[int, int, int, Optional[bytes]]):
+        while not self._stopped and item[0] == self._generation:
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except Full:
+                pass
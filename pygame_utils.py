@@ -1,9 +1,15 @@
-from typing import Iterator
+import sys
+from typing import Iterator, Optional, Tuple
 
+import numpy as np
+import pygame
 from pygame import Surface
 
 from io_utils import Color
 
+# The channel masks of a 24-bit surface whose pixels are stored as BGR bytes
+BGR_MASKS = (0xFF0000, 0x00FF00, 0x0000FF, 0) if sys.byteorder == "little" else (0x0000FF, 0x00FF00, 0xFF0000, 0)
+
 
 def get_surface_pixels(surface: Surface) -> Iterator[Color]:
     w = surface.get_width()
@@ -12,3 +18,24 @@ def get_surface_pixels(surface: Surface) -> Iterator[Color]:
         for x in range(w):
             pixel = surface.get_at((x, y))
             yield pixel[0], pixel[1], pixel[2]
+
+
+def get_surface_rgb(surface: Surface) -> bytes:
+    """Returns the pixels of the surface as packed RGB bytes, row by row. Works for any pixel format."""
+    return pygame.image.tostring(surface, "RGB")
+
+
+def bgr_frame_to_surface(frame: bytes, resolution: Tuple[int, int], surface: Optional[Surface] = None) -> Surface:
+    """Copies a decoded frame into a 24-bit surface. A new surface is created unless one is given."""
+    if surface is None:
+        surface = Surface(resolution, depth=24, masks=BGR_MASKS)
+    if surface.get_bitsize() == 24 and surface.get_masks() == BGR_MASKS \
+            and surface.get_pitch() == resolution[0] * 3:
+        # The frame has the same memory layout as the surface, so it's copied straight in
+        view = surface.get_view()
+        view.write(np.frombuffer(frame, dtype=np.uint8))
+        del view
+    else:
+        rgb = np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3)[:, ::-1].tobytes()
+        surface.blit(pygame.image.frombuffer(rgb, resolution, "RGB"), (0, 0))
+    return surface
@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import BinaryIO, ContextManager, Dict, List, Tuple
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = [10 ** (e / 2) for e in range(-10, 3)]
+BYTES_BUCKETS = [2 ** e for e in range(4, 28, 2)]
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        # The last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        result = []
+        total = 0
+        for bucket, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            result.append((bucket, total))
+        return result
+
+    def to_json(self) -> dict:
+        return {
+            "buckets": [[bucket if bucket != float("inf") else "+Inf", count]
+                        for bucket, count in self.cumulative_counts()],
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class Stats:
+    """Counters and histograms of encoded and decoded frames, and of the time spent in each phase of the work.
+    Pass an instance to Encoder or Decoder to have it filled in."""
+
+    enabled = True
+
+    def __init__(self):
+        # By (direction, frame type name), where direction is "encode" or "decode"
+        self.frames: Dict[Tuple[str, str], int] = {}
+        self.bytes: Dict[Tuple[str, str], int] = {}
+        # By direction
+        self.frame_bytes: Dict[str, Histogram] = {}
+        self.frame_seconds: Dict[str, Histogram] = {}
+        # By phase, such as "palette", "quantize", "rle", "io" or "decode"
+        self.phase_seconds: Dict[str, Histogram] = {}
+
+    def time(self, phase: str) -> ContextManager:
+        return self._time(phase)
+
+    @contextmanager
+    def _time(self, phase: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._histogram(self.phase_seconds, phase, SECONDS_BUCKETS).observe(perf_counter() - start)
+
+    def record_frame(self, direction: str, frame_type: str, num_bytes: int, seconds: float):
+        key = (direction, frame_type)
+        self.frames[key] = self.frames.get(key, 0) + 1
+        self.bytes[key] = self.bytes.get(key, 0) + num_bytes
+        self._histogram(self.frame_bytes, direction, BYTES_BUCKETS).observe(num_bytes)
+        self._histogram(self.frame_seconds, direction, SECONDS_BUCKETS).observe(seconds)
+
+    def to_json(self) -> dict:
+        def by_direction(counters: Dict[Tuple[str, str], int]) -> dict:
+            result = {}
+            for (direction, frame_type), value in sorted(counters.items()):
+                result.setdefault(direction, {})[frame_type] = value
+            return result
+
+        def histograms(by_name: Dict[str, Histogram]) -> dict:
+            return {name: histogram.to_json() for name, histogram in sorted(by_name.items())}
+
+        return {
+            "frames": by_direction(self.frames),
+            "bytes": by_direction(self.bytes),
+            "frame_bytes": histograms(self.frame_bytes),
+            "frame_seconds": histograms(self.frame_seconds),
+            "phase_seconds": histograms(self.phase_seconds),
+        }
+
+    def to_prometheus(self, prefix: str = "dum") -> str:
+        """Returns the stats in the Prometheus text exposition format."""
+        lines = []
+
+        def counter(name: str, counters: Dict[Tuple[str, str], int]):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for (direction, frame_type), value in sorted(counters.items()):
+                lines.append(f'{prefix}_{name}{{direction="{direction}",frame_type="{frame_type}"}} {value}')
+
+        def histograms(name: str, label: str, by_label: Dict[str, Histogram]):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for value, histogram in sorted(by_label.items()):
+                for bucket, count in histogram.cumulative_counts():
+                    le = "+Inf" if bucket == float("inf") else f"{bucket:g}"
+                    lines.append(f'{prefix}_{name}_bucket{{{label}="{value}",le="{le}"}} {count}')
+                lines.append(f'{prefix}_{name}_sum{{{label}="{value}"}} {histogram.sum}')
+                lines.append(f'{prefix}_{name}_count{{{label}="{value}"}} {histogram.count}')
+
+        counter("frames_total", self.frames)
+        counter("frame_bytes_total", self.bytes)
+        histograms("frame_bytes", "direction", self.frame_bytes)
+        histograms("frame_seconds", "direction", self.frame_seconds)
+        histograms("phase_seconds", "phase", self.phase_seconds)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram(by_name: Dict[str, Histogram], name: str, buckets: List[float]) -> Histogram:
+        histogram = by_name.get(name)
+        if histogram is None:
+            histogram = by_name[name] = Histogram(buckets)
+        return histogram
+
+
+class NullStats(Stats):
+    """Stats that records nothing, at close to no cost. This is what Encoder and Decoder use by default."""
+
+    enabled = False
+    _NO_TIMING = nullcontext()
+
+    def time(self, phase: str) -> ContextManager:
+        return self._NO_TIMING
+
+    def record_frame(self, direction: str, frame_type: str, num_bytes: int, seconds: float):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class CountingWriter:
+    """Wraps a binary file and counts the bytes written through it."""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self.count = 0
+
+    def write(self, data) -> int:
+        self._file.write(data)
+        n = memoryview(data).nbytes
+        self.count += n
+        return n
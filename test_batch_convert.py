@@ -0,0 +1,68 @@
+import os
+
+import pygame
+
+from batch_convert import find_jobs, run_jobs, FINGERPRINT_EXTENSION
+from format import Decoder, Encoder, Quality
+from header import read_header
+
+
+def write_image(path: str, color):
+    surface = pygame.Surface((8, 8))
+    surface.fill(color)
+    pygame.image.save(surface, path)
+
+
+def write_dum(path: str):
+    with open(path, "wb") as file, Encoder(file) as encoder:
+        encoder.write_header(frame_rate=10, resolution=(8, 4), scaling=(1, 1), num_frames=2)
+        encoder.write_frame([(255, 0, 0)] * 32)
+        encoder.write_frame([(0, 0, 255)] * 32)
+
+
+def read_frames(path: str):
+    with open(path, "rb") as file:
+        info = read_header(file)
+        return info, list(Decoder(file, info).frames())
+
+
+def test_find_jobs(tmp_path):
+    for i in range(3):
+        write_image(str(tmp_path / f"frame_{i:03d}.png"), (i, 0, 0))
+    write_image(str(tmp_path / "still.png"), (0, 0, 0))
+    write_dum(str(tmp_path / "clip.dum"))
+    out = str(tmp_path / "out")
+
+    jobs = find_jobs([str(tmp_path / "frame_%03d.png"), str(tmp_path / "*.dum")], out)
+    assert [(job.kind, len(job.inputs), os.path.basename(job.output)) for job in jobs] == \
+           [("sequence", 3, "frame.dum"), ("dum", 1, "clip.dum")]
+
+    jobs = find_jobs([str(tmp_path)], out, group_sequences=True)
+    assert sorted((job.kind, os.path.basename(job.output)) for job in jobs) == \
+           [("dum", "clip.dum"), ("image", "still.dum"), ("sequence", "frame.dum")]
+
+
+def test_run_jobs(tmp_path):
+    for i in range(3):
+        write_image(str(tmp_path / f"frame_{i:03d}.png"), (0, 10 * i, 0))
+    write_dum(str(tmp_path / "clip.dum"))
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    jobs = find_jobs([str(tmp_path / "frame_%03d.png"), str(tmp_path / "clip.dum")], out)
+
+    results = run_jobs(jobs, Quality.LOSSLESS, 5, workers=2, use_hash=False, force=False)
+    assert [result.error for result in results] == [None, None]
+    info, frames = read_frames(os.path.join(out, "frame.dum"))
+    assert (info.frame_rate, info.num_frames) == (5, 3)
+    assert frames[2] == bytes([0, 20, 0]) * 64
+    info, frames = read_frames(os.path.join(out, "clip.dum"))
+    assert (info.frame_rate, info.width, info.num_frames) == (10, 8, 2)
+    # BGR
+    assert frames == [bytes([0, 0, 255]) * 32, bytes([255, 0, 0]) * 32]
+    assert os.path.exists(os.path.join(out, "clip.dum" + FINGERPRINT_EXTENSION))
+
+    # Up to date, until the settings or the inputs change
+    assert run_jobs(jobs, Quality.LOSSLESS, 5, workers=2, use_hash=False, force=False) == []
+    assert len(run_jobs(jobs, Quality.MEDIUM, 5, workers=2, use_hash=False, force=False)) == 2
+    write_image(str(tmp_path / "frame_001.png"), (1, 2, 3))
+    assert [result.job.kind for result in run_jobs(jobs, Quality.MEDIUM, 5, 2, False, False)] == ["sequence"]
@@ -0,0 +1,14 @@
+from benchmark import compare, create_frame, CONTENT_TYPES
+
+
+def test_create_frame():
+    for content in CONTENT_TYPES:
+        assert create_frame(content, (64, 32), 3).shape == (32, 64, 3)
+
+
+def test_compare():
+    baseline = {"a": {"fps": 100.0}, "b": {"fps": 100.0}, "c": {"fps": 100.0}}
+    results = {"a": {"fps": 90.0}, "b": {"fps": 50.0}, "c": {"fps": 150.0}, "d": {"fps": 1.0}}
+    regressions = compare(results, baseline, threshold=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b: ")
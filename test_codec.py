@@ -1,9 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from random import randint
 
+import numpy as np
+import pytest
+
+from codec.colormapped import write_color_mapped_frame, read_color_mapped_frame, index_colors
+from codec.delta import find_changed_rects
+from codec.raw import write_raw_frame
+from codec.sampling import decimate, decimated_resolution
+from codec.sliced import slice_rows
+from codec.quantized import read_8bit_quantized_frame, read_16bit_quantized_frame, write_16bit_quantized_frame
+from color_quantization import uint7_to_bgr, uint15_to_bgr, rgb_to_uint15, rgb_to_uint7
 from common import FrameType
-from format import Decoder, write_8bit_quantized_frame, Encoder
+from format import Decoder, write_8bit_quantized_frame, Encoder, Quality, write_frame, encode_frame
 from header import write_header, DumInfo, read_header
+from io_utils import bytes_to_int, rgb_array
 
 
 def test_write_header():
@@ -41,8 +53,8 @@ def test_write_and_read_full_file():
     decoder = Decoder(io, info)
     assert decoder.info == DumInfo(frame_rate=1, width=4, height=4, hor_scaling=4, ver_scaling=5,
                                    num_frames=2, first_frame_offset=15, file_size=74)
-    assert decoder.read_frame() == [0, 0, 0, 100, 100, 100] + [0, 0, 0] * 14
-    assert decoder.read_frame() == [150, 150, 150, 250, 250, 250] + [0, 0, 0] * 14
+    assert list(decoder.read_frame()) == [0, 0, 0, 100, 100, 100] + [0, 0, 0] * 14
+    assert list(decoder.read_frame()) == [150, 150, 150, 250, 250, 250] + [0, 0, 0] * 14
 
 
 def test_run_length_frame():
@@ -72,7 +84,7 @@ def test_write_and_read_run_length_frame():
     io.seek(0)
 
     decoder = Decoder(io, DumInfo(1, w, h, 1, 1, 1, 0, file_size))
-    decoded_pixels = decoder.read_frame()
+    decoded_pixels = list(decoder.read_frame())
 
     assert decoded_pixels[:300] == [144, 80, 16] * 100
     assert decoded_pixels[300:] == [208, 208, 144] * 9900
@@ -100,9 +112,322 @@ def test_write_and_read_repeated_frame():
 
     info = read_header(io)
     decoder = Decoder(io, info)
-    assert decoder.read_frame() == expected_decoded_frame
-    assert decoder.read_frame() == expected_decoded_frame
+    assert list(decoder.read_frame()) == expected_decoded_frame
+    assert list(decoder.read_frame()) == expected_decoded_frame
 
     decoder.seek_to_beginning()
     assert FrameType(decoder.skip_frame()[0]) == FrameType.RAW
     assert FrameType(decoder.skip_frame()[0]) == FrameType.REPEATED
+
+
+def test_read_color_mapped_frame_matches_list_decoding():
+    io = BytesIO()
+    color_map = [(randint(0, 255), randint(0, 255), randint(0, 255)) for _ in range(200)]
+    pixels = [color_map[randint(0, len(color_map) - 1)] for _ in range(32 * 32)]
+    write_color_mapped_frame(color_map, io, pixels)
+    io.seek(5)
+
+    expected = []
+    for pixel in pixels:
+        expected += [pixel[2], pixel[1], pixel[0]]
+    decoded = read_color_mapped_frame(io, len(io.getbuffer()) - 5)
+
+    assert isinstance(decoded, bytes)
+    assert list(decoded) == expected
+
+
+def test_read_8bit_quantized_frame_with_consecutive_run_lengths():
+    io = BytesIO(bytes([
+        0b01111111,  # "white"
+        0b10000000 + 127,  # repeated 127 additional times
+        0b10000000 + 3,  # ... and 3 more
+        0b00000000,  # "black"
+    ]))
+    decoded = read_8bit_quantized_frame(io, 4)
+    assert list(decoded) == list(uint7_to_bgr(0b01111111)) * 131 + list(uint7_to_bgr(0))
+
+
+def test_read_16bit_quantized_frame_matches_list_decoding():
+    io = BytesIO()
+    pixels = []
+    for _ in range(500):
+        color = (randint(0, 255), randint(0, 255), randint(0, 255))
+        pixels += [color] * randint(1, 5)
+    write_16bit_quantized_frame(io, pixels)
+    io.seek(5)
+
+    expected = []
+    for pixel in pixels:
+        expected += uint15_to_bgr(rgb_to_uint15(pixel))
+    decoded = read_16bit_quantized_frame(io, len(io.getbuffer()) - 5)
+
+    assert isinstance(decoded, bytes)
+    assert list(decoded) == expected
+
+
+def test_write_quantized_frame_with_runs_across_chunks():
+    from io_utils import PIXELS_PER_CHUNK
+    n = PIXELS_PER_CHUNK * 2 + 5
+    pixels = np.zeros((n, 3), dtype=np.uint8)
+    pixels[PIXELS_PER_CHUNK - 3:] = 255
+    io = BytesIO()
+    write_16bit_quantized_frame(io, pixels)
+    # A color and a run-length for every 32768 pixels of each run, as if the pixels were encoded at once
+    expected_codes = 2 * (-(-(PIXELS_PER_CHUNK - 3) // 32768) + -(-(n - PIXELS_PER_CHUNK + 3) // 32768))
+    assert bytes_to_int(io.getbuffer()[1:5]) == expected_codes * 2
+    io.seek(5)
+    decoded = np.frombuffer(read_16bit_quantized_frame(io, expected_codes * 2), dtype=np.uint8).reshape(-1, 3)
+    assert (decoded[:PIXELS_PER_CHUNK - 3] == decoded[0]).all() and (decoded[0] < 16).all()
+    assert (decoded[PIXELS_PER_CHUNK - 3:] == decoded[-1]).all() and (decoded[-1] > 240).all()
+
+
+def test_write_8bit_quantized_frame_splits_long_runs():
+    pixels = []
+    for _ in range(50):
+        color = (randint(0, 255), randint(0, 255), randint(0, 255))
+        pixels += [color] * randint(1, 300)
+
+    expected_codes = []
+    run_length_pixel = None
+    accumulated_run_length = 0
+    for p in [rgb_to_uint7(p) for p in pixels]:
+        if p != run_length_pixel or accumulated_run_length == 127:
+            if accumulated_run_length:
+                expected_codes.append(0b10000000 + accumulated_run_length)
+            expected_codes.append(p)
+            run_length_pixel = p
+            accumulated_run_length = 0
+        else:
+            accumulated_run_length += 1
+    if accumulated_run_length:
+        expected_codes.append(0b10000000 + accumulated_run_length)
+
+    io = BytesIO()
+    write_8bit_quantized_frame(io, pixels)
+    assert list(io.getbuffer()[5:]) == expected_codes
+    assert bytes_to_int(io.getbuffer()[1:5]) == len(expected_codes)
+
+
+def test_write_color_mapped_frame_with_unmapped_color():
+    with pytest.raises(ValueError):
+        write_color_mapped_frame([(0, 0, 0), (255, 255, 255)], BytesIO(), [(0, 0, 0), (1, 2, 3)])
+
+
+def test_index_colors():
+    color_map, color_indices = index_colors([(9, 9, 9), (0, 0, 1), (9, 9, 9)])
+    assert color_map.tolist() == [[0, 0, 1], [9, 9, 9]]
+    assert color_indices.tolist() == [1, 0, 1]
+    color_map, color_indices = index_colors(np.zeros((0, 3), np.uint8))
+    assert color_map.shape == (0, 3) and len(color_indices) == 0
+
+
+def test_raw_frame():
+    io = BytesIO()
+    write_raw_frame(io, [(1, 2, 3), (4, 5, 6)])
+    assert list(io.getbuffer()) == [
+        1,  # frame type
+        0, 0, 0, 6,  # frame size = 6 bytes
+        3, 2, 1,  # pixels are stored as BGR
+        6, 5, 4,
+    ]
+
+
+def moving_square_frames(w: int, h: int, num_frames: int):
+    frames = []
+    for i in range(num_frames):
+        pixels = []
+        for y in range(h):
+            for x in range(w):
+                if i <= x < i + 8 and 4 <= y < 12:
+                    pixels.append((250, 250, 250))
+                else:
+                    pixels.append(((x * 7) % 256, (y * 13) % 256, (x * y) % 256))
+        frames.append(pixels)
+    return frames
+
+
+def test_find_changed_rects():
+    previous = np.zeros((40, 100, 3), dtype=np.uint8)
+    image = previous.copy()
+    image[2, 3] = (1, 1, 1)
+    image[20:35, 17] = (1, 1, 1)
+    image[39, 99] = (1, 1, 1)
+    assert sorted(find_changed_rects(previous, image)) == [(0, 0, 16, 16), (16, 16, 16, 24), (96, 32, 4, 8)]
+    assert find_changed_rects(previous, previous) == []
+    assert find_changed_rects(previous, image + 1) is None
+
+
+def test_write_and_read_delta_frames():
+    w, h = 128, 64
+    frames = moving_square_frames(w, h, 10)
+
+    io = BytesIO()
+    encoder = Encoder(io)
+    encoder.write_header(1, (w, h), (1, 1), len(frames))
+    for pixels in frames:
+        encoder.write_frame(pixels)
+
+    full_frames_io = BytesIO()
+    encoder = Encoder(full_frames_io, delta_frames=False)
+    encoder.write_header(1, (w, h), (1, 1), len(frames))
+    for pixels in frames:
+        encoder.write_frame(pixels)
+    assert len(io.getbuffer()) < len(full_frames_io.getbuffer()) / 2
+
+    io.seek(0)
+    full_frames_io.seek(0)
+    decoder = Decoder(io, read_header(io))
+    full_frames_decoder = Decoder(full_frames_io, read_header(full_frames_io))
+    assert [FrameType(decoder.frame_index.frame_type(i)) for i in range(3)] == \
+           [FrameType.RAW, FrameType.DELTA, FrameType.DELTA]
+    for _ in frames:
+        assert decoder.read_frame() == full_frames_decoder.read_frame()
+    assert decoder.get_frame(5) == full_frames_decoder.get_frame(5)
+
+
+def test_rgb_array_from_buffers():
+    pixels = [(1, 2, 3), (4, 5, 6), (7, 8, 9), (10, 11, 12)]
+    packed = bytes(c for p in pixels for c in p)
+    expected = np.array(pixels, dtype=np.uint8)
+    assert (rgb_array(pixels) == expected).all()
+    assert (rgb_array(packed) == expected).all()
+    assert (rgb_array(bytearray(packed)) == expected).all()
+    assert (rgb_array(memoryview(packed)) == expected).all()
+    assert (rgb_array(expected.reshape(2, 2, 3)) == expected).all()
+    assert (rgb_array(iter(pixels)) == expected).all()
+    with pytest.raises(ValueError):
+        rgb_array(packed[:-1])
+    with pytest.raises(TypeError):
+        rgb_array(expected.astype(np.int32))
+
+
+def test_encoder_accepts_packed_rgb():
+    w, h = 32, 16
+    frames = moving_square_frames(w, h, 4)
+
+    expected = BytesIO()
+    encoder = Encoder(expected)
+    encoder.write_header(1, (w, h), (1, 1), len(frames))
+    for pixels in frames:
+        encoder.write_frame(pixels)
+
+    io = BytesIO()
+    encoder = Encoder(io)
+    encoder.write_header(1, (w, h), (1, 1), len(frames))
+    # The same buffer is reused for every frame
+    buffer = bytearray(w * h * 3)
+    for pixels in frames:
+        buffer[:] = bytes(c for p in pixels for c in p)
+        encoder.write_frame(buffer)
+    with pytest.raises(ValueError):
+        encoder.write_frame(bytes(w * 3))
+
+    assert io.getvalue() == expected.getvalue()
+
+
+def test_write_frame_optimizing_size():
+    # A flat frame is smaller as a run-length encoded frame than as a color-mapped one
+    flat = [(10, 20, 30)] * (64 * 64)
+    assert write_frame(BytesIO(), flat, Quality.MEDIUM, optimize_size=True) == FrameType.QUANTIZED_TO_16_BIT
+    # 16-bit frames allow longer runs than 8-bit ones, so they are also used for LOW
+    assert write_frame(BytesIO(), flat, Quality.LOW, optimize_size=True) == FrameType.QUANTIZED_TO_16_BIT
+    # Quantized frames are lossy, so only lossless frame types are used for LOSSLESS
+    assert write_frame(BytesIO(), flat, Quality.LOSSLESS, optimize_size=True) == FrameType.COLOR_MAPPED
+    noise = [(randint(0, 255), randint(0, 255), randint(0, 255)) for _ in range(64 * 64)]
+    assert write_frame(BytesIO(), noise, Quality.LOSSLESS, optimize_size=True) == FrameType.RAW
+    for pixels in [flat, noise]:
+        for quality in Quality:
+            assert len(encode_frame(pixels, quality, optimize_size=True)) <= len(encode_frame(pixels, quality))
+
+
+def test_encoder_with_target_bitrate():
+    w, h = 64, 64
+    frames = [[(randint(0, 255), randint(0, 255), randint(0, 255)) for _ in range(w * h)] for _ in range(4)]
+    frame_rate = 10
+    io = BytesIO()
+    # Enough for 8-bit quantized frames of noise, but not for raw ones
+    encoder = Encoder(io, Quality.LOSSLESS, target_bitrate=w * h * 2 * 8 * frame_rate)
+    encoder.write_header(frame_rate, (w, h), (1, 1), len(frames))
+    for pixels in frames:
+        encoder.write_frame(pixels)
+
+    io.seek(0)
+    decoder = Decoder(io, read_header(io))
+    assert {decoder.frame_index.frame_type(i) for i in range(len(frames))} != {FrameType.RAW}
+    assert len(io.getbuffer()) < w * h * 2 * len(frames) + 100
+
+
+def test_encoder_with_target_bitrate_skips_needless_encodes(monkeypatch):
+    import format
+    w, h = 16, 16
+    calls = []
+    monkeypatch.setattr(format, "write_raw_frame", lambda *args: calls.append("RAW"))
+    write_indexed_frame = format.write_indexed_frame
+    monkeypatch.setattr(format, "write_indexed_frame",
+                        lambda *args: calls.append("COLOR_MAPPED") or write_indexed_frame(*args))
+    io = BytesIO()
+    # Too little for any frame
+    encoder = Encoder(io, Quality.LOW, delta_frames=False, target_bitrate=8)
+    encoder.write_header(1, (w, h), (1, 1), 2)
+    encoder.write_frame([(randint(0, 255), randint(0, 255), randint(0, 255)) for _ in range(w * h)])
+    assert calls == []
+    encoder.write_frame([(i % 2, 0, 0) for i in range(w * h)])
+    assert calls == ["COLOR_MAPPED"]
+
+
+def test_write_and_read_sliced_frames():
+    w, h = 64, 36
+    frames = moving_square_frames(w, h, 3)
+    for quality in Quality:
+        expected = BytesIO()
+        encoder = Encoder(expected, quality, delta_frames=False)
+        encoder.write_header(1, (w, h), (1, 1), len(frames))
+        for pixels in frames:
+            encoder.write_frame(pixels)
+
+        with ThreadPoolExecutor(4) as executor:
+            io = BytesIO()
+            encoder = Encoder(io, quality, delta_frames=False, slices=5, executor=executor)
+            encoder.write_header(1, (w, h), (1, 1), len(frames))
+            for pixels in frames:
+                encoder.write_frame(pixels)
+
+            expected.seek(0)
+            io.seek(0)
+            expected_decoder = Decoder(expected, read_header(expected))
+            decoder = Decoder(io, read_header(io), executor=executor)
+            assert {decoder.frame_index.frame_type(i) for i in range(len(frames))} == {FrameType.SLICED}
+            for _ in frames:
+                assert decoder.read_frame() == expected_decoder.read_frame()
+            assert decoder.get_frame(1) == expected_decoder.get_frame(1)
+
+
+def test_slice_rows():
+    assert slice_rows(10, 3) == [(0, 3), (3, 3), (6, 4)]
+    assert slice_rows(2, 4) == [(0, 1), (1, 1)]
+
+
+def test_read_decimated_frames():
+    w, h = 52, 36
+    frames = moving_square_frames(w, h, 6)
+    frames.insert(2, frames[1])
+    # A frame with few colors, and a frame with long runs
+    frames.append([((x // 10) * 40, 0, 0) for y in range(h) for x in range(w)])
+    frames.append([(200, 100, 50)] * (w * h))
+    for quality in Quality:
+        for slices in [1, 3]:
+            io = BytesIO()
+            encoder = Encoder(io, quality, slices=slices)
+            encoder.write_header(1, (w, h), (1, 1), len(frames))
+            for pixels in frames:
+                encoder.write_frame(pixels)
+            io.seek(0)
+            decoder = Decoder(io, read_header(io))
+            full_frames = list(decoder.frames())
+            for factor in [1, 3, 4]:
+                expected = [decimate(frame, (w, h), factor).tobytes() for frame in full_frames]
+                decoder.seek_to_beginning()
+                assert [decoder.read_decimated_frame(factor) for _ in frames] == expected
+                assert decoder.get_decimated_frame(4, factor) == expected[4]
+                assert decoder.get_decimated_frame(2, factor) == expected[2]
+                assert len(expected[0]) == 3 * np.prod(decimated_resolution((w, h), factor))
@@ -1,4 +1,7 @@
-from color_quantization import rgb_to_uint15, uint15_to_rgb, rgb_to_uint7, uint7_to_rgb
+import numpy as np
+
+from color_quantization import rgb_to_uint15, uint15_to_rgb, rgb_to_uint7, uint7_to_rgb, uint15_to_bgr, \
+    uint7_to_bgr, rgb_to_uint15_array, rgb_to_uint7_array, uint15_to_bgr_array, uint7_to_bgr_array
 
 
 def uint15_roundtrip(color):
@@ -33,3 +36,17 @@ def test_color_quantization_7():
     assert uint7_rgb_roundtrip((255, 0, 0)) == (240, 16, 16)
     assert uint7_rgb_roundtrip((100, 100, 100)) == (112, 80, 80)
     assert uint7_rgb_roundtrip((75, 150, 225)) == (80, 144, 208)
+
+
+def test_batch_color_quantization():
+    rgb = np.random.default_rng(0).integers(0, 256, (1000, 3), dtype=np.uint8)
+    colors = [tuple(int(c) for c in color) for color in rgb]
+    assert rgb_to_uint15_array(rgb).tolist() == [rgb_to_uint15(color) for color in colors]
+    assert rgb_to_uint7_array(rgb).tolist() == [rgb_to_uint7(color) for color in colors]
+
+
+def test_batch_color_dequantization():
+    values = np.arange(2 ** 15)
+    assert [tuple(bgr) for bgr in uint15_to_bgr_array(values).tolist()] == [uint15_to_bgr(n) for n in range(2 ** 15)]
+    values = np.arange(2 ** 7)
+    assert [tuple(bgr) for bgr in uint7_to_bgr_array(values).tolist()] == [uint7_to_bgr(n) for n in range(2 ** 7)]
@@ -0,0 +1,60 @@
+from io import BytesIO
+
+from format import Encoder, Decoder
+from frame_cache import FrameCache
+from header import read_header
+
+
+def test_evicts_least_recently_used_frames():
+    cache = FrameCache(max_bytes=30)
+    frames = [bytes([i]) * 10 for i in range(4)]
+    for i in range(3):
+        cache.put(i, frames[i])
+    assert cache.size == 30
+    assert cache.get(0) == frames[0]
+    cache.put(3, frames[3])
+    assert cache.size == 30
+    assert 1 not in cache
+    assert [cache.get(i) for i in [0, 2, 3]] == [frames[0], frames[2], frames[3]]
+
+
+def test_repeated_frames_share_an_entry():
+    cache = FrameCache(max_bytes=20)
+    frame = bytes(10)
+    for i in range(5):
+        cache.put(i, frame)
+    assert cache.size == 10
+    assert len(cache) == 5
+    cache.put(5, bytes(10))
+    cache.put(6, bytes(10))
+    # All indices of the shared frame are evicted together
+    assert cache.size == 20
+    assert len(cache) == 2
+
+
+def test_decoder_uses_cached_frames():
+    io = BytesIO()
+    encoder = Encoder(io)
+    num_frames = 6
+    encoder.write_header(frame_rate=1, resolution=(4, 4), scaling=(1, 1), num_frames=num_frames)
+    for i in range(num_frames):
+        encoder.write_frame([(i // 2, i // 2, 0)] * 16)
+    io.seek(0)
+    decoder = Decoder(io, read_header(io), cache=FrameCache(max_bytes=1000))
+
+    decoded_frames = []
+    decode = decoder._read_frame
+
+    def counting_decode(file):
+        decoded_frames.append(decoder.position)
+        return decode(file)
+
+    decoder._read_frame = counting_decode
+
+    first_pass = [decoder.read_frame() for _ in range(num_frames)]
+    assert decoded_frames == list(range(num_frames))
+    decoder.seek_to_beginning()
+    assert [decoder.read_frame() for _ in range(num_frames)] == first_pass
+    assert decoder.get_frame(2) == first_pass[2]
+    assert decoder.read_frame() == first_pass[3]
+    assert decoded_frames == list(range(num_frames))
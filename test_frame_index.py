@@ -0,0 +1,83 @@
+from io import BytesIO
+
+from common import FrameType
+from format import Encoder, Decoder
+from frame_index import build_frame_index, write_frame_index, read_frame_index, load_frame_index, index_path
+from header import read_header
+
+BLACK = [(0, 0, 0)] * 16
+WHITE = [(255, 255, 255)] * 16
+GRAY = [(100, 100, 100)] * 16
+
+
+def create_file() -> BytesIO:
+    io = BytesIO()
+    encoder = Encoder(io)
+    encoder.write_header(frame_rate=1, resolution=(4, 4), scaling=(1, 1), num_frames=5)
+    for pixels in [BLACK, WHITE, WHITE, WHITE, GRAY]:
+        encoder.write_frame(pixels)
+    io.seek(0)
+    return io
+
+
+def bgr(pixels):
+    return bytes(c for p in pixels for c in (p[2], p[1], p[0]))
+
+
+def test_build_frame_index():
+    io = create_file()
+    info = read_header(io)
+    index = build_frame_index(io, info)
+    assert len(index) == 5
+    assert [index.frame_type(i) for i in range(5)] == [FrameType.COLOR_MAPPED] * 2 + [FrameType.REPEATED] * 2 + [
+        FrameType.COLOR_MAPPED]
+    assert index.offset(0) == info.first_frame_offset
+    assert index.offset(1) == index.offset(0) + 5 + index.frame_size(0)
+    assert [index.key_frame(i) for i in range(5)] == [0, 1, 1, 1, 4]
+    assert io.tell() == info.first_frame_offset
+
+
+def test_get_frame():
+    io = create_file()
+    decoder = Decoder(io, read_header(io))
+    assert decoder.get_frame(3) == bgr(WHITE)
+    assert decoder.read_frame() == bgr(GRAY)
+    assert decoder.get_frame(0) == bgr(BLACK)
+    assert decoder.read_frame() == bgr(WHITE)
+
+
+def test_seek_onto_repeated_frame():
+    io = create_file()
+    decoder = Decoder(io, read_header(io))
+    assert decoder.read_frame() == bgr(BLACK)
+    assert decoder.seek(0.6) == 3
+    assert decoder.read_frame() == bgr(WHITE)
+
+
+def test_read_repeated_frame_after_skipping():
+    io = create_file()
+    decoder = Decoder(io, read_header(io))
+    decoder.read_frame()
+    decoder.skip_frame()
+    decoder.skip_frame()
+    assert decoder.read_frame() == bgr(WHITE)
+
+
+def test_frame_index_sidecar(tmp_path):
+    dum_path = str(tmp_path / "video.dum")
+    with open(dum_path, "wb") as file:
+        file.write(create_file().getbuffer())
+
+    with open(dum_path, "rb") as file:
+        info = read_header(file)
+        assert read_frame_index(index_path(dum_path), dum_path) is None
+        index = load_frame_index(dum_path, file, info)
+        cached_index = read_frame_index(index_path(dum_path), dum_path)
+        assert (cached_index.entries == index.entries).all()
+
+    with open(dum_path, "ab") as file:
+        file.write(b"changed")
+    assert read_frame_index(index_path(dum_path), dum_path) is None
+
+    write_frame_index(index_path(dum_path), index, dum_path)
+    assert read_frame_index(index_path(dum_path), dum_path) is not None
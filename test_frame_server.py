@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from format import Decoder, Encoder
+from frame_server import DecoderPool, FrameServer, FrameClient, RequestError
+
+NUM_FRAMES = 12
+
+
+def create_file(path: str):
+    with open(path, "wb") as file:
+        encoder = Encoder(file)
+        encoder.write_header(frame_rate=4, resolution=(4, 4), scaling=(1, 1), num_frames=NUM_FRAMES)
+        for i in range(NUM_FRAMES):
+            # Every other frame is repeated, so that some frames depend on the frame before them
+            encoder.write_frame([(i // 2, i // 2, i // 2)] * 16)
+
+
+def expected_frame(i: int) -> bytes:
+    return bytes([i // 2]) * 48
+
+
+def test_frame_server(tmp_path):
+    create_file(str(tmp_path / "a.dum"))
+    create_file(str(tmp_path / "b.dum"))
+
+    async def run():
+        server = FrameServer(str(tmp_path), decoders_per_file=2, max_pending_requests=2)
+        host, port = await server.start_tcp()
+        try:
+            client = await FrameClient.connect_tcp(host, port)
+            assert (await client.info("a.dum")).num_frames == NUM_FRAMES
+            assert await client.get_frame("a.dum", 5) == (5, expected_frame(5))
+            assert await client.get_frame_at("b.dum", 2.0) == (8, expected_frame(8))
+            with pytest.raises(RequestError):
+                await client.get_frame("a.dum", NUM_FRAMES)
+            with pytest.raises(RequestError):
+                await client.get_frame("../a.dum", 0)
+            with pytest.raises(RequestError):
+                await client.get_frame("missing.dum", 0)
+
+            # Requests can be sent ahead of the responses, which come back in order
+            for i in reversed(range(NUM_FRAMES)):
+                client.send({"file": "a.dum", "frame": i})
+            for i in reversed(range(NUM_FRAMES)):
+                assert await client.read_frame() == (i, expected_frame(i))
+
+            # Several clients at once
+            clients = [await FrameClient.connect_tcp(host, port) for _ in range(4)]
+
+            async def read_all(c: FrameClient, file: str):
+                return [await c.get_frame(file, i) for i in range(NUM_FRAMES)]
+
+            results = await asyncio.gather(*(read_all(c, "ab"[i % 2] + ".dum") for i, c in enumerate(clients)))
+            for frames in results:
+                assert frames == [(i, expected_frame(i)) for i in range(NUM_FRAMES)]
+            for c in clients + [client]:
+                await c.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_frame_server_over_unix_socket(tmp_path):
+    create_file(str(tmp_path / "a.dum"))
+    socket_path = str(tmp_path / "server.sock")
+
+    async def run():
+        server = FrameServer(str(tmp_path))
+        await server.start_unix(socket_path)
+        try:
+            client = await FrameClient.connect_unix(socket_path)
+            assert await client.get_frame("a.dum", 3) == (3, expected_frame(3))
+            await client.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_decoder_pool_recovers_from_failing_opens(tmp_path):
+    path = str(tmp_path / "a.dum")
+    with open(path, "wb") as file:
+        file.write(b"not a DUM file")
+
+    async def run():
+        with ThreadPoolExecutor() as executor:
+            pool = DecoderPool(path, max_decoders=2, executor=executor)
+            for _ in range(3):
+                with pytest.raises(Exception):
+                    await pool.acquire(0)
+            create_file(path)
+            decoder = await asyncio.wait_for(pool.acquire(0), timeout=5)
+            assert decoder.get_frame(3) == expected_frame(3)
+            pool.release(decoder)
+            pool.close()
+
+    asyncio.run(run())
+
+
+def test_cancelled_request_keeps_its_decoder_until_decoded(tmp_path, monkeypatch):
+    create_file(str(tmp_path / "a.dum"))
+    decoding = threading.Event()
+    in_use = []
+    overlaps = []
+    get_frame = Decoder.get_frame
+
+    def slow_get_frame(decoder, frame_index):
+        if decoder in in_use:
+            overlaps.append(frame_index)
+        in_use.append(decoder)
+        decoding.set()
+        time.sleep(0.1)
+        try:
+            return get_frame(decoder, frame_index)
+        finally:
+            in_use.remove(decoder)
+
+    monkeypatch.setattr(Decoder, "get_frame", slow_get_frame)
+
+    async def run():
+        server = FrameServer(str(tmp_path), decoders_per_file=1)
+        try:
+            await server._respond(b'{"file": "a.dum", "info": true}')
+            cancelled = asyncio.ensure_future(server._respond(b'{"file": "a.dum", "frame": 5}'))
+            await asyncio.get_running_loop().run_in_executor(None, decoding.wait)
+            cancelled.cancel()
+            status, payload = await server._respond(b'{"file": "a.dum", "frame": 3}')
+            assert payload[1] == expected_frame(3)
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+    assert overlaps == []
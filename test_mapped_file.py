@@ -0,0 +1,32 @@
+from format import Encoder, Decoder
+from frame_index import build_frame_index
+from header import read_header
+from mapped_file import MappedFile
+
+
+def test_decode_mapped_file(tmp_path):
+    path = str(tmp_path / "video.dum")
+    frames = [[(i, 255 - i, i // 2) for i in range(256)], [(0, 0, 0)] * 256, [(0, 0, 0)] * 256]
+    with open(path, "wb") as file:
+        encoder = Encoder(file)
+        encoder.write_header(frame_rate=1, resolution=(16, 16), scaling=(1, 1), num_frames=len(frames))
+        for pixels in frames:
+            encoder.write_frame(pixels)
+
+    with open(path, "rb") as file:
+        info = read_header(file)
+        decoder = Decoder(file, info)
+        expected_frames = [bytes(decoder.read_frame()) for _ in frames]
+
+    with MappedFile(path) as file:
+        mapped_info = read_header(file)
+        assert mapped_info == info
+        decoder = Decoder(file, mapped_info)
+        raw_frame = decoder.read_frame()
+        # Raw frames are not copied out of the mapping
+        assert isinstance(raw_frame, memoryview)
+        assert [bytes(raw_frame)] + [bytes(decoder.read_frame()) for _ in frames[1:]] == expected_frames
+        assert len(build_frame_index(file, info)) == len(frames)
+        assert bytes(decoder.get_frame(0)) == expected_frames[0]
+    # Frames can still be used after the file has been closed
+    assert bytes(raw_frame) == expected_frames[0]
@@ -0,0 +1,29 @@
+from io import BytesIO
+from random import randint
+
+from format import Encoder, Quality
+from parallel_encoder import ParallelEncoder
+
+
+def test_parallel_encoder_writes_frames_in_order():
+    w, h = 16, 16
+    frames = []
+    for i in range(6):
+        frames.append([(randint(0, 255), randint(0, 255), randint(0, 255)) for _ in range(w * h)])
+        frames.append(frames[-1])
+    frames.append([(i, i, i) for i in range(w * h)])
+
+    expected = BytesIO()
+    encoder = Encoder(expected, Quality.MEDIUM, delta_frames=False)
+    encoder.write_header(1, (w, h), (1, 1), len(frames))
+    for pixels in frames:
+        encoder.write_frame(pixels)
+
+    io = BytesIO()
+    # Only room for 2 frames in flight
+    with ParallelEncoder(io, Quality.MEDIUM, max_workers=2, max_memory=2 * w * h * 3) as encoder:
+        encoder.write_header(1, (w, h), (1, 1), len(frames))
+        for pixels in frames:
+            encoder.write_frame(pixels)
+
+    assert io.getvalue() == expected.getvalue()
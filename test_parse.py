@@ -0,0 +1,63 @@
+from common import FrameType
+from format import Encoder, Quality
+from header import write_num_frames
+from parse import scan_file, format_report
+
+NUM_FRAMES = 12
+
+
+def write_file(path: str, slices: int = 1, quality: Quality = Quality.LOSSLESS):
+    with open(path, "wb") as file, Encoder(file, quality, slices=slices) as encoder:
+        encoder.write_header(frame_rate=4, resolution=(16, 8), scaling=(1, 1), num_frames=NUM_FRAMES)
+        for i in range(NUM_FRAMES):
+            pixels = [((x * 37 + i // 3) % 256, x % 7, 0) for x in range(128)]
+            # Only one pixel changes in every third frame, and frames in between are repeated
+            pixels[5] = (i // 3, 255, 255)
+            encoder.write_frame(pixels)
+
+
+def test_scan_valid_files(tmp_path):
+    for slices, quality in [(1, Quality.LOSSLESS), (2, Quality.LOSSLESS), (1, Quality.LOW), (3, Quality.MEDIUM)]:
+        path = str(tmp_path / f"{slices}_{quality.name}.dum")
+        write_file(path, slices, quality)
+        result = scan_file(path)
+        assert result.problems == []
+        assert len(result.entries) == NUM_FRAMES
+        assert list(result.entries["frame_type"]).count(FrameType.REPEATED.value) == 8
+
+    report = format_report(result, num_largest=3, interval=1)
+    assert "REPEATED ratio: 0.667" in report
+    assert report.count(" frame ") == 3
+
+
+def test_scan_finds_problems(tmp_path):
+    path = str(tmp_path / "clip.dum")
+    write_file(path)
+    with open(path, "ab") as file:
+        file.write(b"junk")
+    assert scan_file(path).problems == [f"4 bytes after the last frame, at offset {scan_file(path).file_size - 4}"]
+
+    # The junk is taken for the start of a frame
+    with open(path, "r+b") as file:
+        write_num_frames(file, NUM_FRAMES + 1)
+    assert "frame header is cut off" in scan_file(path).problems[0]
+
+    write_file(path)
+    with open(path, "r+b") as file:
+        write_num_frames(file, NUM_FRAMES + 1)
+    assert scan_file(path).problems == ["The header says there are 13 frames, but the file ends after 12"]
+
+    with open(path, "r+b") as file:
+        file.truncate(int(scan_file(path).entries["offset"][0]) + 100)
+    assert scan_file(path).problems[0].endswith("bytes, but the file ends after 95")
+
+    # A frame that is smaller than its type implies
+    write_file(path)
+    first_frame = scan_file(path).entries[0]
+    assert first_frame["frame_type"] == FrameType.COLOR_MAPPED.value
+    frame_size = int(first_frame["frame_size"])
+    with open(path, "r+b") as file:
+        file.seek(int(first_frame["offset"]) + 1)
+        file.write((frame_size - 3).to_bytes(4, "big"))
+    problems = scan_file(path).problems
+    assert problems[0] == f"Frame 0 at offset 15: COLOR_MAPPED frame of {frame_size - 3} bytes, expected {frame_size}"
@@ -1,6 +1,10 @@
+import os
+import tracemalloc
 from io import BytesIO
 from time import time
 
+import numpy as np
+
 from format import write_frame, Quality, Decoder
 from header import DumInfo
 
@@ -25,3 +29,16 @@ def test_write_read_large_frame():
     start = time()
     decoder.read_frame()
     print(f"It took {round(time() - start, 2)}s to read frame")
+
+
+def test_write_frame_memory():
+    # Noise can't be color-mapped, and has the most codes when quantized
+    pixels = np.random.default_rng(0).integers(0, 256, (1920 * 1080, 3), dtype=np.uint8)
+    with open(os.devnull, "wb") as file:
+        for quality in Quality:
+            tracemalloc.start()
+            write_frame(file, pixels, quality)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            # About twice the size of the pixels at most, where the frame itself is 6 MB
+            assert peak < 16_000_000, f"{quality.name} used {peak} bytes"
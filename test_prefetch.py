@@ -0,0 +1,83 @@
+from io import BytesIO
+
+from format import Encoder, Decoder
+from header import read_header
+from prefetch import FramePrefetcher, PlaybackClock
+
+NUM_FRAMES = 20
+
+
+def create_decoder() -> Decoder:
+    io = BytesIO()
+    encoder = Encoder(io)
+    encoder.write_header(frame_rate=1, resolution=(4, 4), scaling=(1, 1), num_frames=NUM_FRAMES)
+    for i in range(NUM_FRAMES):
+        encoder.write_frame([(i, i, i)] * 16)
+    io.seek(0)
+    return Decoder(io, read_header(io))
+
+
+def test_prefetch_all_frames():
+    prefetcher = FramePrefetcher(create_decoder(), depth=4)
+    for i in range(NUM_FRAMES):
+        assert prefetcher.get() == (i, bytes([i]) * 48)
+    assert prefetcher.get() is None
+    assert prefetcher.get() is None
+    prefetcher.stop()
+
+
+def test_prefetch_after_seeking():
+    prefetcher = FramePrefetcher(create_decoder(), depth=4)
+    assert prefetcher.get()[0] == 0
+    assert prefetcher.seek(0.5) == 10
+    assert prefetcher.get() == (10, bytes([10]) * 48)
+    while prefetcher.get() is not None:
+        pass
+    prefetcher.seek_to_frame(3)
+    assert prefetcher.get() == (3, bytes([3]) * 48)
+    prefetcher.stop()
+
+
+def test_prefetch_in_loop():
+    prefetcher = FramePrefetcher(create_decoder(), depth=4, loop=True)
+    frame_indices = [prefetcher.get()[0] for _ in range(NUM_FRAMES + 2)]
+    assert frame_indices == list(range(NUM_FRAMES)) + [0, 1]
+    prefetcher.stop()
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_playback_clock():
+    time = FakeTime()
+    clock = PlaybackClock(frame_rate=10, time=time)
+    assert clock.due_position() == 0
+    time.now = 5
+    clock.start()
+    assert clock.due_position() == 1
+    time.now = 5.25
+    assert clock.due_position() == 3
+    assert round(clock.time_until_due(4), 6) == 0.15
+    clock.restart()
+    assert not clock.started
+
+
+def test_prefetch_drops_frames_when_behind():
+    time = FakeTime()
+    prefetcher = FramePrefetcher(create_decoder(), depth=4, clock=PlaybackClock(frame_rate=1, time=time))
+    assert prefetcher.get() == (0, bytes([0]) * 48)
+    # Playback has fallen 10 frames behind
+    time.now = 10
+    frame_index, _ = prefetcher.get()
+    assert frame_index == 10
+    assert prefetcher.dropped_frames == 9
+    assert prefetcher.late_frames == 0
+    time.now = 11.5
+    assert prefetcher.get()[0] == 11
+    assert prefetcher.late_frames == 1
+    prefetcher.stop()
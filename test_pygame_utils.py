@@ -0,0 +1,34 @@
+from random import randint
+
+import pygame
+from pygame import Surface
+
+from pygame_utils import get_surface_pixels, get_surface_rgb, bgr_frame_to_surface
+
+
+def random_surface(depth: int) -> Surface:
+    surface = Surface((8, 4), depth=depth)
+    for y in range(4):
+        for x in range(8):
+            surface.set_at((x, y), (randint(0, 255), randint(0, 255), randint(0, 255)))
+    return surface
+
+
+def test_get_surface_rgb():
+    for depth in [24, 32]:
+        surface = random_surface(depth)
+        expected = bytes(c for pixel in get_surface_pixels(surface) for c in pixel)
+        assert get_surface_rgb(surface) == expected
+
+
+def test_bgr_frame_to_surface():
+    surface = random_surface(24)
+    pixels = list(get_surface_pixels(surface))
+    frame = bytes(c for r, g, b in pixels for c in (b, g, r))
+    assert list(get_surface_pixels(bgr_frame_to_surface(frame, (8, 4)))) == pixels
+    # Surfaces with other pixel formats are also supported
+    for target in [Surface((8, 4), depth=32), Surface((8, 4), depth=24, masks=(0xFF, 0xFF00, 0xFF0000, 0))]:
+        assert bgr_frame_to_surface(frame, (8, 4), target) is target
+        assert list(get_surface_pixels(target)) == pixels
+        # Frames read from a mapped file are memoryviews
+        assert list(get_surface_pixels(bgr_frame_to_surface(memoryview(frame), (8, 4), target))) == pixels
@@ -0,0 +1,57 @@
+import json
+from io import BytesIO
+
+from format import Encoder, Decoder, Quality
+from header import read_header
+from stats import Stats, NULL_STATS
+
+
+def encode(stats: Stats) -> BytesIO:
+    io = BytesIO()
+    encoder = Encoder(io, Quality.LOW, stats=stats)
+    encoder.write_header(frame_rate=1, resolution=(32, 16), scaling=(1, 1), num_frames=3)
+    pixels = [(x * 8, y * 16, (x * y) % 256) for y in range(16) for x in range(32)]
+    encoder.write_frame(pixels)
+    encoder.write_frame(pixels)
+    encoder.write_frame([(0, 0, 0)] * 512)
+    io.seek(0)
+    return io
+
+
+def test_encoder_and_decoder_stats():
+    encoder_stats = Stats()
+    io = encode(encoder_stats)
+    assert encoder_stats.frames == {("encode", "QUANTIZED_TO_8_BIT"): 1, ("encode", "REPEATED"): 1,
+                                    ("encode", "COLOR_MAPPED"): 1}
+    assert sum(encoder_stats.bytes.values()) == len(io.getbuffer()) - 15
+    assert set(encoder_stats.phase_seconds) == {"palette", "quantize", "rle", "io"}
+    assert encoder_stats.frame_bytes["encode"].count == 3
+
+    decoder_stats = Stats()
+    decoder = Decoder(io, read_header(io), stats=decoder_stats)
+    for _ in range(3):
+        decoder.read_frame()
+    assert {frame_type: n for (_, frame_type), n in decoder_stats.frames.items()} == \
+           {frame_type: n for (_, frame_type), n in encoder_stats.frames.items()}
+    assert decoder_stats.bytes == {("decode", t): n for (_, t), n in encoder_stats.bytes.items()}
+    assert decoder_stats.phase_seconds["decode"].count == 3
+
+
+def test_export():
+    stats = Stats()
+    encode(stats)
+    exported = json.loads(json.dumps(stats.to_json()))
+    assert exported["frames"]["encode"]["REPEATED"] == 1
+    assert exported["frame_bytes"]["encode"]["count"] == 3
+    assert exported["frame_bytes"]["encode"]["buckets"][-1] == ["+Inf", 3]
+
+    text = stats.to_prometheus()
+    assert '# TYPE dum_frames_total counter' in text
+    assert 'dum_frames_total{direction="encode",frame_type="REPEATED"} 1' in text
+    assert 'dum_frame_bytes_bucket{direction="encode",le="+Inf"} 3' in text
+    assert 'dum_phase_seconds_count{phase="rle"} 1' in text
+
+
+def test_null_stats_records_nothing():
+    encode(NULL_STATS)
+    assert NULL_STATS.to_json()["frames"] == {}
@@ -0,0 +1,154 @@
+import threading
+from io import BytesIO, RawIOBase, BufferedReader
+
+import pytest
+
+from format import Encoder, Decoder
+from header import read_header, write_header
+from prefetch import FramePrefetcher
+
+W, H = 8, 4
+
+
+class Pipe(RawIOBase):
+    """A file that, like a pipe, can only be read from or written to in order."""
+
+    def __init__(self, data: bytes = b""):
+        self._buffer = BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        return self._buffer.readinto(b)
+
+    def write(self, b) -> int:
+        return self._buffer.write(b)
+
+    def getvalue(self) -> bytes:
+        return self._buffer.getvalue()
+
+
+def create_frames(n: int):
+    # Every other frame is repeated, and the moving pixel makes the rest differ
+    frames = []
+    for i in range(n):
+        pixels = [(i // 2 * 10, 0, 0)] * (W * H)
+        pixels[i // 2] = (255, 255, 255)
+        frames.append(pixels)
+    return frames
+
+
+def bgr(pixels) -> bytes:
+    return bytes(c for r, g, b in pixels for c in (b, g, r))
+
+
+def encode_to_pipe(frames) -> bytes:
+    pipe = Pipe()
+    with Encoder(pipe) as encoder:
+        encoder.write_header(10, (W, H), (1, 1))
+        for pixels in frames:
+            encoder.write_frame(pixels)
+    return pipe.getvalue()
+
+
+def test_write_and_read_pipe():
+    frames = create_frames(10)
+    pipe = BufferedReader(Pipe(encode_to_pipe(frames)))
+    info = read_header(pipe)
+    assert info.num_frames is None
+    assert info.file_size is None
+    decoder = Decoder(pipe, info)
+    assert list(decoder.frames()) == [bgr(pixels) for pixels in frames]
+    assert decoder.at_end
+    with pytest.raises(EOFError):
+        decoder.read_frame()
+
+
+def test_num_frames_is_written_on_close_if_seekable():
+    frames = create_frames(6)
+    io = BytesIO()
+    with Encoder(io) as encoder:
+        encoder.write_header(10, (W, H), (1, 1))
+        for pixels in frames:
+            encoder.write_frame(pixels)
+    io.seek(0)
+    assert read_header(io).num_frames == len(frames)
+
+    # Without seeking, the number of frames must be right from the start
+    with pytest.raises(Exception):
+        with Encoder(Pipe()) as encoder:
+            encoder.write_header(10, (W, H), (1, 1), num_frames=len(frames) + 1)
+            for pixels in frames:
+                encoder.write_frame(pixels)
+
+
+def test_frames_that_fail_are_not_counted():
+    frames = create_frames(2)
+    io = BytesIO()
+    with pytest.raises(ValueError):
+        with Encoder(io) as encoder:
+            encoder.write_header(10, (W, H), (1, 1))
+            encoder.write_frame(frames[0])
+            encoder.write_frame(frames[1][:-1])
+    assert encoder.frames_written == 1
+    encoder.close()
+    io.seek(0)
+    assert read_header(io).num_frames == 1
+
+    # The error isn't hidden by the header not matching the frames
+    with pytest.raises(ValueError):
+        with Encoder(Pipe()) as encoder:
+            encoder.write_header(10, (W, H), (1, 1), num_frames=2)
+            encoder.write_frame(frames[0])
+            encoder.write_frame(frames[1][:-1])
+
+
+def test_seek_in_file_with_unknown_num_frames():
+    frames = create_frames(10)
+    io = BytesIO(b"prefix" + encode_to_pipe(frames))
+    io.seek(len(b"prefix"))
+    decoder = Decoder(io, read_header(io))
+    assert decoder.num_frames == len(frames)
+    assert decoder.get_frame(7) == bgr(frames[7])
+    assert decoder.get_frame(2) == bgr(frames[2])
+
+
+def test_prefetch_from_pipe():
+    frames = create_frames(10)
+    pipe = BufferedReader(Pipe(encode_to_pipe(frames)))
+    prefetcher = FramePrefetcher(Decoder(pipe, read_header(pipe)), depth=4, loop=True)
+    for i, pixels in enumerate(frames):
+        assert prefetcher.get() == (i, bgr(pixels))
+    # A pipe can't be played again from the beginning
+    assert prefetcher.get() is None
+    prefetcher.stop()
+
+
+def test_prefetch_from_truncated_pipe():
+    frames = create_frames(3)
+    pipe = Pipe()
+    # Like a transcode that was interrupted
+    encoder = Encoder(pipe)
+    encoder.write_header(10, (W, H), (1, 1), num_frames=5)
+    for pixels in frames:
+        encoder.write_frame(pixels)
+    pipe = BufferedReader(Pipe(pipe.getvalue()))
+    prefetcher = FramePrefetcher(Decoder(pipe, read_header(pipe)), depth=4, loop=True)
+    results = []
+    reader = threading.Thread(target=lambda: results.extend(prefetcher.get() for _ in range(len(frames) + 1)),
+                              daemon=True)
+    reader.start()
+    reader.join(timeout=5)
+    prefetcher.stop()
+    assert results == [(i, bgr(pixels)) for i, pixels in enumerate(frames)] + [None]
+
+
+def test_write_header_with_unknown_num_frames():
+    io = BytesIO()
+    write_header(io, 10, (W, H), (1, 1), None)
+    io.seek(0)
+    assert read_header(io).num_frames is None
@@ -0,0 +1,35 @@
+from io import BytesIO
+
+from format import Encoder, Decoder
+from header import read_header
+from thumbnails import pick_frames, read_thumbnails, contact_sheet
+
+NUM_FRAMES = 20
+
+
+def create_decoder() -> Decoder:
+    io = BytesIO()
+    encoder = Encoder(io)
+    encoder.write_header(frame_rate=1, resolution=(8, 8), scaling=(1, 1), num_frames=NUM_FRAMES)
+    for i in range(NUM_FRAMES):
+        pixels = [(i, 0, 0)] * 64
+        # Only the top left tile changes, so most frames are DELTA frames
+        pixels[0] = (255, i, 0)
+        encoder.write_frame(pixels)
+    io.seek(0)
+    return Decoder(io, read_header(io))
+
+
+def test_pick_frames():
+    assert pick_frames(20, 4) == [0, 5, 10, 15]
+    assert pick_frames(3, 4) == [0, 1, 2]
+    assert pick_frames(0, 4) == []
+
+
+def test_read_thumbnails():
+    decoder = create_decoder()
+    frame_indices = pick_frames(NUM_FRAMES, 6)
+    thumbnails = read_thumbnails(decoder, frame_indices, 2)
+    assert thumbnails == [create_decoder().get_decimated_frame(i, 2) for i in frame_indices]
+    sheet = contact_sheet(thumbnails, (4, 4), columns=4)
+    assert sheet.get_size() == (4 * 8 + 4, 2 * 8 + 4)
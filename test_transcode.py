@@ -0,0 +1,73 @@
+import time
+from contextlib import closing
+
+import av
+import numpy as np
+import pytest
+
+from format import Decoder, Quality
+from header import read_header
+from transcode import transcode, read_ahead
+
+
+def create_video(path: str, num_frames: int):
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=10)
+        stream.width = 66
+        stream.height = 48
+        stream.pix_fmt = "yuv420p"
+        for i in range(num_frames):
+            image = np.full((48, 66, 3), i * 20, dtype=np.uint8)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def test_transcode(tmp_path):
+    source_path = str(tmp_path / "video.mp4")
+    create_video(source_path, 5)
+    target_path = str(tmp_path / "video.dum")
+
+    with open(target_path, "wb") as outfile:
+        assert transcode(source_path, outfile, quality=Quality.MEDIUM, max_frames=3) == 3
+
+    with open(target_path, "rb") as file:
+        info = read_header(file)
+        assert (info.width, info.height, info.frame_rate, info.num_frames) == (64, 48, 10, 3)
+        decoder = Decoder(file, info)
+        for _ in range(3):
+            assert len(decoder.read_frame()) == 64 * 48 * 3
+        assert file.tell() == info.file_size
+
+
+def test_transcode_fewer_frames_than_requested(tmp_path):
+    source_path = str(tmp_path / "video.mp4")
+    create_video(source_path, 5)
+    target_path = str(tmp_path / "video.dum")
+
+    with open(target_path, "wb") as outfile:
+        assert transcode(source_path, outfile, resolution=(32, 24), max_frames=100) == 5
+
+    with open(target_path, "rb") as file:
+        assert read_header(file).num_frames == 5
+
+
+def test_read_ahead_stops_producing_when_the_consumer_fails():
+    produced = []
+
+    def produce():
+        for i in range(100):
+            time.sleep(0.001)
+            produced.append(i)
+            yield i
+
+    with pytest.raises(RuntimeError):
+        with closing(read_ahead(produce(), depth=2)) as items:
+            for item in items:
+                if item == 3:
+                    raise RuntimeError("Failed to encode")
+    # The source isn't used any more once the generator is closed
+    num_produced = len(produced)
+    time.sleep(0.05)
+    assert len(produced) == num_produced < 100
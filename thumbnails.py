@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import argparse
+from typing import List, Tuple
+
+import pygame
+from pygame import Surface
+
+from codec.sampling import decimated_resolution
+from format import Decoder
+from frame_index import load_frame_index
+from header import read_header
+from mapped_file import MappedFile
+from pygame_utils import bgr_frame_to_surface
+
+DEBUG = False
+
+DEFAULT_COUNT = 16
+DEFAULT_COLUMNS = 4
+# Thumbnails are made at most this wide, unless a decimation factor is given
+DEFAULT_THUMBNAIL_WIDTH = 160
+# Pixels between the thumbnails of a contact sheet
+MARGIN = 4
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+def pick_frames(num_frames: int, count: int) -> List[int]:
+    """Returns up to count evenly spaced frame indices, starting with the first frame."""
+    count = min(count, num_frames)
+    return [i * num_frames // count for i in range(count)]
+
+
+def read_thumbnails(decoder: Decoder, frame_indices: List[int], factor: int) -> List[bytes]:
+    """Decodes the frames, in increasing order, at reduced resolution. Frames in between are skipped over without
+    being decoded, unless a wanted frame is decoded from them."""
+    wanted = set(frame_indices)
+    needed = set()
+    for frame_index in wanted:
+        needed.update(range(decoder.frame_index.key_frame(frame_index), frame_index + 1))
+    decoder.seek_to_beginning()
+    thumbnails = []
+    for frame_index in range(frame_indices[-1] + 1 if frame_indices else 0):
+        if frame_index not in needed:
+            decoder.skip_frame()
+            continue
+        frame = decoder.read_decimated_frame(factor)
+        if frame_index in wanted:
+            debug(f"Read thumbnail of frame {frame_index}")
+            thumbnails.append(frame)
+    return thumbnails
+
+
+def contact_sheet(thumbnails: List[bytes], resolution: Tuple[int, int], columns: int) -> Surface:
+    """Lays out the thumbnails, of the given resolution, in a grid."""
+    rows = -(-len(thumbnails) // columns)
+    width, height = resolution
+    sheet = Surface((columns * (width + MARGIN) + MARGIN, rows * (height + MARGIN) + MARGIN))
+    sheet.fill((0, 0, 0))
+    thumbnail_surface = None
+    for i, thumbnail in enumerate(thumbnails):
+        thumbnail_surface = bgr_frame_to_surface(thumbnail, resolution, thumbnail_surface)
+        row, column = divmod(i, columns)
+        sheet.blit(thumbnail_surface, (MARGIN + column * (width + MARGIN), MARGIN + row * (height + MARGIN)))
+    return sheet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a contact sheet with thumbnails of evenly spaced frames")
+    parser.add_argument("file", help="the DUM file")
+    parser.add_argument("output", help="the image to write, such as sheet.png")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="how many thumbnails to make")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS)
+    parser.add_argument("--factor", type=int,
+                        help="keep every n-th pixel of every n-th row (default: make thumbnails at most "
+                             f"{DEFAULT_THUMBNAIL_WIDTH} pixels wide)")
+    args = parser.parse_args()
+
+    with MappedFile(args.file) as file:
+        info = read_header(file)
+        decoder = Decoder(file, info, load_frame_index(args.file, file, info))
+        factor = args.factor or max(1, -(-info.width // DEFAULT_THUMBNAIL_WIDTH))
+        frame_indices = pick_frames(decoder.num_frames, args.count)
+        thumbnails = read_thumbnails(decoder, frame_indices, factor)
+    sheet = contact_sheet(thumbnails, decimated_resolution((info.width, info.height), factor), args.columns)
+    pygame.image.save(sheet, args.output)
+    print(f"Wrote {len(thumbnails)} thumbnails of {args.file} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, nullcontext
+from queue import Queue
+from typing import BinaryIO, Iterator, Optional, Tuple, TypeVar
+
+import av
+import numpy as np
+
+from format import Encoder, Quality
+from parallel_encoder import ParallelEncoder
+from stats import Stats, NULL_STATS
+
+DEBUG = False
+
+# How many decoded frames may wait for the encoder
+READ_AHEAD = 4
+
+T = TypeVar("T")
+
+
+def debug(text: str):
+    if DEBUG:
+        print(text)
+
+
+def decode_video(container: av.container.InputContainer, max_frames: Optional[int] = None) \
+        -> Iterator[av.VideoFrame]:
+    for i, frame in enumerate(container.decode(video=0)):
+        if max_frames is not None and i == max_frames:
+            return
+        debug(f"Decoded {frame}")
+        yield frame
+
+
+def to_rgb(frames: Iterator[av.VideoFrame], resolution: Tuple[int, int]) -> Iterator[np.ndarray]:
+    """Resizes the frames and converts them to (H, W, 3) arrays of packed RGB values."""
+    for frame in frames:
+        yield frame.reformat(resolution[0], resolution[1], format="rgb24").to_ndarray()
+
+
+def read_ahead(iterator: Iterator[T], depth: int = READ_AHEAD) -> Iterator[T]:
+    """Consumes the iterator on a background thread, so that producing and consuming items overlap."""
+    queue: Queue = Queue(maxsize=depth)
+    done = object()
+    stopped = False
+
+    def produce():
+        error = None
+        try:
+            for item in iterator:
+                if stopped:
+                    break
+                queue.put((item, None))
+        except Exception as e:
+            error = e
+        queue.put((done, error))
+
+    thread = threading.Thread(target=produce, name="read_ahead", daemon=True)
+    thread.start()
+    finished = False
+    try:
+        while True:
+            item, error = queue.get()
+            if item is done:
+                finished = True
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped = True
+        # The producer may be using the iterator, whose source the caller may close as soon as this returns. So
+        # the queue is drained, to unblock the producer, until it's done.
+        while not finished:
+            finished = queue.get()[0] is done
+        thread.join()
+
+
+def default_resolution(container: av.container.InputContainer) -> Tuple[int, int]:
+    # The DUM format requires dimensions that are multiples of 4
+    context = container.streams.video[0].codec_context
+    return context.width - context.width % 4, context.height - context.height % 4
+
+
+def transcode(source_path: str, outfile: BinaryIO, resolution: Optional[Tuple[int, int]] = None,
+    scaling: Tuple[int, int] = (1, 1), quality: Quality = Quality.LOSSLESS, frame_rate: Optional[int] = None,
+    max_frames: Optional[int] = None, workers: int = 0, stats: Stats = NULL_STATS, optimize_size: bool = False,
+    target_bitrate: Optional[int] = None, slices: int = 1) -> int:
+    """Transcodes a video that PyAV can decode into a DUM file, one frame at a time. Returns the number of frames.
+
+    With workers > 0, frames are encoded on that many processes (see ParallelEncoder), and no stats are recorded.
+    A target bitrate can't be combined with workers, as the quality of each frame depends on the frames before it.
+    Without workers, frames can instead be split into slices that are encoded on a process each."""
+    if workers and target_bitrate is not None:
+        raise ValueError("A target bitrate can't be used with workers")
+    with av.open(source_path) as container:
+        stream = container.streams.video[0]
+        if resolution is None:
+            resolution = default_resolution(container)
+        if frame_rate is None:
+            frame_rate = round(stream.average_rate or 25)
+        # If the number of frames isn't known, the encoder finds out as it goes
+        num_frames = stream.frames or None
+        if max_frames is not None:
+            num_frames = min(num_frames, max_frames) if num_frames else max_frames
+
+        slice_executor = ProcessPoolExecutor() if slices > 1 and not workers else None
+        if workers:
+            encoder = ParallelEncoder(outfile, quality, max_workers=workers, optimize_size=optimize_size)
+        else:
+            encoder = Encoder(outfile, quality, stats=stats, optimize_size=optimize_size,
+                              target_bitrate=target_bitrate, slices=slices, executor=slice_executor)
+        encoder.write_header(frame_rate, resolution, scaling, num_frames)
+        try:
+            # Closed before the container is, also if encoding fails
+            with encoder, closing(read_ahead(to_rgb(decode_video(container, num_frames), resolution))) as frames:
+                for pixels in frames:
+                    encoder.write_frame(pixels)
+        finally:
+            if slice_executor is not None:
+                slice_executor.shutdown()
+
+    if encoder.frames_written != num_frames:
+        debug(f"Expected {num_frames} frames but got {encoder.frames_written}")
+    return encoder.frames_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode a video file to DUM")
+    parser.add_argument("source", help="any video file that PyAV can decode")
+    parser.add_argument("target", help="the DUM file to write, or - to write to stdout")
+    parser.add_argument("--width", type=int, help="defaults to the width of the source")
+    parser.add_argument("--height", type=int, help="defaults to the height of the source")
+    parser.add_argument("--scale", type=int, default=1, help="how much the player should scale the video up")
+    parser.add_argument("--quality", choices=[q.name for q in Quality], default=Quality.LOSSLESS.name)
+    parser.add_argument("--frame-rate", type=int, help="defaults to the frame rate of the source")
+    parser.add_argument("--frames", type=int, help="the maximum number of frames to transcode")
+    parser.add_argument("--workers", type=int, default=0, help="encode frames on this many processes")
+    parser.add_argument("--stats", metavar="FILE", help="write per-frame stats as JSON to this file")
+    parser.add_argument("--optimize-size", action="store_true",
+                        help="use whichever frame type the quality allows that makes each frame the smallest")
+    parser.add_argument("--slices", type=int, default=1,
+                        help="split frames into this many slices that are encoded and decoded in parallel")
+    parser.add_argument("--bitrate", type=int, metavar="KBIT_PER_S",
+                        help="choose the quality of each frame, up to --quality, to stay within this bitrate")
+    args = parser.parse_args()
+    if args.bitrate and args.workers:
+        parser.error("--bitrate can't be used with --workers")
+    if args.slices > 1 and args.workers:
+        parser.error("--slices can't be used with --workers")
+
+    resolution = None
+    if args.width or args.height:
+        if not (args.width and args.height):
+            parser.error("--width and --height must be used together")
+        resolution = (args.width, args.height)
+    stats = Stats() if args.stats else NULL_STATS
+    with (open(args.target, "wb") if args.target != "-" else nullcontext(sys.stdout.buffer)) as outfile:
+        num_frames = transcode(args.source, outfile, resolution, (args.scale, args.scale), Quality[args.quality],
+                               args.frame_rate, args.frames, args.workers, stats, args.optimize_size,
+                               args.bitrate * 1000 if args.bitrate else None, args.slices)
+    # With the DUM file written to stdout, anything else goes to stderr
+    print(f"Wrote {num_frames} frames to {args.target}", file=sys.stderr if args.target == "-" else sys.stdout)
+    if args.stats:
+        with open(args.stats, "w") as file:
+            json.dump(stats.to_json(), file, indent=2)
+
+
+if __name__ == '__main__':
+    main()